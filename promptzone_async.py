@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from pathlib import Path
+import asyncio
+import sys
+
+from promptzone_core import Batch, PromptZoneCore
+
+DEFAULT_WORKERS = 4
+STREAM_CHUNK = 8
+# Set count for n=None streams; the consumer stops first.
+STREAM_UNBOUNDED = sys.maxsize
+
+
+def _take(iterator, k: int) -> list:
+    return list(islice(iterator, k))
+
+
+class AsyncPromptZone:
+    # asyncio facade over one PromptZoneCore. Blocking work (scans, file reads, output
+    # writes) runs on a private thread pool, so the event loop never blocks. Every
+    # request shares the core's index, plan caches and repeat state, and requests run in
+    # parallel on the pool.
+    def __init__(self, core: PromptZoneCore, executor: ThreadPoolExecutor | None = None, max_workers: int = DEFAULT_WORKERS):
+        self.core = core
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers, thread_name_prefix="promptzone-async")
+
+    @classmethod
+    async def open(cls, root_dir: Path, max_workers: int = DEFAULT_WORKERS, **core_kwargs) -> AsyncPromptZone:
+        # Core construction and the library scan both run off the event loop.
+        executor = ThreadPoolExecutor(max_workers, thread_name_prefix="promptzone-async")
+        loop = asyncio.get_running_loop()
+        core = await loop.run_in_executor(executor, partial(PromptZoneCore, Path(root_dir), **core_kwargs))
+        pz = cls(core, executor)
+        pz._own_executor = True
+        await pz.ready()
+        return pz
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    def _slots(self, slots: list[str] | None) -> list[dict]:
+        all_slots = self.core.get_slots()
+        if not slots:
+            return all_slots
+        known = {s["id"] for s in all_slots}
+        missing = [sid for sid in slots if sid not in known]
+        if missing:
+            raise ValueError(f"Unknown slot: {missing[0]}")
+        return [s for s in all_slots if s["id"] in slots]
+
+    async def ready(self):
+        await asyncio.wrap_future(self.core.ready)
+        return self
+
+    async def generate(
+        self,
+        slots: list[str] | None = None,
+        n: int | None = None,
+        slot_texts: dict[str, str | list[str]] | None = None,
+        skip_minimized: bool = False,
+        write_output: bool = False,
+    ) -> Batch:
+        # Same result as PromptZoneCore.generate_batch: per-slot set lists, sources and composed sets.
+        return await self._run(self._generate, self._slots(slots), n, slot_texts or {}, skip_minimized, write_output)
+
+    def _generate(self, slots: list[dict], n, slot_texts: dict, skip_minimized: bool, write_output: bool) -> Batch:
+        # Executor side: building the config can load a tokenizer.
+        config = self.core.generation_config(slots, skip_minimized, n)
+        return self.core.generate_batch(config, slot_texts, write_output)
+
+    async def generate_slot(self, slot_id: str, n: int | None = None, current_text: str = "") -> tuple[list[str], list[str]]:
+        return await self._run(self.core.generate_slot, slot_id, n, current_text)
+
+    async def stream(
+        self,
+        n: int | None = None,
+        slots: list[str] | None = None,
+        slot_texts: dict[str, str | list[str]] | None = None,
+        chunk: int = STREAM_CHUNK,
+        skip_minimized: bool = False,
+    ):
+        # Yields (slot_texts, slot_sources, composed_set) as sets are drawn. The stream is one
+        # lazily drawn batch (one config, seed and per-batch state); each executor round trip
+        # pulls `chunk` sets from the same core.iter_sets generator. n=None streams until the
+        # consumer stops.
+        if n is not None and n < 1:
+            return
+        selected = self._slots(slots)
+        config = await self._run(self.core.generation_config, selected, skip_minimized, STREAM_UNBOUNDED if n is None else n)
+        sets = self.core.iter_sets(config, slot_texts or {})
+        size = max(1, chunk)
+        try:
+            while True:
+                rows = await self._run(_take, sets, size)
+                for row in rows:
+                    yield row
+                if len(rows) < size:
+                    return
+        finally:
+            # Runs the generator's cleanup (never-repeat flush) off the event loop. A chunk
+            # still running after a cancel makes close() fail; the generator then closes
+            # when it is collected.
+            try:
+                await self._run(sets.close)
+            except ValueError:
+                pass
+
+    async def search(self, query: str, prefix: str | list[str] | None = None, limit: int | None = None) -> list[tuple]:
+        # (label, path, text) across the given prefixes, or every slot prefix.
+        return await self._run(self._search, query, prefix, limit)
+
+    def _search(self, query: str, prefix, limit: int | None) -> list[tuple]:
+        if prefix is None:
+            prefixes = [s["prefix"] for s in self.core.get_slots() if s.get("prefix")]
+        else:
+            prefixes = [prefix] if isinstance(prefix, str) else list(prefix)
+        out = []
+        for p in prefixes:
+            out.extend(self.core.browse_entries("", query, p))
+            if limit is not None and len(out) >= limit:
+                return out[:limit]
+        return out
+
+    async def browse(self, prefix: str) -> list[Path]:
+        return await self._run(self.core.folders_by_prefix, prefix)
+
+    async def reload(self):
+        await self._run(self.core.reload_library)
+
+    async def close(self):
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
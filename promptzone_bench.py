@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import json
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from promptzone_core import PromptZoneCore, save_json
+
+WORDS = (
+    "soft light portrait studio cinematic wide shot close up dramatic shadow neon rain street "
+    "forest morning golden hour dress jacket boots hat smile walking running sitting standing "
+    "window mirror reflection grain film color muted vivid pastel high contrast bokeh depth"
+).split()
+TAG_POOL = [f"tag{i:02d}" for i in range(40)]
+BENCH_PREFIXES = ("ACTIONSTYLE_", "CLOTHES_", "COMPOSITION_", "I2V_")
+
+
+def make_library(
+    root: Path,
+    folders: int = 40,
+    files_per_folder: int = 25,
+    file_size: int = 400,
+    tag_density: float = 0.2,
+    media_ratio: float = 0.1,
+    prefixes: tuple[str, ...] = BENCH_PREFIXES,
+    seed: int = 0,
+) -> Path:
+    # Folders are spread over the prefixes; tag_density is the fraction of TAG_POOL
+    # assigned to each folder, media_ratio the fraction of prompts with a .png sidecar.
+    rng = random.Random(seed)
+    root = Path(root)
+    lib = root / "Prompt_Library"
+    lib.mkdir(parents=True, exist_ok=True)
+    tags_map = {}
+    for i in range(folders):
+        prefix = prefixes[i % len(prefixes)]
+        name = f"{prefix}BENCH_{i:04d}"
+        folder = lib / name
+        folder.mkdir(exist_ok=True)
+        for j in range(files_per_folder):
+            words = []
+            size = 0
+            while size < file_size:
+                w = rng.choice(WORDS)
+                words.append(w)
+                size += len(w) + 1
+            stem = f"prompt_{j + 1:03d}"
+            (folder / f"{stem}.md").write_text(" ".join(words) + "\n", encoding="utf-8")
+            if rng.random() < media_ratio:
+                (folder / f"{stem}.png").write_bytes(b"\x89PNG\r\n\x1a\n")
+        k = int(round(tag_density * len(TAG_POOL)))
+        tags_map[name] = sorted(rng.sample(TAG_POOL, k)) if k else []
+    save_json(root / "tags.json", tags_map)
+    slots = [
+        {"id": p.rstrip("_").lower(), "label": p.rstrip("_"), "prefix": p, "enabled": True, "minimized": False}
+        for p in prefixes
+    ]
+    save_json(root / "settings.json", {"slots": slots, "n_sets": 1})
+    return root
+
+
+def _time(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return {
+        "repeat": repeat,
+        "min_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "max_ms": round(max(samples), 3),
+    }
+
+
+def _git_revision() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+        return out.stdout.strip()
+    except Exception:
+        return ""
+
+
+def run_benchmarks(root: Path, repeat: int = 5, sets: tuple[int, ...] = (1, 10, 50)) -> dict:
+    results = {}
+
+    def cold_start():
+        core = PromptZoneCore(root, background=False)
+        core.counts()
+
+    results["core_init_sync"] = _time(cold_start, repeat)
+
+    core = PromptZoneCore(root, background=False)
+    results["reload_library"] = _time(lambda: (core.reload_library(), core.counts()), repeat)
+    core.counts()
+
+    prefix = core.get_slots()[0]["prefix"]
+    results["browse_entries/all"] = _time(lambda: core.browse_entries("", "", prefix), repeat)
+    results["browse_entries/query"] = _time(lambda: core.browse_entries("", "golden hour", prefix), repeat)
+    results["browse_entries/miss"] = _time(lambda: core.browse_entries("", "zzzz-no-match", prefix), repeat)
+    results["exclude_search_cache"] = _time(core.exclude_search_cache, repeat)
+
+    slots = core.get_slots()
+    slot_settings = core.settings.setdefault("slot_settings", {})
+    scenarios = [
+        ("random", {"avoid_repeats": False, "only_one_per_folder": False, "excluded_tags": [], "tag_pref": ["All"]}),
+        ("avoid_repeats", {"avoid_repeats": True, "only_one_per_folder": False, "excluded_tags": []}),
+        ("one_per_folder", {"avoid_repeats": True, "only_one_per_folder": True, "excluded_tags": []}),
+        ("excluded_tags", {"avoid_repeats": False, "only_one_per_folder": False, "excluded_tags": TAG_POOL[:3]}),
+        ("preferred_tags", {"avoid_repeats": False, "only_one_per_folder": False, "tag_pref": TAG_POOL[3:6]}),
+    ]
+    for n in sets:
+        core.settings["n_sets"] = n
+        for name, opts in scenarios:
+            core.settings.update(opts)
+            for slot in slots:
+                slot_settings[slot["id"]] = {"category": ["Any"], "excluded": []}
+            results[f"generate_slots/{name}/n={n}"] = _time(lambda: core.generate_slots(slots, {}), repeat)
+
+        core.settings.update(scenarios[0][1])
+        for slot in slots:
+            folders = core.folders_by_prefix(slot["prefix"])
+            slot_settings[slot["id"]] = {"category": [p.name for p in folders[: max(1, len(folders) // 2)]], "excluded": []}
+        results[f"generate_slots/list_mode/n={n}"] = _time(lambda: core.generate_slots(slots, {}), repeat)
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark PromptZone core hot paths on a synthetic library.")
+    ap.add_argument("--folders", type=int, default=40)
+    ap.add_argument("--files-per-folder", type=int, default=25)
+    ap.add_argument("--file-size", type=int, default=400, help="approximate bytes per prompt file")
+    ap.add_argument("--tag-density", type=float, default=0.2, help="fraction of the tag pool per folder")
+    ap.add_argument("--media-ratio", type=float, default=0.1, help="fraction of prompts with a media sidecar")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--sets", default="1,10,50", help="comma-separated n_sets values")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--root", help="reuse or create the library here instead of a temp dir")
+    ap.add_argument("--output", "-o", help="write JSON results to this file (default: stdout)")
+    args = ap.parse_args(argv)
+
+    params = {
+        "folders": args.folders,
+        "files_per_folder": args.files_per_folder,
+        "file_size": args.file_size,
+        "tag_density": args.tag_density,
+        "media_ratio": args.media_ratio,
+        "seed": args.seed,
+    }
+    tmp = None
+    if args.root:
+        root = Path(args.root)
+        if not (root / "Prompt_Library").exists():
+            make_library(root, **params)
+    else:
+        tmp = tempfile.mkdtemp(prefix="promptzone_bench_")
+        root = make_library(Path(tmp), **params)
+    try:
+        sets = tuple(int(x) for x in args.sets.split(",") if x.strip())
+        results = run_benchmarks(root, repeat=args.repeat, sets=sets)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    report = {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        sys.stdout.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import json
+import sys
+
+from promptzone_core import PromptZoneCore
+
+
+def app_root() -> Path:
+    if getattr(sys, "frozen", False):
+        return Path(sys.executable).resolve().parent
+    return Path(__file__).resolve().parent
+
+
+def _open_core(args) -> PromptZoneCore:
+    root = Path(args.root) if args.root else app_root()
+    return PromptZoneCore(root, background=False, pack=Path(args.pack) if args.pack else None)
+
+
+def cmd_dedupe(args) -> int:
+    from promptzone_dedupe import find_near_duplicates, save_exclusions
+
+    core = _open_core(args)
+    if args.clear:
+        core.settings["exclude_near_duplicates"] = False
+        core.save_settings()
+        print("Near-duplicate exclusion disabled.")
+        return 0
+    prefixes = [p.strip() for p in (args.prefix or []) if p.strip()]
+    report = find_near_duplicates(core, args.threshold, args.num_perm, args.bands, prefixes or None)
+    if args.exclude:
+        report["hidden"] = len(save_exclusions(core, report))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"{report['files']} prompts ({report['hashed']} newly hashed), threshold {report['threshold']}")
+    print(f"{len(report['clusters'])} near-duplicate clusters, {report['duplicates']} redundant prompts")
+    for prefix, count in sorted(report["clusters_by_prefix"].items()):
+        print(f"  {prefix}: {count} clusters")
+    for cluster in report["clusters"][: args.limit]:
+        print("")
+        for label in cluster:
+            print(f"  {label}")
+    if args.exclude:
+        print(f"\n{report['hidden']} prompts hidden from sampling (keeps one per cluster).")
+    return 0
+
+
+def cmd_import(args) -> int:
+    from promptzone_import import iter_records
+
+    core = _open_core(args)
+    total = {"imported": 0, "folders": {}, "skipped": []}
+    for path in args.files:
+        result = core.bulk_import(iter_records(path, args.format, args.category or ""), args.kind, args.batch_size)
+        total["imported"] += result["imported"]
+        for name, count in result["folders"].items():
+            total["folders"][name] = total["folders"].get(name, 0) + count
+        total["skipped"].extend(f"{path}: {msg}" for msg in result["skipped"])
+    if args.json:
+        print(json.dumps(total, indent=2))
+        return 0
+    print(f"Imported {total['imported']} prompts into {len(total['folders'])} folders.")
+    for name, count in sorted(total["folders"].items()):
+        print(f"  {name}: {count}")
+    if total["skipped"]:
+        print(f"Skipped {len(total['skipped'])}:")
+        for msg in total["skipped"][:20]:
+            print(f"  {msg}")
+    return 0
+
+
+def cmd_pack(args) -> int:
+    from promptzone_pack import export_pack
+
+    core = _open_core(args)
+    result = export_pack(core, Path(args.output))
+    print(f"Packed {result['files']} prompts in {result['folders']} folders into {result['path']}.")
+    return 0
+
+
+def cmd_serve(args) -> int:
+    from promptzone_server import serve
+
+    core = _open_core(args)
+    if args.core_stats:
+        core.stats.enabled = True
+
+    def on_listen(server):
+        where = args.socket if args.socket else "http://%s:%d" % server.server_address[:2]
+        print(f"PromptZone serving {core.library_dir} on {where} (Ctrl+C to stop)", file=sys.stderr, flush=True)
+
+    serve(core, args.host, args.port, Path(args.socket) if args.socket else None, args.verbose, on_listen)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="promptzone", description="PromptZone library tools.")
+    ap.add_argument("--root", help="folder holding settings.json and Prompt_Library (default: app folder)")
+    ap.add_argument("--pack", help="use this .pzpack as a read-only library instead of Prompt_Library")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("dedupe", help="find near-duplicate prompts with MinHash/LSH")
+    p.add_argument("--threshold", type=float, default=0.7, help="estimated Jaccard similarity (word 3-grams)")
+    p.add_argument("--num-perm", type=int, default=128)
+    p.add_argument("--bands", type=int, default=32)
+    p.add_argument("--prefix", action="append", help="only scan folders with this prefix (repeatable)")
+    p.add_argument("--limit", type=int, default=20, help="clusters to print")
+    p.add_argument("--json", action="store_true", help="print the full report as JSON")
+    p.add_argument("--exclude", action="store_true", help="hide all but one prompt per cluster from sampling")
+    p.add_argument("--clear", action="store_true", help="stop excluding near-duplicates")
+    p.set_defaults(func=cmd_dedupe)
+
+    p = sub.add_parser("import", help="bulk import prompts from JSONL, CSV or divider-separated markdown")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--format", choices=["jsonl", "csv", "md"], help="default: from the file extension")
+    p.add_argument("--kind", help="slot id/label/prefix; categories get this prefix and are created as needed")
+    p.add_argument("--category", help="category for records that do not name one")
+    p.add_argument("--batch-size", type=int, default=500)
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("pack", help="export the library (texts, tags, weights) to a single .pzpack file")
+    p.add_argument("output")
+    p.set_defaults(func=cmd_pack)
+
+    p = sub.add_parser("serve", help="keep the library warm and answer JSON requests over localhost HTTP")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765, help="0 picks a free port")
+    p.add_argument("--socket", help="listen on this Unix domain socket instead of TCP")
+    p.add_argument("--core-stats", action="store_true", help="include core counters in /metrics")
+    p.add_argument("--verbose", action="store_true", help="log every request to stderr")
+    p.set_defaults(func=cmd_serve)
+    return ap
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
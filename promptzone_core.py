@@ -10,14 +10,36 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass, field, fields, is_dataclass, replace
+from functools import partial
 from pathlib import Path
+import bisect
+import hashlib
 import json
+import math
 import random
 import re
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+
+from promptzone_history import HistoryStore
+from promptzone_session import SESSION_DIR, SessionStore
+from promptzone_template import compile_template, expand
+from promptzone_tokens import DEFAULT_TOKENIZER, Tokenizer, load_tokenizer
 
 DIVIDER = "\n\n" + ("-" * 48) + "\n\n"
 
+# Optional: weighted pools at least this large use NumPy when it is installed.
+np = None
+_numpy_loaded = False
+NUMPY_MIN_POOL = 2048
+NUMPY_DRAW_BATCH = 64
+
 ACTION_PREFIX = "ACTIONSTYLE_"
 CLOTHES_PREFIX = "CLOTHES_"
 COMPOSITION_PREFIX = "COMPOSITION_"
@@ -26,6 +48,17 @@ I2V_PREFIX = "I2V_"
 TAGS_FILE = "tags.json"
 WEIGHTS_FILE = "weights.json"
 SETTINGS_FILE = "settings.json"
+EMITTED_SETS_FILE = "emitted_sets.bloom"
+HISTORY_FILE = "history.jsonl"
+HISTORY_KEEP = 1000
+NEAR_DUPLICATES_FILE = "near_duplicates.json"
+PACK_FORMAT = 1
+PACK_MMAP_SIZE = 1 << 30
+# ASCII whitespace as str.strip() sees it; packs use it to spot blank prompts in SQL.
+_BLANK_CHARS = " \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"
+DUPLICATE_MAX_TRIES = 20
+MAX_SETS = 10000
+BUDGET_MAX_TRIES = 20
 PROMPT_TEXT_EXTENSIONS = (".md", ".txt")
 
 DEFAULT_SLOTS = [
@@ -33,6 +66,19 @@ DEFAULT_SLOTS = [
 ]
 
 
+def load_numpy():
+    global np, _numpy_loaded
+    if not _numpy_loaded:
+        _numpy_loaded = True
+        try:
+            import numpy as _np
+
+            np = _np
+        except Exception:
+            np = None
+    return np
+
+
 def read_text(p: Path) -> str:
     return p.read_text(encoding="utf-8", errors="ignore")
 
@@ -78,16 +124,22 @@ def infer_tags_from_name(folder_name: str) -> list[str]:
     return sorted(tags)
 
 
-def next_prompt_filename(folder: Path, ext: str = ".md") -> str:
-    ext = str(ext or ".md").lower().strip()
-    if ext not in PROMPT_TEXT_EXTENSIONS:
-        ext = ".md"
+def _max_prompt_number(names) -> int:
     nums = []
-    for f in _prompt_text_files(folder):
-        m = re.match(r"prompt_(\d+)\.(?:md|txt)$", f.name, flags=re.IGNORECASE)
+    for name in names:
+        m = re.match(r"prompt_(\d+)\.(?:md|txt)$", name, flags=re.IGNORECASE)
         if m:
             nums.append(int(m.group(1)))
-    n = (max(nums) + 1) if nums else 1
+    return max(nums) if nums else 0
+
+
+def next_prompt_filename(folder: Path | list[str], ext: str = ".md") -> str:
+    # `folder` is a directory or the prompt file names already in it.
+    ext = str(ext or ".md").lower().strip()
+    if ext not in PROMPT_TEXT_EXTENSIONS:
+        ext = ".md"
+    names = [f.name for f in _prompt_text_files(folder)] if isinstance(folder, Path) else folder
+    n = _max_prompt_number(names) + 1
     return f"prompt_{n:02d}{ext}"
 
 
@@ -108,7 +160,13 @@ def save_json(path: Path, obj):
         pass
 
 
-def _split_sets(text: str, n: int) -> list[str]:
+def join_sets(arr: list[str]) -> str:
+    if len(arr) <= 1:
+        return arr[0] if arr else ""
+    return DIVIDER.join([a.strip() for a in arr])
+
+
+def split_sets(text: str, n: int) -> list[str]:
     t = (text or "").strip()
     if not t:
         return [""] * n
@@ -130,12 +188,964 @@ def _prompt_text_files(folder: Path) -> list[Path]:
     return files
 
 
-def _nonempty_prompt_files(folder: Path) -> list[Path]:
-    files = []
-    for f in _prompt_text_files(folder):
-        if read_text(f).strip():
+STAT_COUNTERS = ("dir_listings", "stat_calls", "file_reads", "bytes_read", "cache_hits", "cache_misses")
+
+
+class _NullCall:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def phase(self, name: str):
+        pass
+
+
+_NULL_CALL = _NullCall()
+
+
+class _StatsCall:
+    def __init__(self, stats: CoreStats, name: str):
+        self.stats = stats
+        self.name = name
+        self.phases: dict[str, float] = {}
+        self.counters = {k: 0 for k in STAT_COUNTERS}
+
+    def __enter__(self):
+        # The list of the entering thread; a generator's call may be closed from another.
+        self._calls = self.stats._open_calls()
+        self._calls.append(self.counters)
+        self._t0 = self._mark = time.perf_counter()
+        return self
+
+    def phase(self, name: str):
+        # Time since the previous phase mark (or call start) is booked under `name`.
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + (now - self._mark) * 1000.0
+        self._mark = now
+
+    def __exit__(self, *exc):
+        ms = (time.perf_counter() - self._t0) * 1000.0
+        # By identity: a generator's call can close out of order.
+        calls = self._calls
+        for i, counters in enumerate(calls):
+            if counters is self.counters:
+                del calls[i]
+                break
+        self.stats._record(self.name, ms, {k: round(v, 3) for k, v in self.phases.items()}, self.counters)
+        return False
+
+
+class CoreStats:
+    # Off by default: call sites check `enabled` before counting, and call() hands
+    # back a shared no-op object, so the disabled cost is one attribute lookup.
+    # A call's counters only see work done on its own thread, so background scans and
+    # concurrent calls are not booked to it.
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {k: 0 for k in STAT_COUNTERS}
+            self.last: dict[str, dict] = {}
+            self.totals: dict[str, dict] = {}
+
+    def _open_calls(self) -> list[dict]:
+        calls = getattr(self._local, "calls", None)
+        if calls is None:
+            calls = self._local.calls = []
+        return calls
+
+    def add(self, key: str, n: int = 1):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+        for counters in self._open_calls():
+            counters[key] = counters.get(key, 0) + n
+
+    def call(self, name: str):
+        return _StatsCall(self, name) if self.enabled else _NULL_CALL
+
+    def _record(self, name: str, ms: float, phases: dict, counters: dict):
+        with self._lock:
+            self.last[name] = {"ms": round(ms, 3), "phases": phases, "counters": counters}
+            total = self.totals.setdefault(name, {"calls": 0, "ms": 0.0})
+            total["calls"] += 1
+            total["ms"] = round(total["ms"] + ms, 3)
+
+    def last_call(self, name: str) -> dict | None:
+        return self.last.get(name)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "counters": dict(self.counters),
+                "last": {k: dict(v) for k, v in self.last.items()},
+                "totals": {k: dict(v) for k, v in self.totals.items()},
+            }
+
+    def to_json(self, indent: int | None = 2) -> str:
+        return json.dumps(self.snapshot(), indent=indent)
+
+
+class BloomFilter:
+    # Fixed-size Bloom filter persisted as a small header plus the bit array. Only the
+    # bytes touched since the last flush are rewritten, so add()/flush() stay O(k).
+    # When `capacity` items have been added the filter starts over (oldest history drops).
+    _HEADER = struct.Struct("<4sIQQd")
+    _MAGIC = b"PZBF"
+
+    def __init__(self, path: Path, capacity: int = 1_000_000, fp_rate: float = 0.001):
+        self.path = Path(path)
+        self.capacity = max(1, int(capacity))
+        self.fp_rate = min(0.5, max(1e-9, float(fp_rate)))
+        self.m = max(64, int(math.ceil(-self.capacity * math.log(self.fp_rate) / (math.log(2) ** 2))))
+        self.k = max(1, int(round(self.m / self.capacity * math.log(2))))
+        self.count = 0
+        self._bits = bytearray((self.m + 7) // 8)
+        self._dirty: set[int] = set()
+        self._full_write = True
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        try:
+            with self.path.open("rb") as f:
+                header = f.read(self._HEADER.size)
+                magic, k, m, count, fp_rate = self._HEADER.unpack(header)
+                if magic != self._MAGIC or k != self.k or m != self.m:
+                    return
+                bits = f.read(len(self._bits))
+                if len(bits) != len(self._bits):
+                    return
+        except Exception:
+            return
+        self._bits[:] = bits
+        self.count = count
+        self._full_write = False
+
+    def _positions(self, key: str) -> list[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.m for i in range(self.k)]
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key: str):
+        if self.count >= self.capacity:
+            self.clear()
+        bits = self._bits
+        for p in self._positions(key):
+            bits[p >> 3] |= 1 << (p & 7)
+            self._dirty.add(p >> 3)
+        self.count += 1
+
+    def add_if_new(self, key: str) -> bool:
+        # Atomic check-and-add for concurrent generators; False when already present.
+        with self._lock:
+            if key in self:
+                return False
+            self.add(key)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._bits = bytearray(len(self._bits))
+            self.count = 0
+            self._dirty.clear()
+            self._full_write = True
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        header = self._HEADER.pack(self._MAGIC, self.k, self.m, self.count, self.fp_rate)
+        try:
+            if self._full_write or not self.path.exists():
+                with self.path.open("wb") as f:
+                    f.write(header)
+                    f.write(self._bits)
+            else:
+                with self.path.open("r+b") as f:
+                    f.write(header)
+                    base = self._HEADER.size
+                    for offset in sorted(self._dirty):
+                        f.seek(base + offset)
+                        f.write(self._bits[offset : offset + 1])
+        except Exception:
+            return
+        self._dirty.clear()
+        self._full_write = False
+
+
+_UNCOMPILED = object()
+
+
+@dataclass
+class PromptFile:
+    path: Path
+    # None until first use when the backend reads texts on demand through `_read`.
+    _text: str | None
+    # Parsed template, filled on first expansion; a changed file is a new PromptFile.
+    _template: object = field(default=_UNCOMPILED, repr=False, compare=False)
+    _tokens: tuple[str, int] | None = field(default=None, repr=False, compare=False)
+    _read: object = field(default=None, repr=False, compare=False)
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+    @property
+    def text(self) -> str:
+        text = self._text
+        if text is None:
+            text = self._text = self._read() if self._read is not None else ""
+        return text
+
+    def template(self):
+        compiled = self._template
+        if compiled is _UNCOMPILED:
+            compiled = self._template = compile_template(self.text.strip())
+        return compiled
+
+    def token_count(self, tokenizer: Tokenizer) -> int:
+        # Counted once per tokenizer; for templates this is the raw template text.
+        cached = self._tokens
+        if cached is None or cached[0] != tokenizer.name:
+            cached = self._tokens = (tokenizer.name, tokenizer.count(self.text.strip()))
+        return cached[1]
+
+
+class LibraryStorage(ABC):
+    # Where category folders and prompt texts live. Folders and prompts are addressed
+    # by name; LibraryIndex caches on top, so a backend only answers plain list/read/
+    # write calls. `root` is the base path PromptFile paths are reported under.
+    read_only = False
+
+    def __init__(self, root: Path, stats: CoreStats | None = None):
+        self.root = Path(root)
+        self.stats = stats or CoreStats()
+
+    @abstractmethod
+    def list_folders(self) -> list[str]:
+        ...
+
+    @abstractmethod
+    def list_prompts(self, folder: str) -> list[str]:
+        ...
+
+    @abstractmethod
+    def read_text(self, folder: str, name: str) -> str:
+        ...
+
+    def load_folder(self, folder: str) -> list[tuple[str, str]]:
+        # (name, text) pairs in library order; backends override this to batch reads.
+        return [(name, self.read_text(folder, name)) for name in self.list_prompts(folder)]
+
+    def folder_entries(self, folder: str) -> list[tuple[str, str | None, bool]]:
+        # (name, text, has_text) in library order for the index. A backend that can tell
+        # blank prompts apart without reading them returns text None; it is read on first use.
+        return [(name, text, bool(text.strip())) for name, text in self.load_folder(folder)]
+
+    def has_folder(self, folder: str) -> bool:
+        return folder in self.list_folders()
+
+    def exists(self, folder: str, name: str) -> bool:
+        return name in self.list_prompts(folder)
+
+    def create_folder(self, folder: str):
+        raise ValueError("Library is read-only.")
+
+    def write_prompt(self, folder: str, name: str, text: str):
+        raise ValueError("Library is read-only.")
+
+    def media_dir(self, folder: str) -> Path | None:
+        # Directory for media sidecars, or None when the backend cannot hold them.
+        return None
+
+    def metadata(self, key: str) -> str | None:
+        # Embedded JSON for "tags"/"weights"; None means use the files in root_dir.
+        return None
+
+    def ensure(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FileSystemStorage(LibraryStorage):
+    # Prompt_Library/<FOLDER>/prompt_*.md|.txt, the default layout.
+    def list_folders(self) -> list[str]:
+        try:
+            entries = list(self.root.iterdir())
+        except OSError:
+            return []
+        if self.stats.enabled:
+            self.stats.add("dir_listings")
+            self.stats.add("stat_calls", len(entries))
+        return sorted(p.name for p in entries if p.is_dir())
+
+    def _prompt_paths(self, folder: str) -> list[Path]:
+        try:
+            entries = sorted((self.root / folder).iterdir(), key=lambda p: p.name.lower())
+        except OSError:
+            entries = []
+        paths = [f for f in entries if f.suffix.lower() in PROMPT_TEXT_EXTENSIONS and f.is_file()]
+        if self.stats.enabled:
+            self.stats.add("dir_listings")
+            self.stats.add("stat_calls", len(paths))
+        return paths
+
+    def list_prompts(self, folder: str) -> list[str]:
+        return [p.name for p in self._prompt_paths(folder)]
+
+    def read_text(self, folder: str, name: str) -> str:
+        text = read_text(self.root / folder / name)
+        if self.stats.enabled:
+            self.stats.add("file_reads")
+            self.stats.add("bytes_read", len(text.encode("utf-8")))
+        return text
+
+    def load_folder(self, folder: str) -> list[tuple[str, str]]:
+        out = [(p.name, read_text(p)) for p in self._prompt_paths(folder)]
+        if self.stats.enabled:
+            self.stats.add("file_reads", len(out))
+            self.stats.add("bytes_read", sum(len(t.encode("utf-8")) for _n, t in out))
+        return out
+
+    def has_folder(self, folder: str) -> bool:
+        return (self.root / folder).is_dir()
+
+    def exists(self, folder: str, name: str) -> bool:
+        return (self.root / folder / name).exists()
+
+    def create_folder(self, folder: str):
+        (self.root / folder).mkdir(parents=True, exist_ok=True)
+
+    def write_prompt(self, folder: str, name: str, text: str):
+        write_text(self.root / folder / name, text)
+
+    def media_dir(self, folder: str) -> Path | None:
+        return self.root / folder
+
+    def ensure(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+
+
+class PackStorage(LibraryStorage):
+    # Read-only SQLite pack (see promptzone_pack.export_pack). The connection is opened
+    # read-only with mmap enabled. Listing a folder only fetches names (blank prompts are
+    # found by SQLite over the mapped pages); a prompt's text is fetched by primary key the
+    # first time it is drawn or shown, so a cold start is a single file open.
+    read_only = True
+
+    def __init__(self, pack_path: Path, stats: CoreStats | None = None, mmap_size: int = PACK_MMAP_SIZE):
+        super().__init__(Path(pack_path), stats)
+        if not self.root.is_file():
+            raise ValueError(f"Pack not found: {self.root}")
+        self._db = sqlite3.connect(f"{self.root.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        self._db_lock = threading.Lock()
+        self._db.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        # folder -> {name: (folder_id, pos)}, filled by folder_entries for reads by key.
+        self._keys: dict[str, dict[str, tuple[int, int]]] = {}
+        try:
+            fmt = self.metadata("format")
+        except sqlite3.DatabaseError:
+            fmt = None
+        if fmt != str(PACK_FORMAT):
+            raise ValueError(f"Not a PromptZone pack (format {fmt!r}): {self.root}")
+
+    def metadata(self, key: str) -> str | None:
+        with self._db_lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def list_folders(self) -> list[str]:
+        with self._db_lock:
+            names = [r[0] for r in self._db.execute("SELECT name FROM folders ORDER BY name")]
+        if self.stats.enabled:
+            self.stats.add("dir_listings")
+        return names
+
+    def list_prompts(self, folder: str) -> list[str]:
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT f.name FROM files f JOIN folders d ON d.id = f.folder_id WHERE d.name = ? ORDER BY f.pos",
+                (folder,),
+            ).fetchall()
+        if self.stats.enabled:
+            self.stats.add("dir_listings")
+        return [r[0] for r in rows]
+
+    def folder_entries(self, folder: str) -> list[tuple[str, str | None, bool]]:
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT f.folder_id, f.pos, f.name, length(trim(f.text, ?)) > 0"
+                " FROM files f JOIN folders d ON d.id = f.folder_id WHERE d.name = ? ORDER BY f.pos",
+                (_BLANK_CHARS, folder),
+            ).fetchall()
+            self._keys[folder] = {name: (folder_id, pos) for folder_id, pos, name, _has in rows}
+        if self.stats.enabled:
+            self.stats.add("dir_listings")
+        return [(name, None, bool(has_text)) for _id, _pos, name, has_text in rows]
+
+    def read_text(self, folder: str, name: str) -> str:
+        with self._db_lock:
+            key = self._keys.get(folder, {}).get(name)
+            if key is not None:
+                row = self._db.execute("SELECT text FROM files WHERE folder_id = ? AND pos = ?", key).fetchone()
+            else:
+                row = self._db.execute(
+                    "SELECT f.text FROM files f JOIN folders d ON d.id = f.folder_id WHERE d.name = ? AND f.name = ?",
+                    (folder, name),
+                ).fetchone()
+        if row is None:
+            raise ValueError(f"Prompt not found: {folder}/{name}")
+        if self.stats.enabled:
+            self.stats.add("file_reads")
+            self.stats.add("bytes_read", len(row[0].encode("utf-8")))
+        return row[0]
+
+    def load_folder(self, folder: str) -> list[tuple[str, str]]:
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT f.name, f.text FROM files f JOIN folders d ON d.id = f.folder_id WHERE d.name = ? ORDER BY f.pos",
+                (folder,),
+            ).fetchall()
+        if self.stats.enabled:
+            self.stats.add("file_reads", len(rows))
+            self.stats.add("bytes_read", sum(len(t.encode("utf-8")) for _n, t in rows))
+        return rows
+
+    def close(self):
+        with self._db_lock:
+            self._db.close()
+
+
+class MemoryStorage(LibraryStorage):
+    # Library held in dicts ({folder: {name: text}}); for tests and embedding.
+    def __init__(self, folders: dict[str, dict[str, str]] | None = None, root: Path = Path("Prompt_Library")):
+        super().__init__(root)
+        self._lock = threading.Lock()
+        self._folders = {k: dict(v) for k, v in (folders or {}).items()}
+
+    def list_folders(self) -> list[str]:
+        with self._lock:
+            return sorted(self._folders)
+
+    def list_prompts(self, folder: str) -> list[str]:
+        with self._lock:
+            names = list(self._folders.get(folder, {}))
+        return sorted((n for n in names if n.lower().endswith(PROMPT_TEXT_EXTENSIONS)), key=str.lower)
+
+    def read_text(self, folder: str, name: str) -> str:
+        with self._lock:
+            return self._folders.get(folder, {}).get(name, "")
+
+    def has_folder(self, folder: str) -> bool:
+        return folder in self._folders
+
+    def create_folder(self, folder: str):
+        with self._lock:
+            if folder not in self._folders:
+                self._folders[folder] = {}
+
+    def write_prompt(self, folder: str, name: str, text: str):
+        with self._lock:
+            self._folders.setdefault(folder, {})[name] = text
+
+
+class LibraryIndex:
+    # In-memory view of the library. The top-level folder listing and each folder's
+    # prompt files are loaded on first access, so callers get partial results while a
+    # background scan is still running. Mutations replace lists instead of editing them.
+    def __init__(self, storage: LibraryStorage, stats: CoreStats | None = None):
+        self.storage = storage
+        self.library_dir = storage.root
+        self.stats = stats or storage.stats
+        self._lock = threading.Lock()
+        self._folders: list[Path] | None = None
+        self._files: dict[str, tuple[list[PromptFile], list[PromptFile]]] = {}
+        self.version = 0
+
+    def _list_folders(self) -> list[Path]:
+        return [self.library_dir / name for name in self.storage.list_folders()]
+
+    def _scan_folder(self, folder: Path) -> tuple[list[PromptFile], list[PromptFile]]:
+        files, nonempty = [], []
+        read = self.storage.read_text
+        for name, text, has_text in self.storage.folder_entries(folder.name):
+            f = PromptFile(folder / name, text)
+            if text is None:
+                f._read = partial(read, folder.name, name)
             files.append(f)
-    return files
+            if has_text:
+                nonempty.append(f)
+        return files, nonempty
+
+    def folders(self) -> list[Path]:
+        folders = self._folders
+        if folders is not None:
+            if self.stats.enabled:
+                self.stats.add("cache_hits")
+            return folders
+        if self.stats.enabled:
+            self.stats.add("cache_misses")
+        listed = self._list_folders()
+        with self._lock:
+            if self._folders is None:
+                self._folders = listed
+            return self._folders
+
+    def folders_by_prefix(self, prefix: str) -> list[Path]:
+        return [p for p in self.folders() if p.name.startswith(prefix)]
+
+    def folder(self, name: str) -> Path | None:
+        for p in self.folders():
+            if p.name == name:
+                return p
+        return None
+
+    def _entry(self, folder: Path) -> tuple[list[PromptFile], list[PromptFile]]:
+        entry = self._files.get(folder.name)
+        if entry is not None:
+            if self.stats.enabled:
+                self.stats.add("cache_hits")
+            return entry
+        if self.stats.enabled:
+            self.stats.add("cache_misses")
+        scanned = self._scan_folder(folder)
+        with self._lock:
+            return self._files.setdefault(folder.name, scanned)
+
+    def prompt_files(self, folder: Path) -> list[PromptFile]:
+        return self._entry(folder)[0]
+
+    def nonempty_files(self, folder: Path) -> list[PromptFile]:
+        return self._entry(folder)[1]
+
+    def is_scanned(self, folder_name: str) -> bool:
+        return folder_name in self._files
+
+    def scan_all(self, prefixes: list[str] | None = None):
+        # Slot prefixes first, so the visible slots are complete early.
+        folders = self.folders()
+        order = []
+        for prefix in prefixes or []:
+            order.extend(p for p in folders if prefix and p.name.startswith(prefix))
+        order.extend(folders)
+        for folder in order:
+            self._entry(folder)
+
+    def add_folder(self, folder: Path):
+        with self._lock:
+            folders = self._folders
+            if folders is None:
+                return
+            if any(p.name == folder.name for p in folders):
+                return
+            self._folders = sorted(folders + [folder])
+            self.version += 1
+
+    def put_file(self, folder: Path, path: Path, text: str):
+        with self._lock:
+            entry = self._files.get(folder.name)
+            if entry is None:
+                return
+            files = [f for f in entry[0] if f.path != path] + [PromptFile(path, text)]
+            files.sort(key=lambda f: f.name.lower())
+            self._files[folder.name] = (files, [f for f in files if f.text.strip()])
+            self.version += 1
+
+    def refresh_folders(self, folders: list[Path]):
+        # One version bump for a batch of new/changed folders; their files rescan lazily.
+        with self._lock:
+            if self._folders is not None:
+                known = {p.name for p in self._folders}
+                added = [p for p in folders if p.name not in known]
+                if added:
+                    self._folders = sorted(self._folders + added)
+            for p in folders:
+                self._files.pop(p.name, None)
+            self.version += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._folders = None
+            self._files = {}
+            self.version += 1
+
+
+class TagIndex:
+    # Tags are interned to bit positions, so a folder's tag set is one int and
+    # exclusion/preference checks are a single `&`. Folder masks are resolved lazily
+    # through `resolve(folder_name) -> list[str]` and dropped on clear().
+    def __init__(self, resolve):
+        self._resolve = resolve
+        self._lock = threading.Lock()
+        self._ids: dict[str, int] = {}
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._folder_masks: dict[str, int] = {}
+            self._postings: dict[int, set[str]] = {}
+            self._query_masks: dict[frozenset, int] = {}
+            self.indexed_version = -1
+
+    def tag_id(self, tag: str) -> int:
+        tid = self._ids.get(tag)
+        if tid is None:
+            with self._lock:
+                tid = self._ids.setdefault(tag, len(self._ids))
+        return tid
+
+    def _mask(self, tags) -> int:
+        mask = 0
+        for t in tags:
+            t = _normalize_tag(t)
+            if t:
+                mask |= 1 << self.tag_id(t)
+        return mask
+
+    def mask_of(self, tags) -> int:
+        # Query masks (excluded/preferred tag sets from settings) are cached by content.
+        if not tags:
+            return 0
+        key = frozenset(tags)
+        mask = self._query_masks.get(key)
+        if mask is None:
+            mask = self._mask(key)
+            with self._lock:
+                if len(self._query_masks) > 256:
+                    self._query_masks.clear()
+                self._query_masks[key] = mask
+        return mask
+
+    def folder_mask(self, folder_name: str) -> int:
+        mask = self._folder_masks.get(folder_name)
+        if mask is None:
+            mask = self._mask(self._resolve(folder_name))
+            self._store(folder_name, mask)
+        return mask
+
+    def _store(self, folder_name: str, mask: int):
+        with self._lock:
+            old = self._folder_masks.get(folder_name, 0)
+            self._folder_masks[folder_name] = mask
+            bit = 0
+            changed = old ^ mask
+            while changed:
+                if changed & 1:
+                    posting = self._postings.setdefault(bit, set())
+                    if mask >> bit & 1:
+                        posting.add(folder_name)
+                    else:
+                        posting.discard(folder_name)
+                changed >>= 1
+                bit += 1
+
+    def set_folder(self, folder_name: str, tags):
+        self._store(folder_name, self._mask(tags))
+
+    def folders_with_tag(self, tag: str) -> set[str]:
+        tid = self._ids.get(_normalize_tag(tag))
+        if tid is None:
+            return set()
+        return set(self._postings.get(tid, ()))
+
+    def postings_for_mask(self, mask: int) -> list[set[str]]:
+        out = []
+        bit = 0
+        while mask:
+            if mask & 1:
+                out.append(set(self._postings.get(bit, ())))
+            mask >>= 1
+            bit += 1
+        return out
+
+
+PLAN_CACHE_SIZE = 256
+
+
+@dataclass(frozen=True)
+class SlotConfig:
+    slot_id: str
+    label: str
+    prefix: str
+    active: bool
+    lock: bool
+    categories: tuple[str, ...]
+    excluded: frozenset[str]
+
+
+@dataclass(frozen=True)
+class GenerationConfig:
+    # Snapshot of everything a generation call reads, taken once from settings
+    # (PromptZoneCore.generation_config). Calls never look at the live settings dict,
+    # so a config can be shared between threads; use dataclasses.replace() to vary it.
+    slots: tuple[SlotConfig, ...]
+    n: int = 3
+    avoid_repeats: bool = True
+    only_one_per_folder: bool = False
+    append_output: bool = False
+    weight_strength: float = 0.65
+    preferred_tags: tuple[str, ...] = ()
+    excluded_tags: frozenset[str] = frozenset()
+    exclude_near_duplicates: bool = False
+    suppress_duplicate_sets: bool = False
+    expand_templates: bool = True
+    # Per-set length limit in `tokenizer` units (0 = off).
+    token_budget: int = 0
+    tokenizer: Tokenizer | None = field(default=None, compare=False)
+    seed: int | None = None
+
+    def settings_hash(self) -> str:
+        # Identifies the generation settings across runs: every field but the seed.
+        data = {f.name: getattr(self, f.name) for f in fields(self) if f.name != "seed"}
+        data["tokenizer"] = self.tokenizer.name if self.tokenizer is not None else None
+        blob = json.dumps(data, sort_keys=True, default=_hash_default)
+        return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:16]
+
+
+def _hash_default(obj):
+    if is_dataclass(obj):
+        return asdict(obj)
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    return str(obj)
+
+
+def new_seed() -> int:
+    return random.getrandbits(32)
+
+
+class _OverBudget(Exception):
+    pass
+
+
+class CallRandom:
+    # Per-call randomness: a Python RNG plus a NumPy generator seeded from it on first
+    # use, with batched weighted draws kept per slot. Nothing here is shared between calls.
+    def __init__(self, seed: int | None = None):
+        self.rng = random.Random(seed)
+        self._np_rng = None
+        self._draws: dict[str, list[int]] = {}
+
+    def weighted_index(self, key: str, probs) -> int:
+        pending = self._draws.get(key)
+        if not pending:
+            if self._np_rng is None:
+                self._np_rng = np.random.default_rng(self.rng.getrandbits(64))
+            pending = self._draws[key] = self._np_rng.choice(len(probs), size=NUMPY_DRAW_BATCH, p=probs).tolist()
+        return pending.pop()
+
+
+class RepeatTracker:
+    # Files already drawn per folder while avoid_repeats is on; a folder starts over once
+    # all of its files were used. Shared by every caller of a core, so it is locked.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._used: dict[str, set[str]] = {}
+
+    def pick(self, folder_name: str, files: list[PromptFile], rng: random.Random) -> PromptFile:
+        with self._lock:
+            used = self._used.setdefault(folder_name, set())
+            choices = [f for f in files if f.name not in used]
+            if not choices:
+                used.clear()
+                choices = files
+            picked = rng.choice(choices)
+            used.add(picked.name)
+            return picked
+
+    def clear(self):
+        with self._lock:
+            self._used = {}
+
+
+@dataclass(frozen=True)
+class SlotPlan:
+    slot_id: str
+    label: str
+    active: bool
+    lock: bool
+    mode: str
+    folders: list[Path]
+    cum_weights: list[float] | None = None
+    # NumPy path: normalised probabilities; draws come from the call's CallRandom.
+    probs: object = None
+
+    def choose_folder(self, rand: CallRandom) -> Path:
+        if self.probs is not None:
+            return self.folders[rand.weighted_index(self.slot_id, self.probs)]
+        if self.cum_weights is not None:
+            return rand.rng.choices(self.folders, cum_weights=self.cum_weights, k=1)[0]
+        return rand.rng.choice(self.folders)
+
+
+class CombinationSpace:
+    # Cross product of slot pools addressed by a mixed-radix index; nothing is
+    # materialised beyond the per-slot pools. Shuffling uses an affine permutation
+    # i -> (a * i + c) mod total with gcd(a, total) == 1, which visits every index once.
+    def __init__(self, pools: list[tuple[str, list]], shuffle: bool = False, seed: int | None = None):
+        self.pools = pools
+        self.seed = seed
+        self.total = 1
+        for _slot_id, items in pools:
+            self.total *= len(items)
+        self._a, self._c = 1, 0
+        if shuffle and self.total > 1:
+            rng = random.Random(seed)
+            a = rng.randrange(1, self.total)
+            while math.gcd(a, self.total) != 1:
+                a = rng.randrange(1, self.total)
+            self._a, self._c = a, rng.randrange(self.total)
+
+    def __len__(self) -> int:
+        return self.total
+
+    def position(self, i: int) -> int:
+        return (self._a * i + self._c) % self.total
+
+    def combination(self, i: int) -> dict[str, object]:
+        idx = self.position(i)
+        out = {}
+        for slot_id, items in reversed(self.pools):
+            idx, r = divmod(idx, len(items))
+            out[slot_id] = items[r]
+        return out
+
+    def indices(self, start: int = 0, stride: int = 1, limit: int | None = None):
+        count = 0
+        for i in range(start, self.total, max(1, stride)):
+            if limit is not None and count >= limit:
+                return
+            yield i
+            count += 1
+
+
+@dataclass(frozen=True)
+class GenerationPlan:
+    config: GenerationConfig
+    slots: list[SlotPlan]
+
+
+def _fit_list(values: list[str], n: int, fill: str | None = None) -> list[str]:
+    # Trims, or pads with `fill` (default: the last entry, like split_sets), in place.
+    if len(values) > n:
+        del values[n:]
+    elif len(values) < n:
+        pad = fill if fill is not None else (values[-1] if values else "")
+        values.extend([pad] * (n - len(values)))
+    return values
+
+
+@dataclass
+class Batch:
+    # One batch of sets: per-slot texts and sources plus the composed sets, all index-aligned.
+    # Sets stay lists from generation to display, history and session state; DIVIDER text is
+    # only rendered at the edges (output box, clipboard, txt files).
+    slots: dict[str, list[str]] = field(default_factory=dict)
+    sources: dict[str, list[str]] = field(default_factory=dict)
+    sets: list[str] = field(default_factory=list)
+
+    @property
+    def n(self) -> int:
+        return len(self.sets)
+
+    def text(self, start: int = 0, end: int | None = None) -> str:
+        return join_sets(self.sets[start:end])
+
+    def append(self, texts: dict[str, str], sources: dict[str, str], composed: str):
+        for slot_id, text in texts.items():
+            self.slots.setdefault(slot_id, []).append(text)
+            self.sources.setdefault(slot_id, []).append(sources.get(slot_id, ""))
+        self.sets.append(composed)
+
+    def row(self, idx: int) -> tuple[dict[str, str], dict[str, str], str]:
+        return (
+            {k: v[idx] for k, v in self.slots.items()},
+            {k: v[idx] for k, v in self.sources.items()},
+            self.sets[idx],
+        )
+
+    def set_slot(self, slot_id: str, texts: list[str], sources: list[str] | None = None):
+        self.slots[slot_id] = _fit_list(list(texts), self.n)
+        self.sources[slot_id] = _fit_list(list(sources) if sources is not None else [], self.n, "")
+
+    def drop_slot(self, slot_id: str):
+        self.slots.pop(slot_id, None)
+        self.sources.pop(slot_id, None)
+
+    def fit(self, n: int):
+        # Every slot padded/trimmed to n sets; new composed sets are empty until recomposed.
+        for values in self.slots.values():
+            _fit_list(values, n)
+        for values in self.sources.values():
+            _fit_list(values, n)
+        _fit_list(self.sets, n, "")
+
+    def compose(self, idx: int, slot_ids: list[str]) -> str:
+        parts = []
+        for slot_id in slot_ids:
+            values = self.slots.get(slot_id) or []
+            text = values[idx].strip() if idx < len(values) else ""
+            if text:
+                parts.append(text)
+        return "\n".join(parts).strip()
+
+    def slot_sources(self, slot_id: str) -> list[str]:
+        # Distinct non-empty sources of one slot, in batch order.
+        return list(dict.fromkeys(s for s in self.sources.get(slot_id) or [] if s))
+
+    def to_dict(self) -> dict:
+        return {
+            "n": self.n,
+            "slots": {k: list(v) for k, v in self.slots.items()},
+            "sources": {k: list(v) for k, v in self.sources.items()},
+            "sets": list(self.sets),
+        }
+
+    @classmethod
+    def from_dict(cls, obj: dict | None) -> Batch:
+        # Tolerates partial or hand-edited records; every list ends up n long.
+        obj = obj if isinstance(obj, dict) else {}
+
+        def table(key: str) -> dict[str, list[str]]:
+            raw = obj.get(key)
+            if not isinstance(raw, dict):
+                return {}
+            return {str(k): [str(v or "") for v in vals] for k, vals in raw.items() if isinstance(vals, list)}
+
+        slots = table("slots")
+        sources = table("sources")
+        sets = [str(v or "") for v in obj.get("sets") or []]
+        active = obj.get("active")
+        try:
+            n = int(obj.get("n") or 0)
+        except Exception:
+            n = 0
+        n = n or len(sets) or max([len(v) for v in slots.values()] + [1])
+        batch = cls(slots, {k: sources.get(k, []) for k in slots}, sets)
+        for values in batch.sources.values():
+            _fit_list(values, n, "")
+        for values in batch.slots.values():
+            _fit_list(values, n)
+        _fit_list(batch.sets, n, "")
+        if not obj.get("sets") and isinstance(active, list):
+            ids = [str(sid) for sid in active]
+            batch.sets = [batch.compose(idx, ids) for idx in range(n)]
+        return batch
 
 
 def _normalize_tag(tag: str) -> str:
@@ -153,9 +1163,20 @@ def _coerce_list(value, default: str) -> list[str]:
 
 
 class PromptZoneCore:
-    def __init__(self, root_dir: Path):
+    def __init__(
+        self,
+        root_dir: Path,
+        background: bool = True,
+        pack: Path | None = None,
+        storage: LibraryStorage | None = None,
+    ):
         self.root_dir = Path(root_dir)
-        if self.root_dir.name.lower() == "promptzone_pyside":
+        self.stats = CoreStats()
+        if storage is None and pack:
+            storage = PackStorage(Path(pack), self.stats)
+        if storage is not None:
+            self.library_dir = storage.root
+        elif self.root_dir.name.lower() == "promptzone_pyside":
             self.library_dir = self.root_dir / "Prompt_Library"
         else:
             pyside_dir = self.root_dir / "promptzone_pyside"
@@ -163,32 +1184,83 @@ class PromptZoneCore:
                 self.library_dir = pyside_dir / "Prompt_Library"
             else:
                 self.library_dir = self.root_dir / "Prompt_Library"
-        self.library_dir.mkdir(parents=True, exist_ok=True)
         self.settings_path = self.root_dir / SETTINGS_FILE
         self.tags_path = self.root_dir / TAGS_FILE
         self.weights_path = self.root_dir / WEIGHTS_FILE
 
         self.output_path = self.root_dir / "selected_prompts.txt"
+        self.emitted_sets_path = self.root_dir / EMITTED_SETS_FILE
+        self.history = HistoryStore(self.root_dir / HISTORY_FILE)
+        self.session = SessionStore(self.root_dir / SESSION_DIR)
+        self._emitted_sets: BloomFilter | None = None
+        self._emitted_params = None
+        self._hidden_files: set[str] = set()
+        self._sampling_cache: dict[str, tuple[list[PromptFile], list[PromptFile]]] = {}
 
         self.settings = load_json(self.settings_path, {})
         if not isinstance(self.settings, dict):
             self.settings = {}
+        if self.session.migrate(self.settings):
+            self.save_settings()
 
         self.tags_map: dict[str, list[str]] = {}
         self.weights_map: dict[str, float] = {}
+        if storage is None:
+            storage = FileSystemStorage(self.library_dir, self.stats)
+        storage.stats = self.stats
+        self.storage = storage
+        self.index = LibraryIndex(storage, self.stats)
+        self.tag_index = TagIndex(self._raw_folder_tags)
+        # Resolves to this core once tags/weights are loaded and every folder is scanned.
+        self.ready: Future = Future()
+        self._meta_ready = threading.Event()
+
+        self._meta_version = 0
+        self.repeats = RepeatTracker()
+        self._state_lock = threading.Lock()
+        # One writer at a time, so concurrent batches never interleave in the output file.
+        self._output_lock = threading.Lock()
+        self._slot_plans: dict[tuple, SlotPlan] = {}
+        self._tokenizer: tuple[str, Tokenizer] | None = None
+        self._budget_cache: dict[str, tuple] = {}
 
-        self.used_action_files: set[Path] = set()
-        self.used_clothes_files: set[Path] = set()
-        self.used_composition_files: set[Path] = set()
-        self.used_i2v_files: set[Path] = set()
+        self._ensure_slot_settings()
+        if background:
+            threading.Thread(target=self._background_load, name="promptzone-scan", daemon=True).start()
+        else:
+            self._background_load()
 
-        self.last_action_sources = ""
-        self.last_clothes_sources = ""
-        self.last_composition_sources = ""
-        self.last_i2v_sources = ""
+    # ---------- loading ----------
+    def _background_load(self):
+        try:
+            if not self.read_only:
+                self.storage.ensure()
+            self._load_metadata()
+            self.index.scan_all([s.get("prefix", "") for s in self.get_slots() if s.get("enabled", True)])
+        except Exception as e:
+            self._meta_ready.set()
+            self.ready.set_exception(e)
+            return
+        self.ready.set_result(self)
+
+    @property
+    def is_ready(self) -> bool:
+        return self.ready.done()
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        try:
+            self.ready.result(timeout)
+        except Exception:
+            return self.ready.done()
+        return True
 
-        self.reload_library()
-        self._ensure_slot_settings()
+    def on_ready(self, callback):
+        # Callback receives the core; it runs on the scanning thread unless already ready.
+        self.ready.add_done_callback(lambda _f: callback(self))
+
+    def _wait_meta(self):
+        if not self._meta_ready.is_set():
+            self._meta_ready.wait()
 
     def _ensure_slot_settings(self):
         slots = self.settings.get("slots")
@@ -225,6 +1297,7 @@ class PromptZoneCore:
         save_json(self.settings_path, self.settings)
 
     def all_tags(self) -> list[str]:
+        self._wait_meta()
         tags = set()
         for vals in self.tags_map.values():
             if isinstance(vals, list):
@@ -249,17 +1322,31 @@ class PromptZoneCore:
             self.save_settings()
         return tag
 
-    def get_folder_tags(self, folder_name: str) -> list[str]:
+    def _raw_folder_tags(self, folder_name: str) -> list[str]:
         tags = self.tags_map.get(folder_name)
-        if not tags:
-            tags = infer_tags_from_name(folder_name)
-        return [_normalize_tag(t) for t in tags if _normalize_tag(t)]
+        return tags if tags else infer_tags_from_name(folder_name)
+
+    def get_folder_tags(self, folder_name: str) -> list[str]:
+        self._wait_meta()
+        return [_normalize_tag(t) for t in self._raw_folder_tags(folder_name) if _normalize_tag(t)]
+
+    def folders_with_tag(self, tag: str) -> list[str]:
+        self._wait_meta()
+        if self.tag_index.indexed_version != self.index.version:
+            for folder in self.index.folders():
+                self.tag_index.folder_mask(folder.name)
+            self.tag_index.indexed_version = self.index.version
+        return sorted(self.tag_index.folders_with_tag(tag))
 
     def set_folder_tags(self, folder_name: str, tags: list[str]):
         if not folder_name:
             raise ValueError("Folder name required.")
+        self._require_writable()
+        self._wait_meta()
         norm = [_normalize_tag(t) for t in tags if _normalize_tag(t)]
         self.tags_map[folder_name] = sorted(set(norm))
+        self.tag_index.set_folder(folder_name, self._raw_folder_tags(folder_name))
+        self._meta_version += 1
         # Ensure tags are discoverable in UI
         custom = self.settings.get("custom_tags", [])
         if not isinstance(custom, list):
@@ -273,7 +1360,7 @@ class PromptZoneCore:
 
     # ---------- folder discovery ----------
     def _folders_by_prefix(self, prefix: str) -> list[Path]:
-        return sorted([p for p in self.library_dir.iterdir() if p.is_dir() and p.name.startswith(prefix)])
+        return self.index.folders_by_prefix(prefix)
 
     def folders_by_prefix(self, prefix: str) -> list[Path]:
         if not prefix:
@@ -292,9 +1379,11 @@ class PromptZoneCore:
     def i2v_folder_names(self) -> list[str]:
         return [p.name for p in self._folders_by_prefix(I2V_PREFIX)]
 
+    def prompt_file_count(self, folders: list[Path]) -> int:
+        return sum(len(self.index.prompt_files(f)) for f in folders)
+
     def counts(self):
-        def count_files(folders: list[Path]) -> int:
-            return sum(len(_prompt_text_files(f)) for f in folders)
+        count_files = self.prompt_file_count
         a = self._folders_by_prefix(ACTION_PREFIX)
         c = self._folders_by_prefix(CLOTHES_PREFIX)
         m = self._folders_by_prefix(COMPOSITION_PREFIX)
@@ -302,44 +1391,98 @@ class PromptZoneCore:
         return (len(a), count_files(a), len(c), count_files(c), len(m), count_files(m), len(i), count_files(i))
 
     def reload_library(self):
-        # Load tags/weights (optional)
-        t = load_json(self.tags_path, {})
-        w = load_json(self.weights_path, {})
+        with self.stats.call("reload_library") as call:
+            self.index.invalidate()
+            call.phase("invalidate")
+            self._load_metadata()
+            call.phase("metadata")
+
+    @property
+    def read_only(self) -> bool:
+        return self.storage.read_only
+
+    def _require_writable(self):
+        if self.read_only:
+            raise ValueError("Library is read-only.")
+
+    def _load_metadata(self):
+        # Load tags/weights (optional); packs carry their own copy.
+        t = self.storage.metadata("tags")
+        w = self.storage.metadata("weights")
+        t = load_json(self.tags_path, {}) if t is None else json.loads(t)
+        w = load_json(self.weights_path, {}) if w is None else json.loads(w)
         self.tags_map = t if isinstance(t, dict) else {}
         self.weights_map = w if isinstance(w, dict) else {}
+        self.tag_index.clear()
+        self._meta_version += 1
 
         # Ensure each ACTION folder has inferred tags if missing
         for folder in self._folders_by_prefix(ACTION_PREFIX):
             self.tags_map.setdefault(folder.name, infer_tags_from_name(folder.name))
 
-        save_json(self.tags_path, self.tags_map)
+        if not self.read_only:
+            save_json(self.tags_path, self.tags_map)
+        self.reload_near_duplicates()
+        self._meta_ready.set()
+
+    def reload_near_duplicates(self):
+        # "folder/file" labels written by the dedupe command; hidden from sampling when
+        # exclude_near_duplicates is on.
+        hidden = load_json(self.root_dir / NEAR_DUPLICATES_FILE, [])
+        self._hidden_files = set(hidden) if isinstance(hidden, list) else set()
+        self._sampling_cache = {}
 
     # ---------- browsing/search ----------
-    def browse_entries(self, kind: str, query: str, prefix: str | None = None):
+    def _browse_folders(self, kind: str, prefix: str | None) -> list[Path]:
         if prefix:
-            folders = self._folders_by_prefix(str(prefix).strip())
-        else:
-            kind = kind.upper().strip()
-            if kind == "ACTIONSTYLE":
-                folders = self._folders_by_prefix(ACTION_PREFIX)
-            elif kind == "CLOTHES":
-                folders = self._folders_by_prefix(CLOTHES_PREFIX)
-            elif kind == "COMPOSITION":
-                folders = self._folders_by_prefix(COMPOSITION_PREFIX)
-            elif kind == "I2V":
-                folders = self._folders_by_prefix(I2V_PREFIX)
-            else:
-                raise ValueError(f"Unknown kind: {kind}")
+            return self._folders_by_prefix(str(prefix).strip())
+        kind = kind.upper().strip()
+        if kind == "ACTIONSTYLE":
+            return self._folders_by_prefix(ACTION_PREFIX)
+        elif kind == "CLOTHES":
+            return self._folders_by_prefix(CLOTHES_PREFIX)
+        elif kind == "COMPOSITION":
+            return self._folders_by_prefix(COMPOSITION_PREFIX)
+        elif kind == "I2V":
+            return self._folders_by_prefix(I2V_PREFIX)
+        raise ValueError(f"Unknown kind: {kind}")
 
-        q = (query or "").strip().lower()
-        out = []
-        for folder in folders:
-            for f in _nonempty_prompt_files(folder):
-                label = f"{folder.name}/{f.name}"
-                text = read_text(f)
-                if not q or (q in label.lower()) or (q in text.lower()):
-                    out.append((label, f, text))
-        return out
+    def browse_entries(self, kind: str, query: str, prefix: str | None = None):
+        with self.stats.call("browse_entries") as call:
+            folders = self._browse_folders(kind, prefix)
+            call.phase("folders")
+            q = (query or "").strip().lower()
+            out = []
+            for folder in folders:
+                for f in self.index.nonempty_files(folder):
+                    label = f"{folder.name}/{f.name}"
+                    text = f.text
+                    if not q or (q in label.lower()) or (q in text.lower()):
+                        out.append((label, f.path, text))
+            call.phase("match")
+            return out
+
+    def folder_search_text(self, folder_name: str) -> str:
+        # Lowercased folder name plus every non-empty prompt (file name and text).
+        folder = self.index.folder(folder_name)
+        parts = []
+        if folder is not None:
+            for f in self.index.nonempty_files(folder):
+                parts.append(f.name)
+                parts.append(f.text)
+        text = "\n".join(parts)
+        return f"{folder_name}\n{text}".lower()
+
+    def exclude_search_cache(self) -> dict[str, dict[str, str]]:
+        cache = {}
+        for kind, names in (
+            ("ACTIONSTYLE", self.action_folder_names()),
+            ("CLOTHES", self.clothes_folder_names()),
+            ("COMPOSITION", self.composition_folder_names()),
+            ("I2V", self.i2v_folder_names()),
+        ):
+            cache[kind] = {name: self.folder_search_text(name) for name in names}
+        return cache
 
     # ---------- creation ----------
     def _resolve_slot_prefix(self, kind_or_prefix: str) -> str:
@@ -372,6 +1515,7 @@ class PromptZoneCore:
         raise ValueError("Unknown kind.")
 
     def create_category(self, kind: str, name: str) -> str:
+        self._require_writable()
         raw = safe_name(name)
         if not raw:
             raise ValueError("Invalid category name.")
@@ -382,28 +1526,112 @@ class PromptZoneCore:
         if not folder_name.startswith(prefix):
             folder_name = prefix + folder_name
 
-        folder = self.library_dir / folder_name
-        folder.mkdir(parents=True, exist_ok=True)
+        self.storage.create_folder(folder_name)
+        self.index.add_folder(self.library_dir / folder_name)
         return folder_name
 
     def create_prompt_file(
         self, kind: str, folder_name: str, text: str, filename: str | None = None, overwrite: bool = False
     ) -> Path:
+        self._require_writable()
         kind = kind.upper().strip()
         folder = self.library_dir / folder_name
-        if not folder.exists() or not folder.is_dir():
+        if not self.storage.has_folder(folder_name):
             raise ValueError(f"Folder not found: {folder_name}")
 
         if filename:
             fn = safe_filename(filename)
         else:
-            fn = next_prompt_filename(folder)
+            fn = next_prompt_filename(self.storage.list_prompts(folder_name))
         path = folder / fn
-        if path.exists() and not overwrite:
+        if self.storage.exists(folder_name, fn) and not overwrite:
             raise ValueError(f"File already exists: {fn}")
-        write_text(path, (text or "").strip() + "\n")
+        content = (text or "").strip() + "\n"
+        self.storage.write_prompt(folder_name, fn, content)
+        self.index.put_file(folder, path, content)
         return path
 
+    def bulk_import(self, records, kind: str | None = None, batch_size: int = 500) -> dict:
+        # records: iterable of dicts with "category", "text" and optional "tags"/"media".
+        # File names come from per-folder counters (one listing per folder), files are
+        # written in batches, and the index/tags are committed once at the end.
+        self._require_writable()
+        prefix = self._resolve_slot_prefix(kind) if kind else ""
+        self._wait_meta()
+        slot_prefixes = [s["prefix"] for s in self.get_slots() if s.get("prefix")]
+        counters: dict[str, int] = {}
+        folders: dict[str, Path] = {}
+        per_folder: dict[str, int] = {}
+        new_tags: dict[str, set[str]] = {}
+        pending: list[tuple[str, str, str, Path | None]] = []
+        skipped = []
+        imported = 0
+
+        def flush():
+            nonlocal imported
+            for folder_name, name, content, media in pending:
+                self.storage.write_prompt(folder_name, name, content)
+                if media is None:
+                    continue
+                media_dir = self.storage.media_dir(folder_name)
+                try:
+                    shutil.copy2(media, (media_dir / name).with_suffix(media.suffix.lower()))
+                except Exception:
+                    skipped.append(f"{name}: media copy failed ({media})")
+            imported += len(pending)
+            pending.clear()
+
+        for lineno, rec in enumerate(records, 1):
+            text = str(rec.get("text") or "").strip()
+            category = safe_name(str(rec.get("category") or ""))
+            if not text or not category:
+                skipped.append(f"record {lineno}: missing category or text")
+                continue
+            folder_name = category if (not prefix or category.startswith(prefix)) else prefix + category
+            folder = folders.get(folder_name)
+            if folder is None:
+                folder = self.library_dir / folder_name
+                if not self.storage.has_folder(folder_name):
+                    if not prefix and not any(folder_name.startswith(p) for p in slot_prefixes):
+                        skipped.append(f"record {lineno}: unknown category {folder_name}")
+                        continue
+                    self.storage.create_folder(folder_name)
+                folders[folder_name] = folder
+                counters[folder_name] = _max_prompt_number(self.storage.list_prompts(folder_name))
+            counters[folder_name] += 1
+            name = f"prompt_{counters[folder_name]:02d}.md"
+            media = rec.get("media")
+            media = Path(media) if media else None
+            if media is not None and (not media.is_file() or self.storage.media_dir(folder_name) is None):
+                media = None
+            pending.append((folder_name, name, text + "\n", media))
+            per_folder[folder_name] = per_folder.get(folder_name, 0) + 1
+            tags = rec.get("tags") or []
+            if isinstance(tags, str):
+                tags = re.split(r"[;,]", tags)
+            norm = {_normalize_tag(str(t)) for t in tags} - {""}
+            if norm:
+                new_tags.setdefault(folder_name, set()).update(norm)
+            if len(pending) >= batch_size:
+                flush()
+        flush()
+
+        if new_tags:
+            custom = self.settings.get("custom_tags", [])
+            custom = set(custom) if isinstance(custom, list) else set()
+            for folder_name, tags in new_tags.items():
+                merged = set(self.tags_map.get(folder_name) or []) | tags
+                self.tags_map[folder_name] = sorted(merged)
+                self.tag_index.set_folder(folder_name, self.tags_map[folder_name])
+                custom |= tags
+            self.settings["custom_tags"] = sorted(custom)
+            save_json(self.tags_path, self.tags_map)
+            self.save_settings()
+            self._meta_version += 1
+        if folders:
+            self.index.refresh_folders(list(folders.values()))
+        return {"imported": imported, "folders": per_folder, "skipped": skipped}
+
     # ---------- selection helpers ----------
     def _normalize_tag_set(self, tags: set[str] | list[str]) -> set[str]:
         return {_normalize_tag(t) for t in (tags or []) if _normalize_tag(t)}
@@ -411,378 +1639,23 @@ class PromptZoneCore:
     def _folder_has_excluded_tags(self, folder_name: str, excluded_tags: set[str]) -> bool:
         if not excluded_tags:
             return False
-        ex = self._normalize_tag_set(excluded_tags)
-        if not ex:
-            return False
-        tags = self.get_folder_tags(folder_name)
-        return any(t in ex for t in tags)
-
-    def _eligible_folders(self, kind: str, excluded: set[str], excluded_tags: set[str]) -> list[Path]:
-        if kind == "ACTIONSTYLE":
-            folders = self._folders_by_prefix(ACTION_PREFIX)
-        elif kind == "CLOTHES":
-            folders = self._folders_by_prefix(CLOTHES_PREFIX)
-        elif kind == "COMPOSITION":
-            folders = self._folders_by_prefix(COMPOSITION_PREFIX)
-        else:
-            folders = self._folders_by_prefix(I2V_PREFIX)
-        return [
-            p
-            for p in folders
-            if p.name not in excluded
-            and _nonempty_prompt_files(p)
-            and not self._folder_has_excluded_tags(p.name, excluded_tags)
-        ]
-
-    def _pick_file(self, folder: Path, used: set[Path], avoid_repeats: bool) -> Path | None:
-        files = _nonempty_prompt_files(folder)
-        if not files:
-            return None
-        if not avoid_repeats:
-            return random.choice(files)
-
-        choices = [f for f in files if f not in used]
-        if not choices:
-            # exhausted: reset only for this folder
-            for f in files:
-                used.discard(f)
-            choices = files[:]
-        f = random.choice(choices)
-        used.add(f)
-        return f
-
-    def _choose_action_folder_weighted(
-        self,
-        excluded: set[str],
-        excluded_tags: set[str],
-        tag_pref,
-        weight_strength: float,
-    ) -> Path | None:
-        folders = self._eligible_folders("ACTIONSTYLE", excluded, excluded_tags)
-        if not folders:
-            return None
-
-        pref_vals = _coerce_list(tag_pref, "All")
-        prefs = [_normalize_tag(p) for p in pref_vals if _normalize_tag(p) and _normalize_tag(p) != "all"]
-        if not prefs:
-            return random.choice(folders)
-
-        # Weight boost if folder has preferred tag
-        weights = []
-        for f in folders:
-            base_w = float(self.weights_map.get(f.name, 1.0))
-            tags = self.get_folder_tags(f.name)
-            match_count = sum(1 for p in prefs if p in tags)
-            boost = 1.0 + (weight_strength * 2.0 * match_count) if match_count else 1.0
-            weights.append(max(0.001, base_w * boost))
-
-        return random.choices(folders, weights=weights, k=1)[0]
-
-    # ---------- generate ----------
-    def generate(self, action_slot: str, clothes_slot: str, composition_slot: str, i2v_slot: str):
-        s = self.settings
-
-        n = max(1, int(s.get("n_sets", 3)))
-
-        action_choices = _coerce_list(s.get("action_category", "Any"), "Any")
-        clothes_choices = _coerce_list(s.get("clothes_category", "Any"), "Any")
-        composition_choices = _coerce_list(s.get("composition_category", "Any"), "Any")
-        i2v_choices = _coerce_list(s.get("i2v_category", "Any"), "Any")
-
-        excluded_action = set(s.get("excluded_action", []) or [])
-        excluded_clothes = set(s.get("excluded_clothes", []) or [])
-        excluded_composition = set(s.get("excluded_composition", []) or [])
-        excluded_i2v = set(s.get("excluded_i2v", []) or [])
-        excluded_tags = set(s.get("excluded_tags", []) or [])
-
-        lock_action = bool(s.get("lock_action", False))
-        lock_clothes = bool(s.get("lock_clothes", False))
-        lock_composition = bool(s.get("lock_composition", False))
-        lock_i2v = bool(s.get("lock_i2v", False))
-
-        append_output = bool(s.get("append_output", False))
-        avoid_repeats = bool(s.get("avoid_repeats", True))
-        only_one_per_folder = bool(s.get("only_one_per_folder", False))
-
-        tag_pref = s.get("tag_pref", "All")
-        weight_strength = float(s.get("weight_strength", 0.65))
-
-        # If locked, treat current slot as source per-set (divider aware)
-        locked_action_sets = _split_sets(action_slot, n) if lock_action else None
-        locked_clothes_sets = _split_sets(clothes_slot, n) if lock_clothes else None
-        locked_composition_sets = _split_sets(composition_slot, n) if lock_composition else None
-        locked_i2v_sets = _split_sets(i2v_slot, n) if lock_i2v else None
-
-        actions, clothes, compositions, i2vs, prompts = [], [], [], [], []
-        action_sources, clothes_sources, composition_sources, i2v_sources = [], [], [], []
-
-        batch_used_action_folders = set()
-        batch_used_clothes_folders = set()
-        batch_used_composition_folders = set()
-        batch_used_i2v_folders = set()
-
-        def category_mode(vals: list[str]) -> tuple[str, list[str]]:
-            if "None" in vals:
-                return ("None", [])
-            if "Any" in vals or not vals:
-                return ("Any", [])
-            filtered = [v for v in vals if v not in ("Any", "None")]
-            return ("List", filtered)
-
-        action_mode, action_list = category_mode(action_choices)
-        clothes_mode, clothes_list = category_mode(clothes_choices)
-        composition_mode, composition_list = category_mode(composition_choices)
-        i2v_mode, i2v_list = category_mode(i2v_choices)
-
-        for idx in range(n):
-            # ACTIONSTYLE
-            if lock_action and locked_action_sets and locked_action_sets[idx].strip():
-                atext = locked_action_sets[idx].strip()
-                action_sources.append("")
-            else:
-                if action_mode == "None":
-                    atext = ""
-                    action_sources.append("")
-                else:
-                    if action_mode == "List":
-                        candidates = []
-                        for name in action_list:
-                            if name in excluded_action:
-                                continue
-                        afolder = self.library_dir / name
-                        if not afolder.exists():
-                            continue
-                            if not _nonempty_prompt_files(afolder):
-                                continue
-                            if self._folder_has_excluded_tags(afolder.name, excluded_tags):
-                                continue
-                            candidates.append(afolder)
-                        if not candidates:
-                            raise ValueError("No ACTIONSTYLE folders found (or all excluded).")
-                        if only_one_per_folder:
-                            tries = 0
-                            afolder = random.choice(candidates)
-                            while afolder.name in batch_used_action_folders and tries < 50:
-                                afolder = random.choice(candidates)
-                                tries += 1
-                        else:
-                            afolder = random.choice(candidates)
-                    else:
-                        # choose weighted
-                        afolder = self._choose_action_folder_weighted(
-                            excluded_action, excluded_tags, tag_pref, weight_strength
-                        )
-                        if only_one_per_folder and afolder:
-                            tries = 0
-                            while afolder.name in batch_used_action_folders and tries < 50:
-                                afolder = self._choose_action_folder_weighted(
-                                    excluded_action, excluded_tags, tag_pref, weight_strength
-                                )
-                                tries += 1
-                    if not afolder:
-                        raise ValueError("No ACTIONSTYLE folders found (or all excluded).")
-                    if only_one_per_folder:
-                        batch_used_action_folders.add(afolder.name)
-
-                    afile = self._pick_file(afolder, self.used_action_files, avoid_repeats)
-                    if not afile:
-                        atext = ""
-                        action_sources.append("")
-                    else:
-                        atext = read_text(afile).strip()
-                        action_sources.append(f"{afolder.name}\\{afile.name}")
-
-            # CLOTHES
-            if lock_clothes and locked_clothes_sets and locked_clothes_sets[idx].strip():
-                ctext = locked_clothes_sets[idx].strip()
-                clothes_sources.append("")
-            else:
-                if clothes_mode == "None":
-                    ctext = ""
-                    clothes_sources.append("")
-                else:
-                    if clothes_mode == "List":
-                        candidates = []
-                        for name in clothes_list:
-                            if name in excluded_clothes:
-                                continue
-                        cfolder = self.library_dir / name
-                        if not cfolder.exists():
-                            continue
-                            if not _nonempty_prompt_files(cfolder):
-                                continue
-                            if self._folder_has_excluded_tags(cfolder.name, excluded_tags):
-                                continue
-                            candidates.append(cfolder)
-                        if not candidates:
-                            raise ValueError("No CLOTHES folders found (or all excluded).")
-                        if only_one_per_folder:
-                            tries = 0
-                            cfolder = random.choice(candidates)
-                            while cfolder.name in batch_used_clothes_folders and tries < 50:
-                                cfolder = random.choice(candidates)
-                                tries += 1
-                        else:
-                            cfolder = random.choice(candidates)
-                    else:
-                        cfolders = self._eligible_folders("CLOTHES", excluded_clothes, excluded_tags)
-                        if not cfolders:
-                            raise ValueError("No CLOTHES folders found (or all excluded).")
-                        cfolder = random.choice(cfolders)
-                        if only_one_per_folder:
-                            tries = 0
-                            while cfolder.name in batch_used_clothes_folders and tries < 50:
-                                cfolder = random.choice(cfolders)
-                                tries += 1
-                    if only_one_per_folder:
-                        batch_used_clothes_folders.add(cfolder.name)
-
-                    cfile = self._pick_file(cfolder, self.used_clothes_files, avoid_repeats)
-                    if not cfile:
-                        ctext = ""
-                        clothes_sources.append("")
-                    else:
-                        ctext = read_text(cfile).strip()
-                        clothes_sources.append(f"{cfolder.name}\\{cfile.name}")
-
-            # COMPOSITION
-            if lock_composition and locked_composition_sets and locked_composition_sets[idx].strip():
-                mtext = locked_composition_sets[idx].strip()
-                composition_sources.append("")
-            else:
-                if composition_mode == "None":
-                    mtext = ""
-                    composition_sources.append("")
-                else:
-                    if composition_mode == "List":
-                        candidates = []
-                        for name in composition_list:
-                            if name in excluded_composition:
-                                continue
-                        mfolder = self.library_dir / name
-                        if not mfolder.exists():
-                            continue
-                            if not _nonempty_prompt_files(mfolder):
-                                continue
-                            if self._folder_has_excluded_tags(mfolder.name, excluded_tags):
-                                continue
-                            candidates.append(mfolder)
-                        if not candidates:
-                            raise ValueError("No COMPOSITION folders found (or all excluded).")
-                        if only_one_per_folder:
-                            tries = 0
-                            mfolder = random.choice(candidates)
-                            while mfolder.name in batch_used_composition_folders and tries < 50:
-                                mfolder = random.choice(candidates)
-                                tries += 1
-                        else:
-                            mfolder = random.choice(candidates)
-                    else:
-                        mfolders = self._eligible_folders("COMPOSITION", excluded_composition, excluded_tags)
-                        if not mfolders:
-                            raise ValueError("No COMPOSITION folders found (or all excluded).")
-                        mfolder = random.choice(mfolders)
-                        if only_one_per_folder:
-                            tries = 0
-                            while mfolder.name in batch_used_composition_folders and tries < 50:
-                                mfolder = random.choice(mfolders)
-                                tries += 1
-                    if only_one_per_folder:
-                        batch_used_composition_folders.add(mfolder.name)
-
-                    mfile = self._pick_file(mfolder, self.used_composition_files, avoid_repeats)
-                    if not mfile:
-                        mtext = ""
-                        composition_sources.append("")
-                    else:
-                        mtext = read_text(mfile).strip()
-                        composition_sources.append(f"{mfolder.name}\\{mfile.name}")
-
-            # I2V
-            if lock_i2v and locked_i2v_sets and locked_i2v_sets[idx].strip():
-                itext = locked_i2v_sets[idx].strip()
-                i2v_sources.append("")
-            else:
-                if i2v_mode == "None":
-                    itext = ""
-                    i2v_sources.append("")
-                else:
-                    if i2v_mode == "List":
-                        candidates = []
-                        for name in i2v_list:
-                            if name in excluded_i2v:
-                                continue
-                        ifolder = self.library_dir / name
-                        if not ifolder.exists():
-                            continue
-                            if not _nonempty_prompt_files(ifolder):
-                                continue
-                            if self._folder_has_excluded_tags(ifolder.name, excluded_tags):
-                                continue
-                            candidates.append(ifolder)
-                        if not candidates:
-                            raise ValueError("No I2V folders found (or all excluded).")
-                        if only_one_per_folder:
-                            tries = 0
-                            ifolder = random.choice(candidates)
-                            while ifolder.name in batch_used_i2v_folders and tries < 50:
-                                ifolder = random.choice(candidates)
-                                tries += 1
-                        else:
-                            ifolder = random.choice(candidates)
-                    else:
-                        ifolders = self._eligible_folders("I2V", excluded_i2v, excluded_tags)
-                        if not ifolders:
-                            raise ValueError("No I2V folders found (or all excluded).")
-                        ifolder = random.choice(ifolders)
-                        if only_one_per_folder:
-                            tries = 0
-                            while ifolder.name in batch_used_i2v_folders and tries < 50:
-                                ifolder = random.choice(ifolders)
-                                tries += 1
-                    if only_one_per_folder:
-                        batch_used_i2v_folders.add(ifolder.name)
-
-                    ifile = self._pick_file(ifolder, self.used_i2v_files, avoid_repeats)
-                    if not ifile:
-                        itext = ""
-                        i2v_sources.append("")
-                    else:
-                        itext = read_text(ifile).strip()
-                        i2v_sources.append(f"{ifolder.name}\\{ifile.name}")
-
-            actions.append(atext)
-            clothes.append(ctext)
-            compositions.append(mtext)
-            i2vs.append(itext)
-
-            parts = [p for p in [atext, ctext, mtext] if p.strip()]
-            prompts.append("\n".join(parts).strip())
-
-        def join_sets(arr: list[str]) -> str:
-            if n == 1:
-                return arr[0] if arr else ""
-            return DIVIDER.join([a.strip() for a in arr])
-
-        out = join_sets(prompts)
-        self.last_action_sources = join_sets(action_sources)
-        self.last_clothes_sources = join_sets(clothes_sources)
-        self.last_composition_sources = join_sets(composition_sources)
-        self.last_i2v_sources = join_sets(i2v_sources)
-
-        # Write output file
-        try:
-            mode = "a" if append_output else "w"
-            existed = self.output_path.exists()
-            with self.output_path.open(mode, encoding="utf-8") as f:
-                if mode == "a" and existed:
-                    f.write(DIVIDER)
-                f.write(out)
-        except Exception:
-            # UI handles warnings
-            pass
-
-        return join_sets(actions), join_sets(clothes), join_sets(compositions), join_sets(i2vs), out
+        return bool(self.tag_index.folder_mask(folder_name) & self.tag_index.mask_of(excluded_tags))
+
+    def _preferred_tag_matches(self, folder_name: str, pref_mask: int) -> int:
+        return bin(self.tag_index.folder_mask(folder_name) & pref_mask).count("1")
+
+    def _sampling_files(self, folder: Path, exclude_near_duplicates: bool | None = None) -> list[PromptFile]:
+        files = self.index.nonempty_files(folder)
+        if exclude_near_duplicates is None:
+            exclude_near_duplicates = bool(self.settings.get("exclude_near_duplicates", False))
+        if not self._hidden_files or not exclude_near_duplicates:
+            return files
+        cached = self._sampling_cache.get(folder.name)
+        if cached is not None and cached[0] is files:
+            return cached[1]
+        kept = [f for f in files if f"{folder.name}/{f.name}" not in self._hidden_files] or files
+        self._sampling_cache[folder.name] = (files, kept)
+        return kept
 
     # ---------- dynamic slots ----------
     def _slot_settings(self, slot_id: str) -> dict:
@@ -800,162 +1673,650 @@ class PromptZoneCore:
         filtered = [v for v in vals if v not in ("Any", "None")]
         return ("List", filtered)
 
-    def generate_slots(self, slots: list[dict], slot_texts: dict[str, str], skip_minimized: bool = False):
+    def generate_slots(
+        self,
+        slots: list[dict],
+        slot_texts: dict[str, str],
+        skip_minimized: bool = False,
+        n: int | None = None,
+        write_output: bool = True,
+    ):
+        config = self.generation_config(slots, skip_minimized, n)
+        return self.generate_config(config, slot_texts, write_output)
+
+    def generate_config(
+        self, config: GenerationConfig, slot_texts: dict[str, str | list[str]] | None = None, write_output: bool = True
+    ):
+        # Thread-safe: reads only `config`, draws from a per-call RNG, and shares nothing
+        # mutable with other calls except the locked repeat/duplicate trackers.
+        with self.stats.call("generate_slots") as call:
+            self._wait_meta()
+            call.phase("wait")
+            plan = self.generation_plan(config=config)
+            call.phase("plan")
+
+            batch = self._sample_sets(plan, slot_texts or {}, CallRandom(config.seed))
+            call.phase("sample")
+
+            # Joined text is this API's return format only.
+            joined = {slot_id: join_sets(vals) for slot_id, vals in batch.slots.items()}
+            sources_joined = {slot_id: join_sets(vals) for slot_id, vals in batch.sources.items()}
+
+            out = batch.text()
+            call.phase("join")
+
+            if write_output:
+                self.write_output(out, config.append_output)
+                self.record_batch(config, batch)
+            call.phase("write")
+
+            return joined, sources_joined, out
+
+    @property
+    def tokenizer(self) -> Tokenizer:
+        spec = str(self.settings.get("tokenizer") or DEFAULT_TOKENIZER)
+        cached = self._tokenizer
+        if cached is None or cached[0] != spec:
+            cached = self._tokenizer = (spec, load_tokenizer(spec))
+        return cached[1]
+
+    @property
+    def library_version(self) -> int:
+        # Both counters only grow, so their sum changes whenever either does.
+        return self.index.version + self._meta_version
+
+    def generation_config(
+        self, slots: list[dict] | None = None, skip_minimized: bool = False, n: int | None = None, seed: int | None = None
+    ) -> GenerationConfig:
         s = self.settings
-        n = max(1, int(s.get("n_sets", 3)))
-        avoid_repeats = bool(s.get("avoid_repeats", True))
-        only_one_per_folder = bool(s.get("only_one_per_folder", False))
-        append_output = bool(s.get("append_output", False))
-        weight_strength = float(s.get("weight_strength", 0.65))
-        tag_pref = s.get("tag_pref", "All")
-        excluded_tags = set(s.get("excluded_tags", []) or [])
-
-        slots_out = {slot["id"]: [] for slot in slots}
-        sources_out = {slot["id"]: [] for slot in slots}
-
-        batch_used = {slot["id"]: set() for slot in slots}
-
-        for idx in range(n):
-            for slot in slots:
-                slot_id = slot["id"]
-                if not slot.get("enabled", True):
-                    slots_out[slot_id].append("")
-                    sources_out[slot_id].append("")
+        slots = slots if slots is not None else self.get_slots()
+        slot_configs = []
+        for slot in slots:
+            slot_id = slot["id"]
+            st = self._slot_settings(slot_id)
+            categories = _coerce_list(st.get("category", "Any"), "Any")
+            if not bool(st.get("gen", True)):
+                categories = ["None"]
+            slot_configs.append(
+                SlotConfig(
+                    slot_id=slot_id,
+                    label=slot.get("label", slot_id),
+                    prefix=slot.get("prefix", ""),
+                    active=bool(slot.get("enabled", True)) and not (skip_minimized and slot.get("minimized", False)),
+                    lock=bool(st.get("lock", False)),
+                    categories=tuple(categories),
+                    excluded=frozenset(st.get("excluded", []) or []),
+                )
+            )
+        pref_vals = _coerce_list(s.get("tag_pref", "All"), "All")
+        prefs = [_normalize_tag(p) for p in pref_vals if _normalize_tag(p) and _normalize_tag(p) != "all"]
+        return GenerationConfig(
+            slots=tuple(slot_configs),
+            n=max(1, int(n if n is not None else s.get("n_sets", 3))),
+            avoid_repeats=bool(s.get("avoid_repeats", True)),
+            only_one_per_folder=bool(s.get("only_one_per_folder", False)),
+            append_output=bool(s.get("append_output", False)),
+            weight_strength=float(s.get("weight_strength", 0.65)),
+            preferred_tags=tuple(prefs),
+            excluded_tags=frozenset(s.get("excluded_tags", []) or []),
+            exclude_near_duplicates=bool(s.get("exclude_near_duplicates", False)),
+            suppress_duplicate_sets=bool(s.get("suppress_duplicate_sets", False)),
+            expand_templates=bool(s.get("expand_templates", True)),
+            token_budget=max(0, int(s.get("token_budget", 0) or 0)),
+            tokenizer=self.tokenizer,
+            # Always seeded, so history records which RNG stream drew a batch. This alone does
+            # not reproduce it: repeat state, the never-repeat filter and locked texts also count.
+            seed=seed if seed is not None else new_seed(),
+        )
+
+    def generation_plan(
+        self, slots: list[dict] | None = None, skip_minimized: bool = False, config: GenerationConfig | None = None
+    ) -> GenerationPlan:
+        config = config or self.generation_config(slots, skip_minimized)
+        return GenerationPlan(config, [self._slot_plan(sc, config) for sc in config.slots])
+
+    def _slot_plan(self, sc: SlotConfig, config: GenerationConfig) -> SlotPlan:
+        # Compiled pools are cached per slot config, weighting inputs and library version,
+        # so a full run and single-slot runs share them.
+        # Expansion decides whether template files count toward a folder's shortest prompt.
+        budget = (config.token_budget, config.tokenizer.name, config.expand_templates) if config.token_budget else None
+        key = (sc, config.weight_strength, config.preferred_tags, config.excluded_tags, budget, self.library_version)
+        sp = self._slot_plans.get(key)
+        if sp is None:
+            sp = self._compile_slot_plan(sc, config)
+            with self._state_lock:
+                if len(self._slot_plans) >= PLAN_CACHE_SIZE:
+                    self._slot_plans = {}
+                self._slot_plans[key] = sp
+        return sp
+
+    def _compile_slot_plan(self, sc: SlotConfig, config: GenerationConfig) -> SlotPlan:
+        weight_strength = config.weight_strength
+        excluded_tags = set(config.excluded_tags)
+        pref_mask = self.tag_index.mask_of(config.preferred_tags) if config.preferred_tags else 0
+        excluded = sc.excluded
+        mode, lst = self._slot_mode(list(sc.categories))
+        budget = config.token_budget
+
+        folders = []
+        cum_weights = None
+        probs = None
+        if sc.active and mode == "List":
+            for name in lst:
+                if name in excluded:
                     continue
-                if skip_minimized and slot.get("minimized", False):
-                    slots_out[slot_id].append("")
-                    sources_out[slot_id].append("")
+                folder = self.index.folder(name)
+                if folder is None:
                     continue
-
-                st = self._slot_settings(slot_id)
-                lock = bool(st.get("lock", False))
-                gen = bool(st.get("gen", True))
-                category_vals = _coerce_list(st.get("category", "Any"), "Any")
-                excluded = set(st.get("excluded", []) or [])
-                prefix = slot.get("prefix", "")
-
-                if lock and slot_texts.get(slot_id, "").strip():
-                    slots_out[slot_id].append(slot_texts[slot_id].strip())
-                    sources_out[slot_id].append("")
+                if not self.index.nonempty_files(folder):
                     continue
-
-                if not gen:
-                    category_vals = ["None"]
-
-                mode, lst = self._slot_mode(category_vals)
-                if mode == "None":
-                    slots_out[slot_id].append("")
-                    sources_out[slot_id].append("")
-                    continue
-
-                if mode == "List":
-                    candidates = []
-                    for name in lst:
-                        if name in excluded:
-                            continue
-                        folder = self.library_dir / name
-                        if not folder.exists():
-                            continue
-                        if not _nonempty_prompt_files(folder):
-                            continue
-                        if self._folder_has_excluded_tags(folder.name, excluded_tags):
-                            continue
-                        candidates.append(folder)
-                    if not candidates:
-                        current_text = (slot_texts.get(slot_id, "") or "").strip()
-                        if current_text:
-                            slots_out[slot_id].append(current_text)
-                            sources_out[slot_id].append("")
-                            continue
-                        raise ValueError(f"No folders found for slot: {slot.get('label', slot_id)}")
-                    folder = random.choice(candidates)
-                    if only_one_per_folder:
-                        tries = 0
-                        while folder.name in batch_used[slot_id] and tries < 50:
-                            folder = random.choice(candidates)
-                            tries += 1
-                    if only_one_per_folder:
-                        batch_used[slot_id].add(folder.name)
-                else:
-                    # Any
-                    folders = self.folders_by_prefix(prefix)
-                    folders = [
-                        f
-                        for f in folders
-                        if f.name not in excluded
-                        and _nonempty_prompt_files(f)
-                        and not self._folder_has_excluded_tags(f.name, excluded_tags)
-                    ]
-                    if not folders:
-                        current_text = (slot_texts.get(slot_id, "") or "").strip()
-                        if current_text:
-                            slots_out[slot_id].append(current_text)
-                            sources_out[slot_id].append("")
-                            continue
-                        raise ValueError(f"No folders found for slot: {slot.get('label', slot_id)}")
-                    # weight boost by preferred tags (if any)
-                    pref_vals = _coerce_list(tag_pref, "All")
-                    prefs = [
-                        _normalize_tag(p) for p in pref_vals if _normalize_tag(p) and _normalize_tag(p) != "all"
-                    ]
-                    if prefs:
-                        weights = []
-                        for f in folders:
-                            base_w = float(self.weights_map.get(f.name, 1.0))
-                            tags = self.get_folder_tags(f.name)
-                            match_count = sum(1 for p in prefs if p in tags)
-                            boost = 1.0 + (weight_strength * 2.0 * match_count) if match_count else 1.0
-                            weights.append(max(0.001, base_w * boost))
-                        folder = random.choices(folders, weights=weights, k=1)[0]
-                    else:
-                        folder = random.choice(folders)
-                    if only_one_per_folder:
-                        tries = 0
-                        while folder.name in batch_used[slot_id] and tries < 50:
-                            folder = random.choice(folders)
-                            tries += 1
-                        batch_used[slot_id].add(folder.name)
-
-                file_path = self._pick_file(folder, set(), avoid_repeats)
-                if not file_path:
-                    slots_out[slot_id].append("")
-                    sources_out[slot_id].append("")
-                else:
-                    slots_out[slot_id].append(read_text(file_path).strip())
-                    sources_out[slot_id].append(f"{folder.name}\\{file_path.name}")
-
-        def join_sets(arr: list[str]) -> str:
-            if n == 1:
-                return arr[0] if arr else ""
-            return DIVIDER.join([a.strip() for a in arr])
-
-        joined = {slot_id: join_sets(vals) for slot_id, vals in slots_out.items()}
-        sources_joined = {slot_id: join_sets(vals) for slot_id, vals in sources_out.items()}
-
-        # Write output file from enabled slots
-        out_sets = []
-        for idx in range(n):
-            parts = []
-            for slot in slots:
-                slot_id = slot["id"]
-                if not slot.get("enabled", True):
+                if self._folder_has_excluded_tags(folder.name, excluded_tags):
                     continue
-                if skip_minimized and slot.get("minimized", False):
+                if budget and self._min_tokens(folder, config) > budget:
                     continue
-                text = slots_out[slot_id][idx].strip()
-                if text:
-                    parts.append(text)
-            out_sets.append("\n".join(parts).strip())
-        out = join_sets(out_sets)
+                folders.append(folder)
+        elif sc.active and mode == "Any":
+            folders = [
+                f
+                for f in self.folders_by_prefix(sc.prefix)
+                if f.name not in excluded
+                and self.index.nonempty_files(f)
+                and not self._folder_has_excluded_tags(f.name, excluded_tags)
+                and not (budget and self._min_tokens(f, config) > budget)
+            ]
+            # weight boost by preferred tags (if any)
+            if pref_mask and len(folders) >= NUMPY_MIN_POOL and load_numpy() is not None:
+                probs = self._numpy_weights(folders, pref_mask, weight_strength)
+            elif pref_mask and folders:
+                cum_weights = []
+                total = 0.0
+                for f in folders:
+                    base_w = float(self.weights_map.get(f.name, 1.0))
+                    match_count = self._preferred_tag_matches(f.name, pref_mask)
+                    boost = 1.0 + (weight_strength * 2.0 * match_count) if match_count else 1.0
+                    total += max(0.001, base_w * boost)
+                    cum_weights.append(total)
+        return SlotPlan(
+            slot_id=sc.slot_id,
+            label=sc.label,
+            active=sc.active,
+            lock=sc.lock,
+            mode=mode,
+            folders=folders,
+            cum_weights=cum_weights,
+            probs=probs,
+        )
+
+    def _numpy_weights(self, folders: list[Path], pref_mask: int, weight_strength: float):
+        # Same formula as the Python path: max(0.001, base * (1 + 2 * strength * matches)),
+        # with matches counted from the tag postings instead of per-folder scans.
+        for f in folders:
+            self.tag_index.folder_mask(f.name)
+        position = {f.name: i for i, f in enumerate(folders)}
+        base = np.fromiter(
+            (float(self.weights_map.get(f.name, 1.0)) for f in folders), dtype=np.float64, count=len(folders)
+        )
+        matches = np.zeros(len(folders), dtype=np.float64)
+        for posting in self.tag_index.postings_for_mask(pref_mask):
+            idx = np.fromiter((position[name] for name in posting if name in position), dtype=np.intp)
+            matches[idx] += 1.0
+        weights = np.maximum(0.001, base * (1.0 + weight_strength * 2.0 * matches))
+        return weights / weights.sum()
+
+    def _min_tokens(self, folder: Path, config: GenerationConfig) -> int:
+        # Shortest draw the folder can give; an expanded template's length is unknown up front.
+        counts = []
+        for f in self.index.nonempty_files(folder):
+            if config.expand_templates and f.template() is not None:
+                return 0
+            counts.append(f.token_count(config.tokenizer))
+        return min(counts) if counts else 0
+
+    def _files_within(self, folder: Path, files: list[PromptFile], limit: int, config: GenerationConfig) -> list[PromptFile]:
+        # Pool sorted by precomputed length, so a budget cut is one bisect. Templates are
+        # measured after expansion (in _sample_slot), so with expansion on they always pass.
+        tokenizer = config.tokenizer
+        key = (tokenizer.name, config.expand_templates)
+        cached = self._budget_cache.get(folder.name)
+        if cached is None or cached[0] is not files or cached[1] != key:
+            plain, templates = [], []
+            for f in files:
+                (templates if config.expand_templates and f.template() is not None else plain).append(f)
+            ordered = sorted(plain, key=lambda f: f.token_count(tokenizer))
+            cached = (files, key, ordered, [f.token_count(tokenizer) for f in ordered], templates)
+            self._budget_cache[folder.name] = cached
+        within = cached[2][: bisect.bisect_right(cached[3], limit)]
+        return within + cached[4] if cached[4] else within
+
+    def _draw_file(
+        self, folder: Path, config: GenerationConfig, rand: CallRandom, limit: int | None = None
+    ) -> PromptFile | None:
+        files = self._sampling_files(folder, config.exclude_near_duplicates)
+        if files and limit is not None:
+            files = self._files_within(folder, files, limit, config)
+            if not files:
+                raise _OverBudget()
+        if not files:
+            return None
+        if not config.avoid_repeats:
+            return rand.rng.choice(files)
+        return self.repeats.pick(folder.name, files, rand.rng)
+
+    @staticmethod
+    def _kept_tokens(sp: SlotPlan, text: str, tokens: int) -> int:
+        # Length of a slot text that _sample_slot keeps as is (locked, or nothing to draw from).
+        if sp.active and text and (sp.lock or (sp.mode != "None" and not sp.folders)):
+            return tokens
+        return 0
+
+    def _sample_slot(
+        self,
+        sp: SlotPlan,
+        current_text: str,
+        batch_used: set[str],
+        config: GenerationConfig,
+        rand: CallRandom,
+        limit: int | None = None,
+        current_tokens: int = 0,
+    ) -> tuple[str, str, int]:
+        # (text, source, length); length is only measured when a budget `limit` is given.
+        if not sp.active:
+            return "", "", 0
+        if sp.lock and current_text:
+            if limit is not None and current_tokens > limit:
+                raise _OverBudget()
+            return current_text, "", current_tokens
+        if sp.mode == "None":
+            return "", "", 0
+        if not sp.folders:
+            if current_text:
+                if limit is not None and current_tokens > limit:
+                    raise _OverBudget()
+                return current_text, "", current_tokens
+            raise ValueError(f"No folders found for slot: {sp.label}")
+        folder = sp.choose_folder(rand)
+        if config.only_one_per_folder:
+            tries = 0
+            while folder.name in batch_used and tries < 50:
+                folder = rand.rng.choice(sp.folders)
+                tries += 1
+            batch_used.add(folder.name)
+        picked = self._draw_file(folder, config, rand, limit)
+        if not picked:
+            return "", "", 0
+        text = self._expand_file(picked, folder.name, config, rand)
+        tokens = 0
+        if limit is not None:
+            # Plain files use their stored count; only expanded templates are measured.
+            compiled = picked.template() if config.expand_templates else None
+            tokens = picked.token_count(config.tokenizer) if compiled is None else config.tokenizer.count(text)
+            if tokens > limit:
+                raise _OverBudget()
+        return text, f"{folder.name}\\{picked.name}", tokens
+
+    def _expand_file(self, picked: PromptFile, folder_name: str, config: GenerationConfig, rand: CallRandom) -> str:
+        compiled = picked.template() if config.expand_templates else None
+        if compiled is None:
+            return picked.text.strip()
+
+        def resolve(name, rng):
+            # Same draw as a slot: near-duplicate exclusion and avoid-repeats apply.
+            folder = self.index.folder(name)
+            f = self._draw_file(folder, config, rand) if folder is not None else None
+            if f is None:
+                return None
+            return f.text.strip(), f.template()
+
+        return expand(compiled, rand.rng, resolve, (folder_name,)).strip()
+
+    def _iter_sample(self, plan: GenerationPlan, slot_texts: dict[str, str | list[str]], rand: CallRandom):
+        # Yields (slot_texts, slot_sources, composed_set) per set; per-batch state (one per
+        # folder, duplicate suppression) spans the whole run.
+        config = plan.config
+        batch_used = {sp.slot_id: set() for sp in plan.slots}
+
+        seen = self.emitted_sets() if config.suppress_duplicate_sets else None
+        # Current slot text: one string for every set, or a list with one entry per set
+        # (short lists repeat their last entry).
+        current = {}
+        for sp in plan.slots:
+            value = slot_texts.get(sp.slot_id, "") or ""
+            values = [value] if isinstance(value, str) else list(value) or [""]
+            current[sp.slot_id] = [str(v or "").strip() for v in values]
+
+        budget = config.token_budget
+        current_tokens = {}
+        if budget:
+            current_tokens = {k: [config.tokenizer.count(v) if v else 0 for v in vals] for k, vals in current.items()}
+        retry = seen is not None or budget
+        tries = max(DUPLICATE_MAX_TRIES if seen is not None else 1, BUDGET_MAX_TRIES if budget else 1)
 
         try:
-            mode = "a" if append_output else "w"
-            existed = self.output_path.exists()
-            with self.output_path.open(mode, encoding="utf-8") as f:
-                if mode == "a" and existed:
+            for idx in range(config.n):
+                set_tries, fits = tries, bool(budget)
+                if budget:
+                    # Kept texts alone over the budget: no redraw can fit, so skip straight
+                    # to the unbudgeted draw.
+                    kept = 0
+                    for sp in plan.slots:
+                        j = min(idx, len(current[sp.slot_id]) - 1)
+                        kept += self._kept_tokens(sp, current[sp.slot_id][j], current_tokens[sp.slot_id][j])
+                    if kept > budget:
+                        set_tries, fits = (DUPLICATE_MAX_TRIES if seen is not None else 1), False
+                for attempt in range(set_tries):
+                    used = {k: set(v) for k, v in batch_used.items()} if retry else batch_used
+                    # Slots fill the set's budget in order; a set that does not fit is redrawn.
+                    # The last attempt ignores the budget so every set gets a result.
+                    remaining = budget if fits and attempt < set_tries - 1 else None
+                    row = {}
+                    try:
+                        for sp in plan.slots:
+                            vals = current[sp.slot_id]
+                            j = min(idx, len(vals) - 1)
+                            text, source, tokens = self._sample_slot(
+                                sp,
+                                vals[j],
+                                used[sp.slot_id],
+                                config,
+                                rand,
+                                remaining,
+                                current_tokens[sp.slot_id][j] if budget else 0,
+                            )
+                            row[sp.slot_id] = (text, source)
+                            if remaining is not None:
+                                remaining -= tokens
+                    except _OverBudget:
+                        continue
+                    # After DUPLICATE_MAX_TRIES the last draw is kept even if it was seen before.
+                    if seen is None or seen.add_if_new(self._set_key(row)):
+                        break
+                if retry:
+                    batch_used = used
+                # Composed set from enabled slots
+                parts = []
+                for sp in plan.slots:
+                    text = row[sp.slot_id][0].strip()
+                    if sp.active and text:
+                        parts.append(text)
+                yield (
+                    {k: v[0] for k, v in row.items()},
+                    {k: v[1] for k, v in row.items()},
+                    "\n".join(parts).strip(),
+                )
+        finally:
+            if seen is not None:
+                seen.flush()
+
+    def _sample_sets(self, plan: GenerationPlan, slot_texts: dict[str, str | list[str]], rand: CallRandom) -> Batch:
+        batch = Batch({sp.slot_id: [] for sp in plan.slots}, {sp.slot_id: [] for sp in plan.slots})
+        for texts, sources, composed in self._iter_sample(plan, slot_texts, rand):
+            batch.append(texts, sources, composed)
+        return batch
+
+    def generate_batch(
+        self,
+        config: GenerationConfig | None = None,
+        slot_texts: dict[str, str | list[str]] | None = None,
+        write_output: bool = False,
+    ) -> Batch:
+        # generate_config without the joined text: the batch as lists. With `write_output`
+        # the composed sets are written and the batch is recorded, as generate_config does.
+        with self.stats.call("generate_batch") as call:
+            self._wait_meta()
+            config = config or self.generation_config()
+            plan = self.generation_plan(config=config)
+            call.phase("plan")
+            batch = self._sample_sets(plan, slot_texts or {}, CallRandom(config.seed))
+            call.phase("sample")
+            if write_output:
+                self.write_output(batch.text(), config.append_output)
+                self.record_batch(config, batch)
+                call.phase("write")
+            return batch
+
+    def iter_sets(self, config: GenerationConfig | None = None, slot_texts: dict[str, str | list[str]] | None = None):
+        # Lazy generate_config for large batches: sets are drawn as the caller consumes them,
+        # so a consumer can show the first sets (or stop) before the batch is complete.
+        # Nothing is written.
+        with self.stats.call("iter_sets") as call:
+            self._wait_meta()
+            config = config or self.generation_config()
+            plan = self.generation_plan(config=config)
+            call.phase("plan")
+            yield from self._iter_sample(plan, slot_texts or {}, CallRandom(config.seed))
+            call.phase("sample")
+
+    def sample_sets(
+        self,
+        slots: list[dict] | None = None,
+        slot_texts: dict[str, str] | None = None,
+        n: int | None = None,
+        skip_minimized: bool = False,
+        config: GenerationConfig | None = None,
+    ) -> list[tuple[dict[str, str], dict[str, str], str]]:
+        # Like generate_slots, but per set: (slot_texts, slot_sources, composed_set). Nothing is written.
+        with self.stats.call("sample_sets") as call:
+            self._wait_meta()
+            if config is None:
+                config = self.generation_config(slots, skip_minimized, n)
+            elif n is not None:
+                config = replace(config, n=max(1, int(n)))
+            plan = self.generation_plan(config=config)
+            call.phase("plan")
+            batch = self._sample_sets(plan, slot_texts or {}, CallRandom(config.seed))
+            call.phase("sample")
+            return [batch.row(i) for i in range(batch.n)]
+
+    def generate_slot(
+        self,
+        slot_id: str,
+        n: int | None = None,
+        current_text: str | list[str] = "",
+        skip_minimized: bool = False,
+        seed: int | None = None,
+        context: Batch | None = None,
+    ) -> tuple[list[str], list[str]]:
+        # Samples one slot only: no settings are changed and other slots' pools are not compiled.
+        # `context` holds the other slots' sets, so never-repeat checks see the whole new set.
+        with self.stats.call("generate_slot") as call:
+            self._wait_meta()
+            slot = next((sl for sl in self.get_slots() if sl["id"] == slot_id), None)
+            if slot is None:
+                raise ValueError(f"Unknown slot: {slot_id}")
+            config = self.generation_config([slot], skip_minimized, n, seed)
+            sp = self._slot_plan(config.slots[0], config)
+            call.phase("plan")
+
+            rand = CallRandom(config.seed)
+            # One text for every set, or one per set as in _iter_sample.
+            values = [current_text] if isinstance(current_text, str) else list(current_text) or [""]
+            current = [str(v or "").strip() for v in values]
+            budget = config.token_budget
+            current_tokens = [config.tokenizer.count(v) if budget and v else 0 for v in current]
+            seen = self.emitted_sets() if config.suppress_duplicate_sets else None
+            others = {}
+            if context is not None:
+                others = {sid: vals for sid, vals in context.slots.items() if sid != slot_id and vals}
+            retry = seen is not None or budget
+            tries = max(DUPLICATE_MAX_TRIES if seen is not None else 1, BUDGET_MAX_TRIES if budget else 1)
+            texts, sources = [], []
+            batch_used = set()
+            try:
+                for idx in range(config.n):
+                    j = min(idx, len(current) - 1)
+                    set_tries, fits = tries, bool(budget)
+                    if budget and self._kept_tokens(sp, current[j], current_tokens[j]) > budget:
+                        set_tries, fits = (DUPLICATE_MAX_TRIES if seen is not None else 1), False
+                    for attempt in range(set_tries):
+                        used = set(batch_used) if retry else batch_used
+                        # With a budget the slot alone must fit; the last attempt ignores it.
+                        limit = budget if fits and attempt < set_tries - 1 else None
+                        try:
+                            text, source, _tokens = self._sample_slot(
+                                sp, current[j], used, config, rand, limit, current_tokens[j]
+                            )
+                        except _OverBudget:
+                            continue
+                        if seen is None:
+                            break
+                        row = {}
+                        for sid, vals in others.items():
+                            k = min(idx, len(vals) - 1)
+                            srcs = context.sources.get(sid) or []
+                            row[sid] = (vals[k], srcs[k] if k < len(srcs) else "")
+                        row[slot_id] = (text, source)
+                        # After DUPLICATE_MAX_TRIES the last draw is kept, as in _iter_sample.
+                        if seen.add_if_new(self._set_key(row)):
+                            break
+                    batch_used = used
+                    texts.append(text)
+                    sources.append(source)
+            finally:
+                if seen is not None:
+                    seen.flush()
+            call.phase("sample")
+            return texts, sources
+
+    def reset_repeats(self):
+        self.repeats.clear()
+
+    # ---------- duplicate-set suppression ----------
+    def emitted_sets(self) -> BloomFilter:
+        capacity = int(self.settings.get("duplicate_capacity", 1_000_000) or 1_000_000)
+        fp_rate = float(self.settings.get("duplicate_fp_rate", 0.001) or 0.001)
+        with self._state_lock:
+            if self._emitted_sets is None or self._emitted_params != (capacity, fp_rate):
+                self._emitted_sets = BloomFilter(self.emitted_sets_path, capacity, fp_rate)
+                self._emitted_params = (capacity, fp_rate)
+            return self._emitted_sets
+
+    def clear_emitted_sets(self):
+        seen = self.emitted_sets()
+        seen.clear()
+        seen.flush()
+
+    @staticmethod
+    def _set_key(row: dict[str, tuple[str, str]]) -> str:
+        # Sampled slots are keyed by their source file, locked or kept text by its content.
+        return "\x1f".join(f"{slot_id}={source or text}" for slot_id, (text, source) in sorted(row.items()))
+
+    # ---------- exhaustive combinations ----------
+    def combination_space(
+        self,
+        slots: list[dict] | None = None,
+        slot_texts: dict[str, str] | None = None,
+        unit: str = "file",
+        shuffle: bool = False,
+        seed: int | None = None,
+        skip_minimized: bool = False,
+    ) -> CombinationSpace:
+        # unit="file": every prompt file of every eligible folder is one choice.
+        # unit="folder": every eligible folder is one choice; a file is drawn when iterated.
+        # Inactive/None slots and locked slots with text contribute a single fixed choice.
+        if unit not in ("file", "folder"):
+            raise ValueError(f"Unknown combination unit: {unit}")
+        self._wait_meta()
+        slots = slots if slots is not None else self.get_slots()
+        slot_texts = slot_texts or {}
+        plan = self.generation_plan(slots, skip_minimized)
+        pools = []
+        for sp in plan.slots:
+            current_text = (slot_texts.get(sp.slot_id, "") or "").strip()
+            if not sp.active or sp.mode == "None":
+                items = [("", "")]
+            elif sp.lock and current_text:
+                items = [(current_text, "")]
+            elif not sp.folders:
+                if not current_text:
+                    raise ValueError(f"No folders found for slot: {sp.label}")
+                items = [(current_text, "")]
+            elif unit == "folder":
+                items = list(sp.folders)
+            else:
+                items = [(folder, f) for folder in sp.folders for f in self.index.nonempty_files(folder)]
+            pools.append((sp.slot_id, items))
+        return CombinationSpace(pools, shuffle=shuffle, seed=seed)
+
+    def _resolve_choice(self, choice, rand: CallRandom) -> tuple[str, str]:
+        if isinstance(choice, Path):
+            files = self._sampling_files(choice)
+            if not files:
+                return "", ""
+            picked = rand.rng.choice(files)
+            return picked.text.strip(), f"{choice.name}\\{picked.name}"
+        first, second = choice
+        if isinstance(first, Path):
+            return second.text.strip(), f"{first.name}\\{second.name}"
+        return first, second
+
+    def iter_combinations(
+        self, space: CombinationSpace, start: int = 0, stride: int = 1, limit: int | None = None
+    ):
+        # Yields (slot_texts, slot_sources, composed_set) lazily. Files for unit="folder"
+        # choices are drawn from an RNG seeded with the space's seed.
+        rand = CallRandom(space.seed)
+        for i in space.indices(start, stride, limit):
+            texts, sources, parts = {}, {}, []
+            for slot_id, choice in space.combination(i).items():
+                text, source = self._resolve_choice(choice, rand)
+                texts[slot_id] = text
+                sources[slot_id] = source
+            for slot_id, _items in space.pools:
+                if texts[slot_id]:
+                    parts.append(texts[slot_id])
+            yield texts, sources, "\n".join(parts).strip()
+
+    def export_combinations(
+        self, path: Path, space: CombinationSpace, start: int = 0, stride: int = 1, limit: int | None = None
+    ) -> int:
+        # Streams composed sets to `path`, DIVIDER-separated; returns the number written.
+        count = 0
+        with Path(path).open("w", encoding="utf-8") as f:
+            for _texts, _sources, out in self.iter_combinations(space, start, stride, limit):
+                if count:
                     f.write(DIVIDER)
                 f.write(out)
+                count += 1
+        return count
+
+    def record_batch(self, config: GenerationConfig, batch: Batch, kind: str = "batch") -> int | None:
+        # Appends a batch to the generation history; returns its id (None when disabled).
+        if not bool(self.settings.get("history_enabled", True)):
+            return None
+        record = {
+            "ts": round(time.time(), 3),
+            "kind": kind,
+            "seed": config.seed,
+            "settings_hash": config.settings_hash(),
+        }
+        record.update(batch.to_dict())
+        # Composed sets are rebuilt from the active slots on restore.
+        del record["sets"]
+        record["active"] = [sc.slot_id for sc in config.slots if sc.active]
+        try:
+            self.history.keep = max(0, int(self.settings.get("history_keep", HISTORY_KEEP) or 0))
         except Exception:
-            pass
+            self.history.keep = HISTORY_KEEP
+        try:
+            return self.history.append(record)
+        except Exception:
+            return None
+
+    def history_batch(self, rid: int) -> Batch | None:
+        record = self.history.get(rid)
+        return Batch.from_dict(record) if record is not None else None
 
-        return joined, sources_joined, out
+    def write_output(self, out: str, append: bool | None = None):
+        if append is None:
+            append = bool(self.settings.get("append_output", False))
+        try:
+            mode = "a" if append else "w"
+            with self._output_lock:
+                existed = self.output_path.exists()
+                with self.output_path.open(mode, encoding="utf-8") as f:
+                    if mode == "a" and existed:
+                        f.write(DIVIDER)
+                    f.write(out)
+        except Exception:
+            # UI handles warnings
+            pass
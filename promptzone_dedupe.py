@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import re
+import struct
+
+from promptzone_core import NEAR_DUPLICATES_FILE, PromptZoneCore, load_numpy, load_json, save_json
+
+MINHASH_CACHE_FILE = "minhash_cache.json"
+MINHASH_PRIME = (1 << 31) - 1
+SHINGLE_WORDS = 3
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _stable_hash(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") % MINHASH_PRIME
+
+
+def text_digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> set[int]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {_stable_hash(" ".join(words))} if words else set()
+    return {_stable_hash(" ".join(words[i : i + size])) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    # h_i(x) = (a_i * x + b_i) mod p with p = 2^31 - 1, so a_i * x fits in 64 bits and
+    # the NumPy and pure-Python paths produce identical signatures.
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        self.num_perm = num_perm
+        self.params = []
+        for i in range(num_perm):
+            h = hashlib.blake2b(f"{seed}:{i}".encode("ascii"), digest_size=8).digest()
+            a = int.from_bytes(h[:4], "little") % (MINHASH_PRIME - 1) + 1
+            b = int.from_bytes(h[4:], "little") % MINHASH_PRIME
+            self.params.append((a, b))
+        np = load_numpy()
+        if np is not None:
+            self._a = np.array([a for a, _ in self.params], dtype=np.uint64)
+            self._b = np.array([b for _, b in self.params], dtype=np.uint64)
+
+    def signature(self, text: str) -> tuple[int, ...]:
+        sh = shingles(text)
+        if not sh:
+            return tuple([MINHASH_PRIME] * self.num_perm)
+        np = load_numpy()
+        if np is not None:
+            x = np.fromiter(sh, dtype=np.uint64, count=len(sh))
+            vals = (np.outer(x, self._a) + self._b) % MINHASH_PRIME
+            return tuple(int(v) for v in vals.min(axis=0))
+        return tuple(min((a * x + b) % MINHASH_PRIME for x in sh) for a, b in self.params)
+
+    @staticmethod
+    def encode(sig: tuple[int, ...]) -> str:
+        return base64.b64encode(struct.pack(f"<{len(sig)}I", *sig)).decode("ascii")
+
+    @staticmethod
+    def decode(data: str) -> tuple[int, ...]:
+        raw = base64.b64decode(data)
+        return struct.unpack(f"<{len(raw) // 4}I", raw)
+
+
+def estimate_jaccard(a: tuple[int, ...], b: tuple[int, ...]) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a) if a else 0.0
+
+
+def _find(parent: dict, x):
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+
+def find_near_duplicates(
+    core: PromptZoneCore,
+    threshold: float = 0.7,
+    num_perm: int = 128,
+    bands: int = 32,
+    prefixes: list[str] | None = None,
+) -> dict:
+    # Signatures are cached by text digest in minhash_cache.json, so re-runs only hash
+    # new or edited prompts. LSH banding proposes candidate pairs; each pair is then
+    # confirmed by its estimated Jaccard similarity before clusters are merged.
+    if num_perm % bands:
+        raise ValueError("num_perm must be divisible by bands.")
+    rows = num_perm // bands
+    hasher = MinHasher(num_perm)
+    cache_path = core.root_dir / MINHASH_CACHE_FILE
+    cache = load_json(cache_path, {})
+    if not isinstance(cache, dict) or cache.get("num_perm") != num_perm or cache.get("shingle") != SHINGLE_WORDS:
+        cache = {"num_perm": num_perm, "shingle": SHINGLE_WORDS, "signatures": {}}
+    stored = cache["signatures"]
+    # Digests per folder, so a --prefix run only prunes signatures of the folders it scanned.
+    known_folders = isinstance(cache.get("folders"), dict)
+    folder_digests = cache["folders"] = cache.get("folders") if known_folders else {}
+
+    entries = []
+    scanned = set()
+    hashed = 0
+    for folder in core.index.folders():
+        if prefixes and not any(folder.name.startswith(p) for p in prefixes):
+            continue
+        scanned.add(folder.name)
+        digests = set()
+        for f in core.index.nonempty_files(folder):
+            digest = text_digest(f.text)
+            digests.add(digest)
+            enc = stored.get(digest)
+            if enc is None:
+                enc = MinHasher.encode(hasher.signature(f.text))
+                stored[digest] = enc
+                hashed += 1
+            entries.append((f"{folder.name}/{f.name}", MinHasher.decode(enc)))
+        folder_digests[folder.name] = sorted(digests)
+    if not prefixes:
+        for name in [n for n in folder_digests if n not in scanned]:
+            del folder_digests[name]
+    # A cache written before folder tracking only knows the scanned folders; keep the rest.
+    if known_folders or not prefixes:
+        live = set()
+        for digests in folder_digests.values():
+            live.update(digests)
+        for digest in [d for d in stored if d not in live]:
+            del stored[digest]
+    save_json(cache_path, cache)
+
+    parent = {i: i for i in range(len(entries))}
+    buckets: dict[tuple, list[int]] = {}
+    for i, (_label, sig) in enumerate(entries):
+        for band in range(bands):
+            key = (band,) + tuple(sig[band * rows : (band + 1) * rows])
+            buckets.setdefault(key, []).append(i)
+
+    checked = set()
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        # Each member is checked against the bucket head and its predecessor: linear per
+        # bucket, and enough to join chains of near-identical prompts.
+        for j in range(1, len(members)):
+            for a in {members[0], members[j - 1]}:
+                b = members[j]
+                if (a, b) in checked or _find(parent, a) == _find(parent, b):
+                    continue
+                checked.add((a, b))
+                if estimate_jaccard(entries[a][1], entries[b][1]) >= threshold:
+                    parent[_find(parent, b)] = _find(parent, a)
+
+    groups: dict[int, list[str]] = {}
+    for i, (label, _sig) in enumerate(entries):
+        groups.setdefault(_find(parent, i), []).append(label)
+    clusters = sorted((sorted(g) for g in groups.values() if len(g) > 1), key=lambda g: (-len(g), g[0]))
+
+    slot_prefixes = [s.get("prefix", "") for s in core.get_slots() if s.get("prefix")]
+    by_prefix: dict[str, int] = {}
+    for cluster in clusters:
+        name = cluster[0].split("/", 1)[0]
+        prefix = next((p for p in slot_prefixes if name.startswith(p)), "other")
+        by_prefix[prefix] = by_prefix.get(prefix, 0) + 1
+    return {
+        "prefixes": list(prefixes) if prefixes else None,
+        "files": len(entries),
+        "hashed": hashed,
+        "threshold": threshold,
+        "num_perm": num_perm,
+        "bands": bands,
+        "clusters": clusters,
+        "clusters_by_prefix": by_prefix,
+        "duplicates": sum(len(c) - 1 for c in clusters),
+    }
+
+
+def save_exclusions(core: PromptZoneCore, report: dict):
+    # Every cluster keeps its first member; the rest are hidden from sampling. A --prefix
+    # report only replaces the exclusions under its prefixes.
+    prefixes = report.get("prefixes")
+    hidden = set(label for cluster in report.get("clusters", []) for label in cluster[1:])
+    if prefixes:
+        previous = load_json(core.root_dir / NEAR_DUPLICATES_FILE, [])
+        for label in previous if isinstance(previous, list) else []:
+            if not any(str(label).startswith(p) for p in prefixes):
+                hidden.add(label)
+    hidden = sorted(hidden)
+    save_json(core.root_dir / NEAR_DUPLICATES_FILE, hidden)
+    core.settings["exclude_near_duplicates"] = True
+    core.save_settings()
+    core.reload_near_duplicates()
+    return hidden
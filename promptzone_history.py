@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from pathlib import Path
+import json
+import os
+import re
+import threading
+
+# Append-only generation history.
+#   history.jsonl  one record per generated batch:
+#                  {"ts", "kind", "seed", "settings_hash", "n", "active": [slot ids],
+#                   "slots": {slot_id: [texts]}, "sources": {slot_id: [sources]}}
+#                  Composed sets are rebuilt from the active slots; older records carry "sets".
+#   history.idx    one summary line per record (offset/length in the log, ts, n, seed, preview),
+#                  so paging never parses whole batches and a restore reads exactly one record.
+#   history.words  word -> record ids for search, with the number of records it covers.
+#   history.wlog   one {"id", "words"} line per record appended since history.words was
+#                  written; merged into it (and emptied) when the log is compacted.
+# Record ids are positions in the index (0 = oldest). A missing or short index is rebuilt
+# from the log; a torn last log line is skipped. With `keep` set, the oldest records are
+# dropped once the log holds a quarter more than that (ids then shift).
+
+HISTORY_PAGE = 50
+PREVIEW_CHARS = 160
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _words(text: str) -> set[str]:
+    return {w.lower() for w in _WORD_RE.findall(text or "")}
+
+
+def _first_set(record: dict) -> str:
+    sets = record.get("sets")
+    if sets is not None:
+        return next((s for s in sets if str(s).strip()), "")
+    slots = record.get("slots") or {}
+    parts = [str((slots.get(sid) or [""])[0]).strip() for sid in record.get("active") or slots]
+    return "\n".join(p for p in parts if p)
+
+
+def _record_words(record: dict) -> set[str]:
+    words = set()
+    for text in record.get("sets") or []:
+        words |= _words(text)
+    for texts in (record.get("slots") or {}).values():
+        for text in texts or []:
+            words |= _words(text)
+    for sources in (record.get("sources") or {}).values():
+        for source in sources or []:
+            words |= _words(source)
+    return words
+
+
+def _append_lines(path: Path, data: bytes):
+    # Appends after a torn last line instead of extending it; returns where `data` starts.
+    with path.open("a+b") as f:
+        f.seek(0, 2)
+        pos = f.tell()
+        if pos:
+            f.seek(pos - 1)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+                pos += 1
+        f.write(data)
+    return pos
+
+
+def _replace(path: Path, data: bytes):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class HistoryStore:
+    def __init__(self, path: Path, keep: int = 0):
+        self.path = Path(path)
+        self.index_path = self.path.with_suffix(".idx")
+        self.words_path = self.path.with_suffix(".words")
+        self.wlog_path = self.path.with_suffix(".wlog")
+        self.keep = keep
+        self._lock = threading.RLock()
+        self._entries: list[dict] | None = None
+        # Word -> record ids; loaded from history.words and .wlog on the first search, then
+        # kept current.
+        self._word_ids: dict[str, set[int]] | None = None
+        self._words_count = 0
+        self._vocab: list[str] | None = None
+
+    @staticmethod
+    def _summary(record: dict, offset: int, length: int) -> dict:
+        return {
+            "offset": offset,
+            "length": length,
+            "ts": record.get("ts", 0),
+            "kind": record.get("kind", "batch"),
+            "n": int(record.get("n") or len(record.get("sets") or [])),
+            "seed": record.get("seed"),
+            "preview": " ".join(str(_first_set(record)).split())[:PREVIEW_CHARS],
+        }
+
+    def _load(self) -> list[dict]:
+        if self._entries is not None:
+            return self._entries
+        entries = []
+        try:
+            with self.index_path.open("rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        entries.append(json.loads(line))
+                    except Exception:
+                        break
+        except OSError:
+            pass
+        try:
+            size = self.path.stat().st_size
+        except OSError:
+            size = 0
+        end = entries[-1]["offset"] + entries[-1]["length"] if entries else 0
+        rewrite = end > size
+        if rewrite:
+            # The log was replaced or truncated: the index no longer describes it.
+            entries, end = [], 0
+            self._drop_word_index()
+        missing = []
+        if end < size:
+            with self.path.open("rb") as f:
+                f.seek(end)
+                pos = end
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except Exception:
+                        record = None
+                    if isinstance(record, dict):
+                        missing.append(self._summary(record, pos, len(line)))
+                    pos += len(line)
+        entries.extend(missing)
+        if rewrite or missing:
+            try:
+                mode = "wb" if rewrite else "ab"
+                with self.index_path.open(mode) as f:
+                    for entry in entries if rewrite else missing:
+                        f.write(self._line(entry))
+            except OSError:
+                pass
+        self._entries = entries
+        return entries
+
+    @staticmethod
+    def _line(obj: dict) -> bytes:
+        return (json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._load())
+
+    def append(self, record: dict) -> int:
+        line = self._line(record)
+        with self._lock:
+            entries = self._load()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            pos = _append_lines(self.path, line)
+            entry = self._summary(record, pos, len(line))
+            with self.index_path.open("ab") as f:
+                f.write(self._line(entry))
+            rid = len(entries)
+            entries.append(entry)
+            words = _record_words(record)
+            self._log_words([(rid, words)])
+            if self._word_ids is not None and self._words_count == rid:
+                self._add_words(rid, words)
+                self._words_count = rid + 1
+            if self.keep and len(entries) > self.keep + max(1, self.keep // 4):
+                rid -= self._compact(len(entries) - self.keep)
+            return rid
+
+    def _compact(self, drop: int) -> int:
+        # Rewrites the log without its `drop` oldest records; returns how many were dropped.
+        entries = self._load()
+        base = entries[drop]["offset"]
+        with self.path.open("rb") as f:
+            f.seek(base)
+            tail = f.read()
+        kept = [dict(e, offset=e["offset"] - base) for e in entries[drop:]]
+        # Ids shift: the old word files go first, so a crash leaves no stale ids behind.
+        self._drop_word_index()
+        _replace(self.path, tail)
+        _replace(self.index_path, b"".join(self._line(e) for e in kept))
+        self._entries = kept
+        # The kept records are in memory already; index them and save one whole file.
+        self._word_ids, self._vocab = {}, None
+        for rid, e in enumerate(kept):
+            try:
+                record = json.loads(tail[e["offset"] : e["offset"] + e["length"]])
+            except Exception:
+                continue
+            if isinstance(record, dict):
+                self._add_words(rid, _record_words(record))
+        self._words_count = len(kept)
+        self._save_word_index()
+        return drop
+
+    def summary(self, rid: int) -> dict | None:
+        with self._lock:
+            entries = self._load()
+            return dict(entries[rid], id=rid) if 0 <= rid < len(entries) else None
+
+    def _read(self, f, entry: dict) -> dict | None:
+        f.seek(entry["offset"])
+        try:
+            record = json.loads(f.read(entry["length"]))
+        except Exception:
+            return None
+        return record if isinstance(record, dict) else None
+
+    def get(self, rid: int) -> dict | None:
+        with self._lock:
+            entries = self._load()
+            if not 0 <= rid < len(entries):
+                return None
+            try:
+                with self.path.open("rb") as f:
+                    record = self._read(f, entries[rid])
+            except OSError:
+                return None
+        if record is None:
+            return None
+        record["id"] = rid
+        return record
+
+    def latest(self) -> dict | None:
+        n = len(self)
+        return self.get(n - 1) if n else None
+
+    def page(self, page: int = 0, size: int = HISTORY_PAGE) -> list[dict]:
+        # Summaries, newest first.
+        with self._lock:
+            total = len(self._load())
+            hi = total - page * size
+            return [self.summary(rid) for rid in range(hi - 1, max(0, hi - size) - 1, -1)]
+
+    def _add_words(self, rid: int, words: set[str]):
+        for word in words:
+            ids = self._word_ids.get(word)
+            if ids is None:
+                ids = self._word_ids[word] = set()
+                self._vocab = None
+            ids.add(rid)
+
+    def _log_words(self, items: list[tuple[int, set[str]]]):
+        data = b"".join(self._line({"id": rid, "words": sorted(words)}) for rid, words in items)
+        try:
+            _append_lines(self.wlog_path, data)
+        except OSError:
+            pass
+
+    def _save_word_index(self):
+        data = {"count": self._words_count, "words": {w: sorted(ids) for w, ids in self._word_ids.items()}}
+        try:
+            _replace(self.words_path, json.dumps(data, separators=(",", ":")).encode("utf-8"))
+            self.wlog_path.unlink(missing_ok=True)
+        except OSError:
+            pass
+
+    def _drop_word_index(self):
+        self._word_ids = None
+        self._words_count = 0
+        self._vocab = None
+        for path in (self.words_path, self.wlog_path):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def _ensure_word_index(self):
+        entries = self._load()
+        if self._word_ids is None:
+            self._word_ids, self._words_count = {}, 0
+            self._vocab = None
+            saved = False
+            try:
+                data = json.loads(self.words_path.read_text(encoding="utf-8"))
+                count = int(data["count"])
+                if count <= len(entries):
+                    self._word_ids = {w: set(ids) for w, ids in data["words"].items()}
+                    self._words_count = count
+                    saved = True
+            except Exception:
+                pass
+            if not saved:
+                # Deltas only extend a saved index.
+                self._drop_word_index()
+                self._word_ids = {}
+            else:
+                # Lines are applied in id order; repeats and lines past a gap are skipped
+                # (the gap is filled from the log below and logged again).
+                try:
+                    with self.wlog_path.open("rb") as f:
+                        for line in f:
+                            try:
+                                delta = json.loads(line)
+                            except Exception:
+                                break
+                            if delta.get("id") == self._words_count and self._words_count < len(entries):
+                                self._add_words(self._words_count, set(delta.get("words") or []))
+                                self._words_count += 1
+                except OSError:
+                    pass
+        if self._words_count >= len(entries):
+            return
+        # Only records not covered by the saved index and its deltas are read.
+        start = self._words_count
+        added = []
+        try:
+            with self.path.open("rb") as f:
+                for rid in range(start, len(entries)):
+                    record = self._read(f, entries[rid])
+                    words = _record_words(record) if record is not None else set()
+                    self._add_words(rid, words)
+                    added.append((rid, words))
+        except OSError:
+            pass
+        self._words_count = len(entries)
+        if start == 0:
+            self._save_word_index()
+        else:
+            self._log_words(added)
+
+    def search(self, query: str) -> list[int]:
+        # Ids whose sets or sources contain every query word (as a word prefix), newest first.
+        terms = sorted(_words(query), key=len, reverse=True)
+        with self._lock:
+            if not terms:
+                return list(range(len(self._load()) - 1, -1, -1))
+            self._ensure_word_index()
+            if self._vocab is None:
+                self._vocab = sorted(self._word_ids)
+            hits = None
+            for term in terms:
+                ids = set()
+                i = bisect_left(self._vocab, term)
+                while i < len(self._vocab) and self._vocab[i].startswith(term):
+                    ids |= self._word_ids[self._vocab[i]]
+                    i += 1
+                hits = ids if hits is None else hits & ids
+                if not hits:
+                    return []
+        return sorted(hits, reverse=True)
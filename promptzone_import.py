@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from pathlib import Path
+import csv
+import json
+import re
+
+IMPORT_FORMATS = ("jsonl", "csv", "md")
+
+_SECTION_RE = re.compile(r"^\s*-{3,}\s*$")
+_HEADING_RE = re.compile(r"^\s*#{1,6}\s+(.+?)\s*$")
+
+
+def _record(category, text, tags=None, media=None, base: Path | None = None) -> dict:
+    media = str(media or "").strip()
+    if media and base is not None and not Path(media).is_absolute():
+        media = str(base / media)
+    return {"category": str(category or "").strip(), "text": str(text or "").strip(), "tags": tags or [], "media": media}
+
+
+def read_jsonl(path: Path, category: str = ""):
+    # One object per line: {"category", "text" | "prompt", "tags", "media"}.
+    path = Path(path)
+    with path.open("r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except Exception:
+                yield _record("", "")
+                continue
+            if not isinstance(obj, dict):
+                yield _record("", "")
+                continue
+            yield _record(
+                obj.get("category") or obj.get("folder") or category,
+                obj.get("text") or obj.get("prompt"),
+                obj.get("tags"),
+                obj.get("media"),
+                path.parent,
+            )
+
+
+def read_csv(path: Path, category: str = ""):
+    # Header row with category,text[,tags][,media]; tags split on ";" or ",".
+    path = Path(path)
+    with path.open("r", encoding="utf-8", errors="ignore", newline="") as f:
+        for row in csv.DictReader(f):
+            row = {str(k or "").strip().lower(): v for k, v in row.items()}
+            yield _record(
+                row.get("category") or row.get("folder") or category,
+                row.get("text") or row.get("prompt"),
+                row.get("tags") or "",
+                row.get("media"),
+                path.parent,
+            )
+
+
+def read_markdown(path: Path, category: str = ""):
+    # Sections separated by lines of dashes (the output divider works too). A heading
+    # line ("## CLOTHES_DRESSES") switches the category for that and later sections.
+    path = Path(path)
+    current = category
+    lines: list[str] = []
+
+    def section():
+        nonlocal current
+        body = []
+        for ln in lines:
+            if not body and not ln.strip():
+                continue
+            m = _HEADING_RE.match(ln)
+            if m and not body:
+                current = m.group(1)
+                continue
+            body.append(ln)
+        text = "\n".join(body).strip()
+        return _record(current, text) if text else None
+
+    with path.open("r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if _SECTION_RE.match(line):
+                rec = section()
+                if rec is not None:
+                    yield rec
+                lines = []
+                continue
+            lines.append(line)
+    rec = section()
+    if rec is not None:
+        yield rec
+
+
+def iter_records(path: Path, fmt: str | None = None, category: str = ""):
+    path = Path(path)
+    fmt = (fmt or path.suffix.lstrip(".")).lower()
+    if fmt in ("jsonl", "ndjson"):
+        return read_jsonl(path, category)
+    if fmt == "csv":
+        return read_csv(path, category)
+    if fmt in ("md", "markdown", "txt"):
+        return read_markdown(path, category)
+    raise ValueError(f"Unknown import format: {fmt}")
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from pathlib import Path
+import json
+import os
+import sqlite3
+import time
+
+from promptzone_core import PACK_FORMAT, PromptZoneCore
+
+PACK_EXTENSION = ".pzpack"
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE folders (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE files (
+    folder_id INTEGER NOT NULL REFERENCES folders(id),
+    pos INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (folder_id, pos)
+) WITHOUT ROWID;
+"""
+
+
+def export_pack(core: PromptZoneCore, out_path: Path) -> dict:
+    # Snapshot of the library (folders, prompt texts in library order, tags, weights).
+    # Written to a temp file and renamed, so a pack is never observed half-written.
+    core.wait_ready()
+    out_path = Path(out_path)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    if tmp.exists():
+        tmp.unlink()
+    db = sqlite3.connect(str(tmp))
+    folders = files = size = 0
+    try:
+        db.execute("PRAGMA page_size=4096")
+        db.execute("PRAGMA journal_mode=OFF")
+        db.execute("PRAGMA synchronous=OFF")
+        db.executescript(_SCHEMA)
+        with db:
+            for folder in core.index.folders():
+                cur = db.execute("INSERT INTO folders (name) VALUES (?)", (folder.name,))
+                folder_id = cur.lastrowid
+                rows = []
+                for pos, f in enumerate(core.index.prompt_files(folder)):
+                    rows.append((folder_id, pos, f.name, f.text))
+                    size += len(f.text)
+                db.executemany("INSERT INTO files (folder_id, pos, name, text) VALUES (?, ?, ?, ?)", rows)
+                folders += 1
+                files += len(rows)
+            meta = {
+                "format": str(PACK_FORMAT),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "tags": json.dumps(core.tags_map, ensure_ascii=False),
+                "weights": json.dumps(core.weights_map, ensure_ascii=False),
+            }
+            db.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", list(meta.items()))
+        db.execute("VACUUM")
+    finally:
+        db.close()
+    os.replace(tmp, out_path)
+    return {"path": str(out_path), "folders": folders, "files": files, "text_chars": size}
@@ -1,29 +1,43 @@
 ﻿
 from __future__ import annotations
 
+import time
+
+_IMPORT_T0 = time.perf_counter()
+
 import sys
 import ctypes
 from ctypes import wintypes
+from collections import deque
 from pathlib import Path
 import shutil
+import threading
 
 from PySide6 import QtCore, QtGui, QtWidgets
-try:
-    from PySide6 import QtMultimedia, QtMultimediaWidgets
-except Exception:
-    QtMultimedia = None
-    QtMultimediaWidgets = None
 
-try:
-    import qdarktheme
-except Exception:
-    qdarktheme = None
+# Optional modules are imported on first use (video preview / qdarktheme) to keep startup fast.
+QtMultimedia = None
+QtMultimediaWidgets = None
+qdarktheme = None
+_multimedia_loaded = False
+_qdarktheme_loaded = False
 
-from promptzone_core import PromptZoneCore, PROMPT_TEXT_EXTENSIONS
+from promptzone_core import Batch, MAX_SETS, PromptZoneCore, PROMPT_TEXT_EXTENSIONS, join_sets, new_seed, split_sets
+from promptzone_history import HISTORY_PAGE
 
 APP_TITLE = "PromptZone"
 DIVIDER = "\n\n" + ("-" * 48) + "\n\n"
 
+# Slot boxes and the output box show one page of sets; larger batches stream in from a worker.
+OUTPUT_PAGE_SETS = 50
+STREAM_CHUNK_SETS = 50
+STREAM_CHUNK_S = 0.1
+# Slot edits are applied once typing pauses; larger edits re-render the page instead of patching it.
+SLOT_EDIT_DEBOUNCE_MS = 150
+OUTPUT_PATCH_MAX_SETS = 8
+# Session state (last slot texts, geometry) is written on this interval and on exit.
+SESSION_FLUSH_MS = 2000
+
 DEFAULT_SLOTS = [
     {"id": "slot_1", "label": "SLOT_1", "prefix": "SLOT_1_", "enabled": True, "minimized": False},
 ]
@@ -286,6 +300,7 @@ ICON_FILES = {
     "browse": "folder_open",
     "clear": "delete_sweep",
     "reset": "history",
+    "history": "history",
     "exclude_tag": "delete_sweep",
     "new_category": "create_new_folder",
     "new_prompt": "note_add",
@@ -355,6 +370,59 @@ class LimitText(QtWidgets.QPlainTextEdit):
     pass
 
 
+def _load_multimedia() -> bool:
+    global QtMultimedia, QtMultimediaWidgets, _multimedia_loaded
+    if not _multimedia_loaded:
+        _multimedia_loaded = True
+        try:
+            from PySide6 import QtMultimedia as multimedia, QtMultimediaWidgets as multimedia_widgets
+        except Exception:
+            multimedia = None
+            multimedia_widgets = None
+        QtMultimedia = multimedia
+        QtMultimediaWidgets = multimedia_widgets
+    return QtMultimedia is not None and QtMultimediaWidgets is not None
+
+
+def _load_qdarktheme():
+    global qdarktheme, _qdarktheme_loaded
+    if not _qdarktheme_loaded:
+        _qdarktheme_loaded = True
+        try:
+            import qdarktheme as module
+        except Exception:
+            module = None
+        qdarktheme = module
+    return qdarktheme
+
+
+class StartupProfile:
+    def __init__(self, enabled: bool = False, t0: float | None = None):
+        self.enabled = bool(enabled)
+        self._t0 = t0 if t0 is not None else time.perf_counter()
+        self._last = self._t0
+        self._reported = False
+        self.phases: list[tuple[str, float]] = []
+
+    def mark(self, phase: str):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self, stream=None):
+        if not self.enabled or self._reported:
+            return
+        self._reported = True
+        stream = stream or sys.stderr
+        width = max([len(name) for name, _ in self.phases] + [5])
+        for name, dt in self.phases:
+            stream.write(f"[startup] {name:<{width}} {dt * 1000.0:8.1f} ms\n")
+        stream.write(f"[startup] {'total':<{width}} {(self._last - self._t0) * 1000.0:8.1f} ms\n")
+        stream.flush()
+
+
 def app_root() -> Path:
     if getattr(sys, "frozen", False):
         return Path(sys.executable).resolve().parent
@@ -397,8 +465,8 @@ def _resolve_core_from_widget(widget: QtWidgets.QWidget):
 def _restore_popup_geometry(widget: QtWidgets.QWidget, key: str, fallback_size: QtCore.QSize | None = None):
     restored = False
     core = _resolve_core_from_widget(widget)
-    if core is not None and isinstance(getattr(core, "settings", None), dict):
-        pop = core.settings.get("popup_geometry", {})
+    if core is not None and getattr(core, "session", None) is not None:
+        pop = core.session.get("popup_geometry", {})
         if isinstance(pop, dict):
             enc = pop.get(key)
             if isinstance(enc, str) and enc.strip():
@@ -421,24 +489,23 @@ def _restore_popup_geometry(widget: QtWidgets.QWidget, key: str, fallback_size:
 
 def _save_popup_geometry(widget: QtWidgets.QWidget, key: str):
     core = _resolve_core_from_widget(widget)
-    if core is None or not isinstance(getattr(core, "settings", None), dict):
+    if core is None or getattr(core, "session", None) is None:
         return
-    pop = core.settings.get("popup_geometry", {})
+    pop = dict(core.session.get("popup_geometry", {}) or {})
     if not isinstance(pop, dict):
         pop = {}
     try:
         pop[key] = bytes(widget.saveGeometry().toBase64()).decode("ascii")
     except Exception:
         return
-    core.settings["popup_geometry"] = pop
-    core.save_settings()
+    core.session.set("popup_geometry", pop)
 
 
 def _restore_popup_splitter(splitter: QtWidgets.QSplitter, key: str, fallback_sizes: list[int] | None = None):
     restored = False
     core = _resolve_core_from_widget(splitter)
-    if core is not None and isinstance(getattr(core, "settings", None), dict):
-        pop = core.settings.get("popup_splitters", {})
+    if core is not None and getattr(core, "session", None) is not None:
+        pop = core.session.get("popup_splitters", {})
         if isinstance(pop, dict):
             enc = pop.get(key)
             if isinstance(enc, str) and enc.strip():
@@ -457,17 +524,16 @@ def _restore_popup_splitter(splitter: QtWidgets.QSplitter, key: str, fallback_si
 
 def _save_popup_splitter(splitter: QtWidgets.QSplitter, key: str):
     core = _resolve_core_from_widget(splitter)
-    if core is None or not isinstance(getattr(core, "settings", None), dict):
+    if core is None or getattr(core, "session", None) is None:
         return
-    pop = core.settings.get("popup_splitters", {})
+    pop = dict(core.session.get("popup_splitters", {}) or {})
     if not isinstance(pop, dict):
         pop = {}
     try:
         pop[key] = bytes(splitter.saveState().toBase64()).decode("ascii")
     except Exception:
         return
-    core.settings["popup_splitters"] = pop
-    core.save_settings()
+    core.session.set("popup_splitters", pop)
 
 
 def _enable_media_player_loop(player):
@@ -562,20 +628,10 @@ class BrowseDialog(QtWidgets.QDialog):
         self.media_label.setObjectName("muted")
         self.media_label.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
         media_layout.addWidget(self.media_label, 1)
+        self._media_layout = media_layout
 
+        # Created on the first video preview (loads QtMultimedia lazily).
         self.video_widget = None
-        if QtMultimediaWidgets is not None:
-            try:
-                self.video_widget = QtMultimediaWidgets.QVideoWidget(self.media_frame)
-                self.video_widget.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
-                try:
-                    self.video_widget.setAspectRatioMode(QtCore.Qt.KeepAspectRatio)
-                except Exception:
-                    pass
-                self.video_widget.setVisible(False)
-                media_layout.addWidget(self.video_widget, 1)
-            except Exception:
-                self.video_widget = None
 
         self.preview = QtWidgets.QPlainTextEdit()
         self.preview.setReadOnly(True)
@@ -655,6 +711,22 @@ class BrowseDialog(QtWidgets.QDialog):
             self._clear_media_preview()
             self.preview.clear()
 
+    def _ensure_video_widget(self):
+        if self.video_widget is not None or not _load_multimedia():
+            return self.video_widget
+        try:
+            self.video_widget = QtMultimediaWidgets.QVideoWidget(self.media_frame)
+            self.video_widget.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
+            try:
+                self.video_widget.setAspectRatioMode(QtCore.Qt.KeepAspectRatio)
+            except Exception:
+                pass
+            self.video_widget.setVisible(False)
+            self._media_layout.addWidget(self.video_widget, 1)
+        except Exception:
+            self.video_widget = None
+        return self.video_widget
+
     def _find_media_preview(self, prompt_path: Path) -> Path | None:
         stem = prompt_path.stem
         folder = prompt_path.parent
@@ -732,7 +804,7 @@ class BrowseDialog(QtWidgets.QDialog):
                 return
 
         if suffix in VIDEO_PREVIEW_EXTENSIONS:
-            if QtMultimedia is None or self.video_widget is None:
+            if self._ensure_video_widget() is None:
                 self.media_label.setText(f"Preview available: {media_path.name}")
                 return
             try:
@@ -798,6 +870,142 @@ class BrowseDialog(QtWidgets.QDialog):
         self.done(2 if lock else 1)
 
 
+class HistoryDialog(QtWidgets.QDialog):
+    def __init__(self, parent, core: PromptZoneCore):
+        super().__init__(parent)
+        self.core = core
+        self.page = 0
+        self.ids: list[int] = []
+        self.rows: list[dict] = []
+        self.selected_id: int | None = None
+
+        self.setWindowFlag(QtCore.Qt.WindowStaysOnTopHint, True)
+        if parent:
+            self.setStyleSheet(parent.styleSheet())
+        self.setAutoFillBackground(True)
+        self.setWindowTitle("History")
+        if parent and hasattr(parent, "_apply_titlebar_to"):
+            parent._apply_titlebar_to(self)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(12, 12, 12, 12)
+        layout.setSpacing(8)
+
+        top = QtWidgets.QHBoxLayout()
+        self.search = QtWidgets.QLineEdit()
+        self.search.setPlaceholderText("Search prompts + sources...")
+        self.btn_copy = QtWidgets.QPushButton("Copy")
+        self.btn_restore = QtWidgets.QPushButton("Restore")
+        top.addWidget(self.search, 1)
+        top.addWidget(self.btn_copy)
+        top.addWidget(self.btn_restore)
+        layout.addLayout(top)
+
+        self.main_split = QtWidgets.QSplitter(QtCore.Qt.Horizontal)
+        self.main_split.setChildrenCollapsible(False)
+        self.main_split.setHandleWidth(6)
+        self.list = QtWidgets.QListWidget()
+        self.preview = QtWidgets.QPlainTextEdit()
+        self.preview.setReadOnly(True)
+        self.preview.setObjectName("slot")
+        self.main_split.addWidget(self.list)
+        self.main_split.addWidget(self.preview)
+        self.main_split.setStretchFactor(0, 1)
+        self.main_split.setStretchFactor(1, 2)
+        layout.addWidget(self.main_split, 1)
+
+        nav = QtWidgets.QHBoxLayout()
+        self.btn_prev = QtWidgets.QPushButton("<")
+        self.btn_next = QtWidgets.QPushButton(">")
+        for b in [self.btn_prev, self.btn_next]:
+            b.setObjectName("iconSquare")
+            b.setFixedSize(26, 26)
+        self.lbl_page = QtWidgets.QLabel("")
+        self.lbl_page.setObjectName("muted")
+        nav.addWidget(self.btn_prev)
+        nav.addWidget(self.btn_next)
+        nav.addWidget(self.lbl_page, 1)
+        layout.addLayout(nav)
+
+        # Searching waits for a pause in typing.
+        self._search_timer = QtCore.QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(200)
+        self._search_timer.timeout.connect(self.refresh)
+        self.search.textChanged.connect(lambda _: self._search_timer.start())
+        self.list.currentRowChanged.connect(self._on_select)
+        self.list.itemDoubleClicked.connect(lambda _: self._restore())
+        self.btn_prev.clicked.connect(lambda: self._show_page(self.page - 1))
+        self.btn_next.clicked.connect(lambda: self._show_page(self.page + 1))
+        self.btn_copy.clicked.connect(self._copy)
+        self.btn_restore.clicked.connect(self._restore)
+
+        self.refresh()
+        self.adjustSize()
+        _restore_popup_geometry(self, "history_dialog", QtCore.QSize(760, 480))
+        QtCore.QTimer.singleShot(
+            0, lambda: _restore_popup_splitter(self.main_split, "history_dialog_splitter", [260, 500])
+        )
+        self.finished.connect(lambda _: self._save_dialog_state())
+
+    def _save_dialog_state(self):
+        _save_popup_splitter(self.main_split, "history_dialog_splitter")
+        _save_popup_geometry(self, "history_dialog")
+
+    def refresh(self):
+        self.ids = self.core.history.search(self.search.text())
+        self._show_page(0)
+
+    def _show_page(self, page: int):
+        pages = max(1, -(-len(self.ids) // HISTORY_PAGE))
+        self.page = max(0, min(page, pages - 1))
+        start = self.page * HISTORY_PAGE
+        self.rows = [r for r in (self.core.history.summary(rid) for rid in self.ids[start : start + HISTORY_PAGE]) if r]
+        self.list.clear()
+        for row in self.rows:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(row.get("ts") or 0))
+            kind = " (slot)" if row.get("kind") == "slot" else ""
+            self.list.addItem(f"#{row['id'] + 1}  {when}  {row.get('n', 0)} sets{kind} - {row.get('preview', '')}")
+        total = len(self.ids)
+        self.lbl_page.setText(f"{start + 1}-{start + len(self.rows)} of {total}" if total else "No history")
+        self.btn_prev.setEnabled(self.page > 0)
+        self.btn_next.setEnabled(self.page < pages - 1)
+        if self.rows:
+            self.list.setCurrentRow(0)
+        else:
+            self.preview.clear()
+
+    def _current(self) -> dict | None:
+        idx = self.list.currentRow()
+        if idx < 0 or idx >= len(self.rows):
+            return None
+        return self.core.history.get(self.rows[idx]["id"])
+
+    def _on_select(self, idx: int):
+        record = self._current()
+        if record is None:
+            self.preview.clear()
+            return
+        batch = Batch.from_dict(record)
+        text = batch.text(0, OUTPUT_PAGE_SETS)
+        if batch.n > OUTPUT_PAGE_SETS:
+            text += f"\n\n(+{batch.n - OUTPUT_PAGE_SETS} more sets)"
+        seed = record.get("seed")
+        header = f"seed {seed}  |  settings {record.get('settings_hash', '')}\n\n" if seed is not None else ""
+        self.preview.setPlainText(header + text)
+
+    def _copy(self):
+        record = self._current()
+        if record is not None:
+            QtWidgets.QApplication.clipboard().setText(Batch.from_dict(record).text().strip())
+
+    def _restore(self):
+        idx = self.list.currentRow()
+        if 0 <= idx < len(self.rows):
+            self.selected_id = self.rows[idx]["id"]
+            self.done(1)
+
+
 class ThemeDialog(QtWidgets.QDialog):
     def __init__(self, parent, colors: dict, on_apply, current_preset: str | None = None):
         super().__init__(parent)
@@ -867,7 +1075,7 @@ class ThemeDialog(QtWidgets.QDialog):
         self.finished.connect(lambda _: _save_popup_geometry(self, "theme_dialog"))
 
     def _apply_theme(self):
-        if qdarktheme is not None and getattr(self.parent(), "use_qdarktheme", False):
+        if getattr(self.parent(), "use_qdarktheme", False) and _load_qdarktheme() is not None:
             return
         c = self.colors
         self.setStyleSheet(
@@ -1361,21 +1569,8 @@ class CreateDialog(QtWidgets.QDialog):
         self.new_prompt_image_preview.setWordWrap(True)
         self.new_prompt_image_preview.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
         media_layout.addWidget(self.new_prompt_image_preview, 1)
+        self._new_prompt_media_layout = media_layout
         self.new_prompt_video_widget = None
-        if QtMultimediaWidgets is not None:
-            try:
-                self.new_prompt_video_widget = QtMultimediaWidgets.QVideoWidget(self.new_prompt_media_frame)
-                self.new_prompt_video_widget.setSizePolicy(
-                    QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding
-                )
-                try:
-                    self.new_prompt_video_widget.setAspectRatioMode(QtCore.Qt.KeepAspectRatio)
-                except Exception:
-                    pass
-                self.new_prompt_video_widget.setVisible(False)
-                media_layout.addWidget(self.new_prompt_video_widget, 1)
-            except Exception:
-                self.new_prompt_video_widget = None
         self.btn_prompt_image_browse = QtWidgets.QPushButton("Browse media...")
         self.btn_prompt_image_clear = QtWidgets.QPushButton("Clear media")
         self.btn_prompt_image_browse.clicked.connect(self._browse_prompt_image)
@@ -1632,6 +1827,24 @@ class CreateDialog(QtWidgets.QDialog):
         if self.new_prompt_video_widget is not None:
             self.new_prompt_video_widget.setVisible(False)
 
+    def _ensure_prompt_video_widget(self):
+        if self.new_prompt_video_widget is not None or not _load_multimedia():
+            return self.new_prompt_video_widget
+        try:
+            self.new_prompt_video_widget = QtMultimediaWidgets.QVideoWidget(self.new_prompt_media_frame)
+            self.new_prompt_video_widget.setSizePolicy(
+                QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding
+            )
+            try:
+                self.new_prompt_video_widget.setAspectRatioMode(QtCore.Qt.KeepAspectRatio)
+            except Exception:
+                pass
+            self.new_prompt_video_widget.setVisible(False)
+            self._new_prompt_media_layout.addWidget(self.new_prompt_video_widget, 1)
+        except Exception:
+            self.new_prompt_video_widget = None
+        return self.new_prompt_video_widget
+
     def _prompt_media_target_size(self) -> QtCore.QSize:
         margins = self.new_prompt_media_frame.contentsMargins()
         size = self.new_prompt_media_frame.size() - QtCore.QSize(
@@ -1650,7 +1863,7 @@ class CreateDialog(QtWidgets.QDialog):
             if ext == ".jpeg":
                 ext = ".jpg"
             if ext in VIDEO_PREVIEW_EXTENSIONS:
-                if QtMultimedia is None or self.new_prompt_video_widget is None:
+                if self._ensure_prompt_video_widget() is None:
                     self.new_prompt_image_preview.setText(f"Video selected: {self.new_prompt_media_path.name}")
                     return
                 try:
@@ -1911,14 +2124,54 @@ class AssignTagDialog(QtWidgets.QDialog):
             self.folder_combo.setCurrentIndex(0)
         self._load_tags()
 class PromptZoneWindow(QtWidgets.QMainWindow):
-    def __init__(self):
+    libraryScanned = QtCore.Signal()
+
+    def __init__(self, profile: StartupProfile | None = None, core_stats: bool = False, pack: Path | None = None):
         super().__init__()
-        self.core = PromptZoneCore(app_root())
+        self._profile = profile or StartupProfile(False)
+        self._library_ready = False
+        self._startup_finished = False
+        self.core = PromptZoneCore(app_root(), pack=pack)
+        self.core.stats.enabled = core_stats
+        # Scan finishes on a worker thread; the queued signal brings it back to the UI thread.
+        self.libraryScanned.connect(self._update_library_kpi)
+        self.core.on_ready(lambda _core: self.libraryScanned.emit())
+        self._profile.mark("core")
+        # Current batch: per-slot set texts and sources plus the composed sets. Widgets show
+        # one page of it; Copy/Save and generation read the lists, not the widgets.
+        self._batch = Batch()
+        # Last saved session batch; slots without sets start from it.
+        self._saved_batch = Batch()
+        self._page = 0
+        self._gen_run = 0
+        self._gen_config = None
+        self._gen_started = False
+        # Worker -> UI hand-off: the worker appends (run, rows, done, error) entries and a
+        # UI-thread timer drains them while a run is streaming.
+        self._gen_queue = deque()
+        # Workers whose done entry has not been drained yet; a reload waits for them.
+        self._gen_workers = 0
+        self._reload_pending = False
+        self._gen_timer = QtCore.QTimer(self)
+        self._gen_timer.setInterval(int(STREAM_CHUNK_S * 1000))
+        self._gen_timer.timeout.connect(self._drain_generation)
+        self._dirty_slots: set[str] = set()
+        # Set range the slot boxes were last rendered with; pending edits are read against it.
+        self._shown_range = (0, 0)
+        self._slot_edit_timer = QtCore.QTimer(self)
+        self._slot_edit_timer.setSingleShot(True)
+        self._slot_edit_timer.setInterval(SLOT_EDIT_DEBOUNCE_MS)
+        self._slot_edit_timer.timeout.connect(self._flush_slot_edits)
+        self._session_timer = QtCore.QTimer(self)
+        self._session_timer.setInterval(SESSION_FLUSH_MS)
+        self._session_timer.timeout.connect(self.core.session.flush)
+        self._session_timer.start()
         self.use_qdarktheme = False
         self._drag_exclude_active = False
         self._drag_exclude_value = False
         self._drag_exclude_hovered = None
-        self._exclude_search_cache = {"ACTIONSTYLE": {}, "CLOTHES": {}, "COMPOSITION": {}, "I2V": {}}
+        # Built on first filter query (reads every prompt file).
+        self._exclude_search_cache = None
         self.excluded_tags = set(self.core.settings.get("excluded_tags", []) or [])
 
         self.colors = dict(DEFAULT_THEME_COLORS)
@@ -1940,6 +2193,7 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
 
         self._load_custom_fonts()
         QtWidgets.QApplication.instance().setFont(QtGui.QFont("Roboto", 12))
+        self._profile.mark("fonts")
         self.setWindowTitle(APP_TITLE)
         self._set_window_icon()
         self._geometry_restored = False
@@ -1949,6 +2203,7 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self._icons = {"black": {}, "white": {}}
         self._load_icons()
         self._icon_color = "white"
+        self._profile.mark("icons")
 
         central = QtWidgets.QWidget()
         self.setCentralWidget(central)
@@ -1990,6 +2245,7 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self.btn_save = QtWidgets.QPushButton("Save TXT")
         self.btn_create = QtWidgets.QPushButton("Create")
         self.btn_assign_tag = QtWidgets.QPushButton("Assign tag")
+        self.btn_history = QtWidgets.QPushButton("History")
         self.btn_reload = QtWidgets.QPushButton("Reload")
         self.btn_manage_slots = QtWidgets.QPushButton("Manage Slots")
         self.btn_customize = QtWidgets.QPushButton("Customise")
@@ -1998,6 +2254,7 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
             self.btn_save,
             self.btn_create,
             self.btn_assign_tag,
+            self.btn_history,
             self.btn_reload,
             self.btn_manage_slots,
             self.btn_customize,
@@ -2091,6 +2348,13 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         weight_row_layout.addWidget(self.lbl_weight_value, 0, QtCore.Qt.AlignRight)
         left_layout.addWidget(weight_row)
         self._update_weight_strength_preview(self.weight_strength.value())
+
+        self.lbl_budget = QtWidgets.QLabel("Length budget per set")
+        left_layout.addWidget(self.lbl_budget)
+        self.token_budget = QtWidgets.QLineEdit()
+        self.token_budget.setPlaceholderText("0 = off")
+        self.token_budget.setToolTip("Maximum length of each set, measured with the configured tokenizer (words by default)")
+        left_layout.addWidget(self.token_budget)
         left_layout.addWidget(self._section_divider())
 
         self.action_cat = QtWidgets.QPushButton()
@@ -2167,6 +2431,8 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self.append_output = QtWidgets.QCheckBox("Append output")
         self.avoid_repeats = QtWidgets.QCheckBox("Avoid repeats (session)")
         self.one_per_folder = QtWidgets.QCheckBox("Only one per folder (per batch)")
+        self.suppress_duplicates = QtWidgets.QCheckBox("Never repeat a set (all sessions)")
+        self.expand_templates = QtWidgets.QCheckBox("Expand {a|b} and __CATEGORY__")
 
         self.dynamic_lock_frame = QtWidgets.QWidget()
         self.dynamic_lock_layout = QtWidgets.QVBoxLayout(self.dynamic_lock_frame)
@@ -2188,6 +2454,8 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
             self.append_output,
             self.avoid_repeats,
             self.one_per_folder,
+            self.suppress_duplicates,
+            self.expand_templates,
         ]:
             w.setSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
             checkbox_layout.addWidget(w, 0, QtCore.Qt.AlignLeft)
@@ -2287,6 +2555,7 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self.output_box.setLineWrapMode(QtWidgets.QTextEdit.LineWrapMode.FixedColumnWidth)
         self.output_box.setLineWrapColumnOrWidth(165)
         self.output_box.setWordWrapMode(QtGui.QTextOption.WordWrap)
+        self.output_box.setReadOnly(True)
 
         self.lbl_action_slot = QtWidgets.QLabel("ACTIONSTYLE slot")
         self.lbl_action_src = QtWidgets.QLabel("")
@@ -2326,6 +2595,28 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self.lbl_output_src.setObjectName("muted")
         self.lbl_output_src.setVisible(False)
         center_layout.addWidget(self._slot_header(self.lbl_output, self.lbl_output_src))
+        self.output_pager = QtWidgets.QWidget()
+        pager_layout = QtWidgets.QHBoxLayout(self.output_pager)
+        pager_layout.setContentsMargins(0, 0, 0, 0)
+        pager_layout.setSpacing(6)
+        self.btn_page_prev = QtWidgets.QPushButton("<")
+        self.btn_page_next = QtWidgets.QPushButton(">")
+        for b in [self.btn_page_prev, self.btn_page_next]:
+            b.setObjectName("iconSquare")
+            b.setFixedSize(26, 26)
+        self.lbl_page = QtWidgets.QLabel("")
+        self.lbl_page.setObjectName("muted")
+        self.goto_set = QtWidgets.QSpinBox()
+        self.goto_set.setPrefix("Set ")
+        self.goto_set.setRange(1, 1)
+        self.goto_set.setKeyboardTracking(False)
+        self.goto_set.setToolTip("Jump to set")
+        pager_layout.addWidget(self.btn_page_prev)
+        pager_layout.addWidget(self.btn_page_next)
+        pager_layout.addWidget(self.lbl_page, 1)
+        pager_layout.addWidget(self.goto_set)
+        self.output_pager.setVisible(False)
+        center_layout.addWidget(self.output_pager)
         center_layout.addWidget(self.output_box)
 
         # center panel added via splitter below
@@ -2446,18 +2737,22 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         root.addWidget(self.main_split, 1, 0, 1, 3)
 
         # auto-resize handled by AutoResizeText
+        self._profile.mark("build_ui")
 
+        # Stage 1: slots and texts from cached settings; folder lists are filled after the first paint.
         self._wire_actions()
         self._refresh_tag_pref_options()
         self._load_from_settings()
-        self._update_slot_sources()
-        self._refresh_library_ui()
         self._set_legacy_controls_visible(False)
+        self._rebuild_dynamic_slots()
+        self._update_slot_sources()
+        self._profile.mark("settings")
         self._apply_theme()
         self._resize_all_text_slots()
         self._apply_label_metrics()
         self._apply_left_panel_width()
         self._apply_max_window_size()
+        self._profile.mark("theme")
         QtCore.QTimer.singleShot(0, self._restore_window_geometry_once)
         app = QtWidgets.QApplication.instance()
         if app is not None:
@@ -2488,7 +2783,7 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         s = self.core.settings
         restored = False
 
-        encoded = s.get("window_geometry_qt")
+        encoded = self.core.session.get("window_geometry_qt")
         if isinstance(encoded, str) and encoded.strip():
             try:
                 data = QtCore.QByteArray.fromBase64(encoded.encode("ascii"))
@@ -2517,6 +2812,23 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         super().showEvent(event)
         self._apply_max_window_size()
         self._apply_left_panel_width()
+        if not self._startup_finished:
+            self._startup_finished = True
+            self._profile.mark("show")
+            # Stage 2 runs once the first frame is queued.
+            QtCore.QTimer.singleShot(0, self._finish_startup)
+
+    def _finish_startup(self):
+        if not self._library_ready:
+            self._refresh_library_ui()
+        self._profile.mark("library")
+        self._profile.report()
+
+    def _slot_folder_names(self, slot: dict) -> list[str]:
+        if not self._library_ready:
+            return []
+        prefix = str(slot.get("prefix") or "").strip()
+        return [p.name for p in self.core.folders_by_prefix(prefix)] if prefix else []
 
     def _apply_left_panel_width(self):
         # Keep left panel readable while allowing manual splitter resize.
@@ -2809,8 +3121,8 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self._write_to_settings()
 
     def _change_n_sets(self, delta: int):
-        current = self._safe_int(self.n_sets.text(), 1, 50, 3)
-        value = max(1, min(50, current + delta))
+        current = self._safe_int(self.n_sets.text(), 1, MAX_SETS, 3)
+        value = max(1, min(MAX_SETS, current + delta))
         self.n_sets.setText(str(value))
         self._write_to_settings()
 
@@ -2828,6 +3140,7 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self.btn_save.clicked.connect(self.save_txt)
         self.btn_create.clicked.connect(self.open_create)
         self.btn_assign_tag.clicked.connect(self.open_assign_tag)
+        self.btn_history.clicked.connect(self.open_history)
         self.btn_reload.clicked.connect(self.on_reload)
         self.btn_manage_slots.clicked.connect(self.open_manage_slots)
         self.btn_customize.clicked.connect(self.open_customise)
@@ -2844,6 +3157,9 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self.btn_clear_excludes.clicked.connect(self.clear_excludes)
         self.btn_reset_repeats.clicked.connect(self.reset_repeats)
         self.btn_n_sets_minus.clicked.connect(lambda: self._change_n_sets(-1))
+        self.btn_page_prev.clicked.connect(lambda: self._set_page(self._page - 1))
+        self.btn_page_next.clicked.connect(lambda: self._set_page(self._page + 1))
+        self.goto_set.valueChanged.connect(self._goto_set)
         self.btn_n_sets_plus.clicked.connect(lambda: self._change_n_sets(1))
         self.btn_rand_action.clicked.connect(lambda: self._randomize_dynamic_slot("actionstyle"))
         self.btn_rand_clothes.clicked.connect(lambda: self._randomize_dynamic_slot("clothes"))
@@ -2891,7 +3207,7 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self._apply_icons()
         self._set_titlebar_color(c.get("topbar", "#111111"), c.get("text", "#ffffff"))
 
-        if self.use_qdarktheme and qdarktheme is not None:
+        if self.use_qdarktheme and _load_qdarktheme() is not None:
             theme_mode = "light" if self._luma(c.get("panel", "#111111")) > 0.6 else "dark"
             custom_colors = {
                 "background": c["panel"],
@@ -3129,6 +3445,8 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         s = self.core.settings
         self.n_sets.setText(str(s.get("n_sets", 3)))
         self.weight_strength.setValue(int(float(s.get("weight_strength", 0.65)) * 100))
+        budget = int(s.get("token_budget", 0) or 0)
+        self.token_budget.setText(str(budget) if budget > 0 else "")
 
         self.lock_action.setChecked(bool(s.get("lock_action", False)))
         self.lock_clothes.setChecked(bool(s.get("lock_clothes", False)))
@@ -3138,6 +3456,8 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self.append_output.setChecked(bool(s.get("append_output", False)))
         self.avoid_repeats.setChecked(bool(s.get("avoid_repeats", True)))
         self.one_per_folder.setChecked(bool(s.get("only_one_per_folder", False)))
+        self.suppress_duplicates.setChecked(bool(s.get("suppress_duplicate_sets", False)))
+        self.expand_templates.setChecked(bool(s.get("expand_templates", True)))
 
         preset = s.get("theme_preset")
         if isinstance(preset, str) and preset in THEME_PRESETS:
@@ -3148,11 +3468,15 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self.gen_composition.setChecked(bool(s.get("gen_composition", True)))
         self.gen_i2v.setChecked(bool(s.get("gen_i2v", True)))
 
-        last_output = s.get("last_output_text", "")
-        if last_output:
-            self.output_box.setPlainText(last_output)
-
-        last_texts = s.get("last_slot_texts")
+        session = self.core.session
+        saved = session.get("last_batch")
+        if isinstance(saved, dict):
+            self._saved_batch = Batch.from_dict(saved)
+            # Source labels are the batch's own sources.
+            self.last_dynamic_sources = {sid: self._saved_batch.slot_sources(sid) for sid in self._saved_batch.slots}
+            return
+        # Older sessions (and settings) kept DIVIDER-joined text per slot; split once here.
+        last_texts = session.get("last_slot_texts")
         if not isinstance(last_texts, dict):
             last_texts = {}
         legacy_text_keys = {
@@ -3165,9 +3489,12 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
             legacy_text = s.get(key, "")
             if legacy_text and slot_id not in last_texts:
                 last_texts[slot_id] = legacy_text
-        s["last_slot_texts"] = last_texts
+        n = self._safe_int(s.get("n_sets", 3), 1, MAX_SETS, 3)
+        self._saved_batch = Batch.from_dict(
+            {"n": n, "slots": {k: split_sets(str(v or ""), n) for k, v in last_texts.items()}}
+        )
 
-        last_sources = s.get("last_slot_sources")
+        last_sources = session.get("last_slot_sources")
         if not isinstance(last_sources, dict):
             last_sources = {}
         legacy_source_keys = {
@@ -3180,22 +3507,43 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
             legacy_src = s.get(key, "")
             if legacy_src and slot_id not in last_sources:
                 last_sources[slot_id] = legacy_src
-        self.last_dynamic_sources = dict(last_sources)
-        s["last_slot_sources"] = dict(last_sources)
+        # Source labels were kept separately: distinct sources per slot, or joined text.
+        self.last_dynamic_sources = {}
+        for slot_id, value in last_sources.items():
+            parts = value.split(DIVIDER) if isinstance(value, str) else value if isinstance(value, list) else []
+            self.last_dynamic_sources[slot_id] = list(dict.fromkeys(str(p).strip() for p in parts if str(p).strip()))
 
-    def _write_to_settings(self):
+    def _write_to_settings(self, save: bool = True):
         s = self.core.settings
-        s["n_sets"] = self._safe_int(self.n_sets.text(), 1, 50, 3)
+        s["n_sets"] = self._safe_int(self.n_sets.text(), 1, MAX_SETS, 3)
         tag_sel = self._selected_list(self.tag_pref_list)
         s["tag_pref"] = tag_sel if tag_sel else ["All"]
         s["weight_strength"] = float(self.weight_strength.value()) / 100.0
+        s["token_budget"] = self._safe_int(self.token_budget.text(), 0, 100000, 0)
         s["skip_minimized"] = self.skip_minimized.isChecked()
         s["append_output"] = self.append_output.isChecked()
         s["avoid_repeats"] = self.avoid_repeats.isChecked()
         s["only_one_per_folder"] = self.one_per_folder.isChecked()
+        s["suppress_duplicate_sets"] = self.suppress_duplicates.isChecked()
+        s["expand_templates"] = self.expand_templates.isChecked()
         s["excluded_tags"] = sorted(self.excluded_tags)
+        prev_slot_settings = s.get("slot_settings", {})
+        if not isinstance(prev_slot_settings, dict):
+            prev_slot_settings = {}
         slot_settings = {}
         for slot_id, ctrl in (self.dynamic_slot_controls or {}).items():
+            if not self._library_ready:
+                # Category/exclude lists are not populated yet; keep the stored selection.
+                prev = prev_slot_settings.get(slot_id, {})
+                if not isinstance(prev, dict):
+                    prev = {}
+                slot_settings[slot_id] = {
+                    "category": self._coerce_list(prev.get("category", "Any"), "Any"),
+                    "excluded": list(prev.get("excluded", []) or []),
+                    "lock": ctrl.get("lock").isChecked() if ctrl.get("lock") else False,
+                    "gen": ctrl.get("gen").isChecked() if ctrl.get("gen") else True,
+                }
+                continue
             list_widget = ctrl.get("cat_list")
             cat_sel = self._selected_list(list_widget) if list_widget else ["Any"]
             slot_settings[slot_id] = {
@@ -3215,16 +3563,18 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         s["theme_preset"] = self._current_preset_name()
         s["window_geometry"] = f"{self.width()}x{self.height()}"
         try:
-            s["window_geometry_qt"] = bytes(self.saveGeometry().toBase64()).decode("ascii")
+            self.core.session.set("window_geometry_qt", bytes(self.saveGeometry().toBase64()).decode("ascii"))
         except Exception:
             pass
         s["window_state"] = "maximized" if self.isMaximized() else "normal"
-        self.core.save_settings()
+        if save:
+            self.core.save_settings()
 
     def _refresh_library_ui(self):
+        self._library_ready = True
         self._refresh_tag_pref_options()
         self._refresh_excluded_tags()
-        self._build_exclude_search_cache()
+        self._exclude_search_cache = None
         self._set_legacy_controls_visible(False)
         self._rebuild_dynamic_slots()
         self._apply_label_metrics()
@@ -3232,22 +3582,22 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self._apply_icons()
         if hasattr(self, "excl_all_filter"):
             self._apply_exclude_filter_all()
+        self._update_library_kpi()
+        self._status("Library refreshed.")
 
+    def _update_library_kpi(self):
+        if not self.core.is_ready:
+            self.kpi.setText("Scanning library...")
+            return
         parts = []
         for slot in self.core.get_slots():
             label = str(slot.get("label") or slot.get("id") or "Slot").upper()
             prefix = str(slot.get("prefix") or "").strip()
             folders = self.core.folders_by_prefix(prefix) if prefix else []
-            files = sum(
-                1
-                for folder in folders
-                for f in folder.iterdir()
-                if f.is_file() and f.suffix.lower() in PROMPT_TEXT_EXTENSIONS
-            )
+            files = self.core.prompt_file_count(folders)
             parts.append(f"{label}: {len(folders)} folders / {files} files")
         kpi = "    |    ".join(parts) if parts else "No slots configured."
         self.kpi.setText(kpi)
-        self._status("Library refreshed.")
 
     def open_browse(self, kind: str):
         kind = (kind or "").upper().strip()
@@ -3285,9 +3635,8 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         if lock_cb is not None and lock_cb.isChecked():
             self._status(f"{label} is locked.")
             return
-        box = self.dynamic_slot_boxes.get(slot_id)
-        if box is not None:
-            box.setPlainText(text)
+        if slot_id in self.dynamic_slot_boxes:
+            self._set_slot_sets(slot_id, [text] * max(1, self._batch_size()))
             self._queue_resize_text()
         if lock and lock_cb is not None:
             lock_cb.setChecked(True)
@@ -3296,42 +3645,131 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
     def on_generate(self):
         self._write_to_settings()
         s = self.core.settings
-        prev_sources = dict(getattr(self, "last_dynamic_sources", {}) or {})
         try:
-            slots = self.core.get_slots()
-            slot_texts = {slot_id: box.toPlainText().strip() for slot_id, box in self.dynamic_slot_boxes.items()}
-            new_map, sources_map, out = self.core.generate_slots(
-                slots, slot_texts, skip_minimized=bool(s.get("skip_minimized", False))
-            )
+            config = self.core.generation_config(self.core.get_slots(), bool(s.get("skip_minimized", False)))
         except Exception as e:
             self._status(str(e))
             return
-        for slot_id, box in self.dynamic_slot_boxes.items():
-            if slot_id in new_map:
-                box.setPlainText(new_map[slot_id])
+        self._flush_slot_edits()
+        self._ensure_batch()
+        slot_texts = {slot_id: list(sets) for slot_id, sets in self._batch.slots.items()}
+        # A new run supersedes one still streaming; its late chunks are dropped.
+        self._gen_run += 1
+        run = self._gen_run
+        self._gen_config = config
+        self._gen_started = False
+        if config.n <= OUTPUT_PAGE_SETS:
+            # One page or less: draw inline so the result is on screen when this returns.
+            try:
+                rows = list(self.core.iter_sets(config, slot_texts))
+            except Exception as e:
+                self._gen_config = None
+                self._status(str(e))
+                return
+            self._on_generation_chunk(run, rows)
+            self._on_generation_done(run, None)
+            return
+        self._update_pager()
+        self._status(f"Generating {config.n} sets...")
+        self._gen_workers += 1
+        threading.Thread(target=self._generation_worker, args=(run, config, slot_texts), daemon=True).start()
+        self._gen_timer.start()
+
+    def _generation_worker(self, run: int, config, slot_texts: dict):
+        # Worker thread: sets reach the UI thread in chunks through _gen_queue, drained by _gen_timer.
+        rows = []
+        last = time.perf_counter()
+        error = None
+        try:
+            for row in self.core.iter_sets(config, slot_texts):
+                if run != self._gen_run:
+                    break
+                rows.append(row)
+                now = time.perf_counter()
+                if len(rows) >= STREAM_CHUNK_SETS or now - last >= STREAM_CHUNK_S:
+                    self._gen_queue.append((run, rows, False, None))
+                    rows, last = [], now
+        except Exception as e:
+            error = e
+        # Posted for superseded runs too (their rows are dropped): it marks the worker done.
+        self._gen_queue.append((run, rows, True, error))
+
+    def _drain_generation(self):
+        while self._gen_queue:
+            run, rows, done, error = self._gen_queue.popleft()
+            self._on_generation_chunk(run, rows)
+            if done:
+                self._gen_workers -= 1
+                self._on_generation_done(run, error)
+        if self._reload_pending and not self._gen_workers:
+            self._reload_pending = False
+            self._reload_library()
+        if self._gen_config is None and not self._gen_workers:
+            self._gen_timer.stop()
+
+    def _on_generation_chunk(self, run: int, rows: list):
+        if run != self._gen_run or not rows:
+            return
+        if not self._gen_started:
+            # The previous batch stays on screen until the first sets of the new one arrive.
+            self._flush_slot_edits()
+            self._gen_started = True
+            ids = list(self.dynamic_slot_boxes)
+            self._batch = Batch({slot_id: [] for slot_id in ids}, {slot_id: [] for slot_id in ids})
+            self._page = 0
+        else:
+            # Typed text belongs to the sets shown before these rows arrive.
+            self._flush_slot_edits()
+        first = self._batch_size()
+        batch = self._batch
+        for texts, sources, composed in rows:
+            for slot_id, sets in batch.slots.items():
+                sets.append(texts.get(slot_id, ""))
+                batch.sources[slot_id].append(sources.get(slot_id, ""))
+            batch.sets.append(composed)
+        if first < (self._page + 1) * OUTPUT_PAGE_SETS:
+            self._render_page()
+        else:
+            self._update_pager()
 
+    def _on_generation_done(self, run: int, error):
+        if run != self._gen_run:
+            return
+        config = self._gen_config
+        self._gen_config = None
+        if not self._gen_started:
+            self._update_pager()
+            self._status(str(error) if error is not None else "Nothing generated.")
+            return
+        prev_sources = dict(getattr(self, "last_dynamic_sources", {}) or {})
         merged_sources = {}
-        for slot_id in self.dynamic_slot_boxes.keys():
-            src = sources_map.get(slot_id, "")
-            if not src:
-                src = prev_sources.get(slot_id, "")
-            merged_sources[slot_id] = src
+        for slot_id in self._batch.sources:
+            merged_sources[slot_id] = self._batch.slot_sources(slot_id) or prev_sources.get(slot_id, [])
         self.last_dynamic_sources = merged_sources
-
-        display_out = self._rebuild_output_from_fields()
-        self.output_box.setPlainText(display_out)
         self._update_slot_sources()
-        s = self.core.settings
-        s["last_output_text"] = display_out
-        s["last_slot_texts"] = {slot_id: box.toPlainText() for slot_id, box in self.dynamic_slot_boxes.items()}
-        s["last_slot_sources"] = dict(self.last_dynamic_sources)
+        self._update_pager()
+        if error is None:
+            self.core.write_output(self._batch.text(), config.append_output)
+            self.core.record_batch(config, self._batch)
+        self._persist_batch()
         self.core.save_settings()
-        self._refresh_library_ui()
-        self._status("Randomized new prompt set.")
+        if error is not None:
+            self._status(f"Stopped after {self._batch_size()} sets: {error}")
+        else:
+            self._status(self._with_call_stats("Randomized new prompt set.", "randomize", "iter_sets"))
         QtCore.QTimer.singleShot(0, self._resize_all_text_slots)
 
+    def _with_call_stats(self, msg: str, label: str, call: str = "generate_slots") -> str:
+        stats = self.core.stats
+        last = stats.last_call(call) if stats.enabled else None
+        if not last:
+            return msg
+        reads = last["counters"].get("file_reads", 0)
+        return f"{msg}  (last {label}: {last['ms']:.0f} ms, {reads} disk reads)"
+
     def copy_output(self):
-        txt = self.output_box.toPlainText().strip()
+        self._flush_slot_edits()
+        txt = self._batch.text().strip()
         if not txt:
             return
         QtWidgets.QApplication.clipboard().setText(txt)
@@ -3339,7 +3777,8 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
 
     def save_txt(self):
         self._write_to_settings()
-        txt = self.output_box.toPlainText().strip()
+        self._flush_slot_edits()
+        txt = self._batch.text().strip()
         if not txt:
             return
         try:
@@ -3349,7 +3788,18 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
             self._status(f"Save failed: {e}")
 
     def on_reload(self):
+        # A run still streaming samples from the library being replaced: stop it, keep what it
+        # drew, and reload once its worker has posted its last entry (see _drain_generation).
+        self._stop_generation()
         self._write_to_settings()
+        if self._gen_workers:
+            self._reload_pending = True
+            self._gen_timer.start()
+            self._status("Reloading once generation stops...")
+            return
+        self._reload_library()
+
+    def _reload_library(self):
         self.core.reload_library()
         self._refresh_library_ui()
         self._status("Folders reloaded.")
@@ -3364,11 +3814,8 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self._status("Excludes cleared.")
 
     def reset_repeats(self):
-        self.core.used_action_files.clear()
-        self.core.used_clothes_files.clear()
-        self.core.used_composition_files.clear()
-        self.core.used_i2v_files.clear()
-        self._refresh_library_ui()
+        self.core.reset_repeats()
+        self.core.clear_emitted_sets()
         self._status("Repeat history cleared.")
 
     def open_create(self):
@@ -3492,6 +3939,32 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         if not silent:
             self._status("Tag excludes cleared.")
 
+    def open_history(self):
+        self._flush_slot_edits()
+        dlg = HistoryDialog(self, self.core)
+        if dlg.exec() == 1 and dlg.selected_id is not None:
+            self._restore_history(dlg.selected_id)
+
+    def _restore_history(self, rid: int):
+        record = self.core.history_batch(rid)
+        if record is None:
+            self._status("History entry not found.")
+            return
+        self._stop_generation()
+        self._flush_slot_edits()
+        n = record.n
+        batch = Batch(sets=[""] * n)
+        for slot_id in self.dynamic_slot_boxes:
+            batch.set_slot(slot_id, record.slots.get(slot_id) or [""] * n, record.sources.get(slot_id))
+        self._batch = batch
+        self._recompose()
+        self._page = 0
+        self._render_page()
+        self.last_dynamic_sources = {slot_id: batch.slot_sources(slot_id) for slot_id in batch.slots}
+        self._update_slot_sources()
+        self._persist_batch()
+        self._status(f"Restored history #{rid + 1} ({n} sets).")
+
     def open_customise(self):
         def apply_colors(new_colors: dict):
             self.colors.update(new_colors)
@@ -3514,7 +3987,13 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self._apply_theme()
 
     def closeEvent(self, event: QtGui.QCloseEvent):
+        # Stops a streaming generation at its next set.
+        self._gen_run += 1
         self._write_to_settings()
+        if self._batch.slots:
+            self._persist_batch()
+        self._session_timer.stop()
+        self.core.session.flush()
         super().closeEvent(event)
 
     def _status(self, msg: str):
@@ -3588,16 +4067,40 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
     def _on_slot_text_changed(self):
         if getattr(self, "_updating_output", False):
             return
-        self._updating_output = True
-        try:
-            out = self._rebuild_output_from_fields()
-            if self.output_box.toPlainText() != out:
-                self.output_box.setPlainText(out)
-        finally:
-            self._updating_output = False
-
-    def _compact_source(self, text: str) -> str:
-        parts = [p.strip() for p in (text or "").split(DIVIDER) if p.strip()]
+        box = self.sender()
+        slot_id = next((sid for sid, b in self.dynamic_slot_boxes.items() if b is box), None)
+        if slot_id is None:
+            return
+        # Keystrokes only mark the slot; its page is re-read once typing pauses.
+        self._dirty_slots.add(slot_id)
+        self._slot_edit_timer.start()
+
+    def _flush_slot_edits(self):
+        # Anything that reads the batch or replaces the page calls this first.
+        self._slot_edit_timer.stop()
+        if not self._dirty_slots:
+            return
+        dirty, self._dirty_slots = self._dirty_slots, set()
+        self._ensure_batch()
+        start, end = self._shown_range
+        end = min(end, self._batch_size())
+        if end <= start:
+            return
+        changed = set()
+        for slot_id in dirty:
+            box = self.dynamic_slot_boxes.get(slot_id)
+            sets = self._batch.slots.get(slot_id)
+            if box is None or sets is None:
+                continue
+            for idx, text in enumerate(self._parse_page(box.toPlainText(), end - start), start):
+                if sets[idx].strip() != text:
+                    sets[idx] = text
+                    changed.add(idx)
+        if changed:
+            self._recompose_sets(sorted(changed))
+
+    def _compact_source(self, sources: list[str]) -> str:
+        parts = [p.strip() for p in sources or [] if p.strip()]
         if not parts:
             return ""
         if len(parts) == 1:
@@ -3608,7 +4111,7 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         sources = dict(getattr(self, "last_dynamic_sources", {}) or {})
 
         for slot_id, lbl in self.dynamic_slot_sources.items():
-            lbl.setText(self._compact_source(sources.get(slot_id, "")))
+            lbl.setText(self._compact_source(sources.get(slot_id) or []))
 
         # Output source label is hidden; skip composing the status text.
 
@@ -3623,27 +4126,12 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         slot_id = slot_map.get(kind)
         if not slot_id:
             return
-        box = self.dynamic_slot_boxes.get(slot_id)
-        if box:
-            box.clear()
-        if slot_id == "actionstyle":
-            self.core.last_action_sources = ""
-        elif slot_id == "clothes":
-            self.core.last_clothes_sources = ""
-        elif slot_id == "composition":
-            self.core.last_composition_sources = ""
-        elif slot_id == "i2v":
-            self.core.last_i2v_sources = ""
+        if slot_id in self.dynamic_slot_boxes:
+            self._set_slot_sets(slot_id, [""] * max(1, self._batch_size()))
         if hasattr(self, "last_dynamic_sources"):
-            self.last_dynamic_sources[slot_id] = ""
+            self.last_dynamic_sources[slot_id] = []
         self._update_slot_sources()
-        out = self._rebuild_output_from_fields()
-        self.output_box.setPlainText(out)
-        s = self.core.settings
-        s["last_output_text"] = self.output_box.toPlainText()
-        s["last_slot_texts"] = {sid: box.toPlainText() for sid, box in self.dynamic_slot_boxes.items()}
-        s["last_slot_sources"] = dict(getattr(self, "last_dynamic_sources", {}) or {})
-        self.core.save_settings()
+        self._persist_batch()
 
     def _randomize_slot(self, kind: str):
         kind = kind.upper()
@@ -3659,52 +4147,222 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self._randomize_dynamic_slot(slot_id)
         self._status(f"{kind} randomized.")
 
-    def _rebuild_output_from_fields(self) -> str:
-        try:
-            n = max(1, int(self.core.settings.get("n_sets", 3)))
-        except Exception:
-            n = 1
+    # ---------- batch (per-slot sets) ----------
+    def _batch_size(self) -> int:
+        return self._batch.n
+
+    def _page_range(self) -> tuple[int, int]:
+        start = self._page * OUTPUT_PAGE_SETS
+        return start, min(self._batch_size(), start + OUTPUT_PAGE_SETS)
+
+    @staticmethod
+    def _sets_text(sets: list[str]) -> str:
+        return join_sets(sets) if any(t.strip() for t in sets) else ""
+
+    @staticmethod
+    def _parse_page(text: str, k: int) -> list[str]:
+        # Positional when the divider count matches (empty sets included), else split_sets.
+        parts = (text or "").split(DIVIDER)
+        if len(parts) == k:
+            return [p.strip() for p in parts]
+        return split_sets(text, k)
+
+    def _active_slot_ids(self) -> list[str]:
         skip_minimized = bool(self.core.settings.get("skip_minimized", False))
+        return [
+            slot["id"]
+            for slot in self.core.get_slots()
+            if slot.get("enabled", True) and not (skip_minimized and slot.get("minimized", False))
+        ]
 
-        def split_sets(text: str) -> list[str]:
-            t = (text or "").strip()
-            if not t:
-                return [""] * n
-            parts = [p.strip() for p in t.split(DIVIDER) if p.strip()]
-            if len(parts) == 1:
-                return [parts[0]] * n
-            if len(parts) < n:
-                parts = parts + [parts[-1]] * (n - len(parts))
-            return parts[:n]
-
-        def join_sets(arr: list[str]) -> str:
-            if n == 1:
-                return arr[0] if arr else ""
-            return DIVIDER.join([a.strip() for a in arr])
+    def _recompose(self, start: int = 0, end: int | None = None):
+        end = self._batch_size() if end is None else end
+        slot_ids = self._active_slot_ids()
+        for idx in range(start, end):
+            self._batch.sets[idx] = self._batch.compose(idx, slot_ids)
+
+    def _recompose_sets(self, indices: list[int]):
+        # Recomposes only the given sets and patches just those spans of the output page.
+        slot_ids = self._active_slot_ids()
+        old = {}
+        for idx in indices:
+            text = self._batch.compose(idx, slot_ids)
+            if text != self._batch.sets[idx]:
+                old[idx] = self._batch.sets[idx]
+                self._batch.sets[idx] = text
+        start, end = self._page_range()
+        visible = [idx for idx in old if start <= idx < end]
+        if visible:
+            self._patch_output(visible, old)
 
-        slots = self.core.get_slots()
-        slot_sets = {slot_id: split_sets(box.toPlainText()) for slot_id, box in self.dynamic_slot_boxes.items()}
+    @staticmethod
+    def _qt_len(text: str) -> int:
+        # QTextDocument positions count UTF-16 code units.
+        return len(text.encode("utf-16-le")) // 2
+
+    def _patch_output(self, indices: list[int], old: dict[int, str]):
+        start, end = self._page_range()
+        page_old = [old.get(idx, self._batch.sets[idx]) for idx in range(start, end)]
+        page_new = self._batch.sets[start:end]
+        positional = end - start > 1 and any(t.strip() for t in page_old) and any(t.strip() for t in page_new)
+        if not positional or len(indices) > OUTPUT_PATCH_MAX_SETS:
+            out = self._sets_text(page_new)
+            if self.output_box.toPlainText() != out:
+                self.output_box.setPlainText(out)
+            return
+        divider = self._qt_len(DIVIDER)
+        offsets = []
+        pos = 0
+        for text in page_old:
+            offsets.append(pos)
+            pos += self._qt_len(text.strip()) + divider
+        cursor = QtGui.QTextCursor(self.output_box.document())
+        cursor.beginEditBlock()
+        # Back to front, so earlier offsets stay valid.
+        for idx in sorted(indices, reverse=True):
+            at = offsets[idx - start]
+            cursor.setPosition(at)
+            cursor.setPosition(at + self._qt_len(old[idx].strip()), QtGui.QTextCursor.KeepAnchor)
+            cursor.insertText(self._batch.sets[idx].strip())
+        cursor.endEditBlock()
+
+    def _fit_batch(self, n: int):
+        # Pads (repeating the last set, like split_sets) or trims every slot to n sets.
+        self._batch.fit(n)
+        self._recompose()
+
+    def _ensure_batch(self):
+        # Slots without sets (startup, new slots) start from the last saved batch.
+        saved = self._saved_batch
+        n = self._batch_size() or (saved.n if saved.slots else 0)
+        n = n or self._safe_int(self.core.settings.get("n_sets", 3), 1, MAX_SETS, 3)
+        changed = not self._batch.sets
+        if changed:
+            self._batch.fit(n)
+        for slot_id in self.dynamic_slot_boxes:
+            if slot_id not in self._batch.slots:
+                self._batch.set_slot(slot_id, saved.slots.get(slot_id) or [""], saved.sources.get(slot_id))
+                changed = True
+        for slot_id in [sid for sid in self._batch.slots if sid not in self.dynamic_slot_boxes]:
+            self._batch.drop_slot(slot_id)
+        if changed:
+            self._recompose()
+
+    def _stop_generation(self):
+        # Keeps the sets received so far; later chunks of the run are dropped.
+        if self._gen_config is not None:
+            self._gen_run += 1
+            self._gen_config = None
+            self._update_pager()
+
+    def _set_slot_sets(self, slot_id: str, sets: list[str], sources: list[str] | None = None):
+        self._stop_generation()
+        self._flush_slot_edits()
+        self._ensure_batch()
+        if len(sets) != self._batch_size():
+            self._fit_batch(len(sets))
+        self._batch.set_slot(slot_id, sets, sources)
+        self._recompose()
+        self._render_page()
+
+    def _persist_batch(self):
+        self._flush_slot_edits()
+        # The output is recomposed from the slots; past batches live in the history log.
+        session = self.core.session
+        batch = self._batch.to_dict()
+        # Composed sets are rebuilt from the slots on start.
+        batch.pop("sets")
+        session.set("last_batch", batch)
+
+    def _render_page(self):
+        self._flush_slot_edits()
+        pages = max(1, -(-self._batch_size() // OUTPUT_PAGE_SETS))
+        self._page = max(0, min(self._page, pages - 1))
+        start, end = self._page_range()
+        was_updating = getattr(self, "_updating_output", False)
+        self._updating_output = True
+        try:
+            for slot_id, box in self.dynamic_slot_boxes.items():
+                text = self._sets_text(self._batch.slots.get(slot_id, [])[start:end])
+                if box.toPlainText() != text:
+                    box.setPlainText(text)
+        finally:
+            self._updating_output = was_updating
+        self._shown_range = (start, end)
+        out = self._sets_text(self._batch.sets[start:end])
+        if self.output_box.toPlainText() != out:
+            self.output_box.setPlainText(out)
+        self._update_pager()
+
+    def _update_pager(self):
+        n = self._batch_size()
+        expected = self._gen_config.n if self._gen_config is not None else n
+        self.output_pager.setVisible(max(n, expected) > OUTPUT_PAGE_SETS)
+        start, end = self._page_range()
+        text = f"Sets {start + 1}-{end} of {n}" if n else "No sets"
+        if expected > n:
+            text += f" (generating, {expected} total)"
+        self.lbl_page.setText(text)
+        self.btn_page_prev.setEnabled(self._page > 0)
+        self.btn_page_next.setEnabled(end < n)
+        blocker = QtCore.QSignalBlocker(self.goto_set)
+        try:
+            self.goto_set.setRange(1, max(1, n))
+        finally:
+            del blocker
 
-        out_sets = []
-        for idx in range(n):
-            parts = []
-            for slot in slots:
-                if not slot.get("enabled", True):
-                    continue
-                if skip_minimized and slot.get("minimized", False):
-                    continue
-                slot_id = slot["id"]
-                sets = slot_sets.get(slot_id, [])
-                if idx < len(sets) and sets[idx].strip():
-                    parts.append(sets[idx])
-            out_sets.append("\n".join(parts).strip())
-        return join_sets(out_sets)
+    def _set_page(self, page: int):
+        self._flush_slot_edits()
+        pages = max(1, -(-self._batch_size() // OUTPUT_PAGE_SETS))
+        page = max(0, min(page, pages - 1))
+        if page != self._page:
+            self._page = page
+            self._render_page()
+
+    def _goto_set(self, number: int):
+        idx = max(0, min(int(number) - 1, self._batch_size() - 1))
+        self._set_page(idx // OUTPUT_PAGE_SETS)
+        start, _end = self._page_range()
+        pos = sum(self._qt_len(t.strip()) + self._qt_len(DIVIDER) for t in self._batch.sets[start:idx])
+        cursor = self.output_box.textCursor()
+        cursor.setPosition(min(pos, max(0, self.output_box.document().characterCount() - 1)))
+        self.output_box.setTextCursor(cursor)
+        self.output_box.ensureCursorVisible()
+
+    @staticmethod
+    def _slot_config_signature(slots: list[dict]) -> tuple:
+        # Widgets only depend on slot identity/labels; everything else is updated in place.
+        return tuple((str(s.get("id") or ""), str(s.get("label") or "")) for s in slots)
+
+    def _slot_folder_signature(self, slots: list[dict]) -> dict[str, tuple[str, ...]]:
+        return {slot["id"]: tuple(self._slot_folder_names(slot)) for slot in slots}
+
+    def _rebuild_dynamic_slots(self, force: bool = False):
+        self._flush_slot_edits()
+        slots = self.core.get_slots()
+        config_sig = self._slot_config_signature(slots)
+        folder_sig = self._slot_folder_signature(slots)
+        if not force and config_sig == getattr(self, "_slot_config_sig", None):
+            # Same slots: keep the widgets, resync their state from settings and only
+            # rebuild the folder lists that changed.
+            self._apply_slot_visibility(slots)
+            self._refresh_browse_buttons(slots)
+            prev_folders = getattr(self, "_slot_folder_sig", {}) or {}
+            changed = [sid for sid, names in folder_sig.items() if prev_folders.get(sid) != names]
+            self._refresh_dynamic_controls(changed)
+            if changed:
+                self._refresh_dynamic_excludes(changed)
+            self._slot_folder_sig = folder_sig
+            self._ensure_batch()
+            self._recompose()
+            self._render_page()
+            return
+        self._slot_config_sig = config_sig
+        self._slot_folder_sig = folder_sig
 
-    def _rebuild_dynamic_slots(self):
         was_updating = getattr(self, "_updating_output", False)
         self._updating_output = True
         try:
-            slots = self.core.get_slots()
             self._refresh_browse_buttons(slots)
             default_ids = {"actionstyle", "clothes", "composition", "i2v"}
             default_map = {
@@ -3713,9 +4371,6 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
                 "composition": (self.composition_box, self.lbl_composition_slot, self.lbl_composition_src, self.composition_header),
                 "i2v": (self.i2v_box, self.lbl_i2v_slot, self.lbl_i2v_src, self.i2v_header),
             }
-            last_texts = self.core.settings.get("last_slot_texts", {})
-            if not isinstance(last_texts, dict):
-                last_texts = {}
             for box, _, _, header in default_map.values():
                 box.setVisible(False)
                 header.setVisible(False)
@@ -3736,8 +4391,6 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
                     box, label, src, header = default_map.get(slot_id)
                     label.setText(f"{slot['label']} slot")
                     header.setVisible(True)
-                    if slot_id in last_texts:
-                        box.setPlainText(str(last_texts.get(slot_id, "")))
                 else:
                     label = QtWidgets.QLabel(f"{slot['label']} slot")
                     src = QtWidgets.QLabel("")
@@ -3745,8 +4398,6 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
                     header = self._slot_header(label, src)
                     box = self._slot_text()
                     box.textChanged.connect(self._on_slot_text_changed)
-                    if slot_id in last_texts:
-                        box.setPlainText(str(last_texts.get(slot_id, "")))
                     self.dynamic_slots_layout.addWidget(header)
                     self.dynamic_slots_layout.addWidget(box)
                 if slot.get("minimized", False):
@@ -3762,9 +4413,15 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
             self._rebuild_dynamic_excludes(slots)
         finally:
             self._updating_output = was_updating
-        out = self._rebuild_output_from_fields()
-        if self.output_box.toPlainText() != out:
-            self.output_box.setPlainText(out)
+        self._ensure_batch()
+        self._recompose()
+        self._render_page()
+
+    def _apply_slot_visibility(self, slots: list[dict]):
+        for slot in slots:
+            box = self.dynamic_slot_boxes.get(slot["id"])
+            if box is not None:
+                box.setVisible(not slot.get("minimized", False))
 
     def _apply_default_slot_order(self, slots: list[dict], default_map: dict):
         center_layout = self.center.layout()
@@ -3989,17 +4646,19 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
 
         self._refresh_dynamic_excludes()
 
-    def _refresh_dynamic_controls(self):
+    def _refresh_dynamic_controls(self, slot_ids: list[str] | None = None):
         slots = {s["id"]: s for s in self.core.get_slots()}
         settings = self.core.settings.get("slot_settings", {})
         for slot_id, ctrl in self.dynamic_slot_controls.items():
+            # Toggles are cheap and always resynced; `slot_ids` limits the category lists.
             st = settings.get(slot_id, {})
             ctrl["gen"].setChecked(bool(st.get("gen", True)))
             ctrl["lock"].setChecked(bool(st.get("lock", False)))
+            if slot_ids is not None and slot_id not in slot_ids:
+                continue
             # categories
             slot = slots.get(slot_id, {})
-            prefix = slot.get("prefix", "")
-            items = ["None", "Any"] + [p.name for p in self.core.folders_by_prefix(prefix)]
+            items = ["None", "Any"] + self._slot_folder_names(slot)
             selected = set(self._coerce_list(st.get("category", "Any"), "Any"))
             if "None" in selected:
                 selected = {"None"}
@@ -4008,10 +4667,12 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
             self._set_list_items(ctrl["cat_list"], items, selected)
             self._update_category_button_text(ctrl["cat_btn"], selected)
 
-    def _refresh_dynamic_excludes(self):
+    def _refresh_dynamic_excludes(self, slot_ids: list[str] | None = None):
         settings = self.core.settings.get("slot_settings", {})
         slots = {s["id"]: s for s in self.core.get_slots()}
         for slot_id, data in self.dynamic_excl_vars.items():
+            if slot_ids is not None and slot_id not in slot_ids:
+                continue
             layout = data["layout"]
             items_map = data["items"]
             while layout.count():
@@ -4021,10 +4682,8 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
                     w.deleteLater()
             items_map.clear()
             slot = slots.get(slot_id, {})
-            prefix = slot.get("prefix", "")
             excluded = set(settings.get(slot_id, {}).get("excluded", []) or [])
-            for folder in self.core.folders_by_prefix(prefix):
-                name = folder.name
+            for name in self._slot_folder_names(slot):
                 cb = QtWidgets.QCheckBox(name)
                 cb.setObjectName("list_item")
                 cb.setChecked(name in excluded)
@@ -4106,52 +4765,43 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         self._write_to_settings()
 
     def _clear_dynamic_slot(self, slot_id: str):
-        box = self.dynamic_slot_boxes.get(slot_id)
-        if box:
-            box.clear()
+        if slot_id in self.dynamic_slot_boxes:
+            self._set_slot_sets(slot_id, [""] * max(1, self._batch_size()))
         self._update_slot_sources()
         self._write_to_settings()
 
     def _randomize_dynamic_slot(self, slot_id: str):
-        box = self.dynamic_slot_boxes.get(slot_id)
-        if box is None:
+        if slot_id not in self.dynamic_slot_boxes:
             return
-        self._write_to_settings()
-        slots = self.core.get_slots()
-        slot_texts = {sid: b.toPlainText().strip() for sid, b in self.dynamic_slot_boxes.items()}
+        self._write_to_settings(save=False)
         s = self.core.settings
-        settings = s.get("slot_settings", {})
-        saved = {k: dict(v) for k, v in settings.items()} if isinstance(settings, dict) else {}
-        temp = {k: dict(v) for k, v in settings.items()} if isinstance(settings, dict) else {}
-        for k, st in temp.items():
-            if k == slot_id:
-                continue
-            st["lock"] = True
-            if not slot_texts.get(k, "").strip():
-                st["gen"] = False
-        s["slot_settings"] = temp
+        self._flush_slot_edits()
+        self._ensure_batch()
+        skip_minimized = bool(s.get("skip_minimized", False))
+        seed = new_seed()
         try:
-            new_map, sources_map, out = self.core.generate_slots(
-                slots, slot_texts, skip_minimized=bool(s.get("skip_minimized", False))
+            texts, sources = self.core.generate_slot(
+                slot_id,
+                current_text=list(self._batch.slots.get(slot_id) or [""]),
+                skip_minimized=skip_minimized,
+                seed=seed,
+                context=self._batch,
             )
         except Exception as e:
             self._status(str(e))
             return
-        finally:
-            s["slot_settings"] = saved
-        if slot_id in new_map:
-            box.setPlainText(new_map[slot_id])
+        self._set_slot_sets(slot_id, texts, sources)
         prev_sources = dict(getattr(self, "last_dynamic_sources", {}) or {})
-        prev_sources[slot_id] = sources_map.get(slot_id, "") or prev_sources.get(slot_id, "")
+        prev_sources[slot_id] = self._batch.slot_sources(slot_id) or prev_sources.get(slot_id, [])
         self.last_dynamic_sources = prev_sources
-        display_out = self._rebuild_output_from_fields()
-        self.output_box.setPlainText(display_out)
         self._update_slot_sources()
-        s = self.core.settings
-        s["last_output_text"] = display_out
-        s["last_slot_texts"] = {sid: box.toPlainText() for sid, box in self.dynamic_slot_boxes.items()}
-        s["last_slot_sources"] = dict(self.last_dynamic_sources)
-        self._write_to_settings()
+        self.core.write_output(self._batch.text())
+        config = self.core.generation_config(skip_minimized=skip_minimized, seed=seed)
+        self.core.record_batch(config, self._batch, kind="slot")
+        self._persist_batch()
+        self.core.save_settings()
+        if self.core.stats.enabled:
+            self._status(self._with_call_stats("Slot randomized.", "randomize", "generate_slot"))
 
     def _install_exclude_drag(self, cb: QtWidgets.QCheckBox):
         cb.setMouseTracking(True)
@@ -4376,37 +5026,7 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         return "Dark"
 
     def _build_exclude_search_cache(self):
-        def folder_text(folder_path: Path) -> str:
-            parts = []
-            files = sorted(
-                [
-                    f
-                    for f in folder_path.iterdir()
-                    if f.is_file() and f.suffix.lower() in PROMPT_TEXT_EXTENSIONS
-                ],
-                key=lambda p: p.name.lower(),
-            )
-            for f in files:
-                try:
-                    text = f.read_text(encoding="utf-8", errors="ignore")
-                except Exception:
-                    continue
-                if text.strip():
-                    parts.append(f.name)
-                    parts.append(text)
-            return "\n".join(parts)
-
-        self._exclude_search_cache = {"ACTIONSTYLE": {}, "CLOTHES": {}, "COMPOSITION": {}, "I2V": {}}
-        for kind, names in (
-            ("ACTIONSTYLE", self.core.action_folder_names()),
-            ("CLOTHES", self.core.clothes_folder_names()),
-            ("COMPOSITION", self.core.composition_folder_names()),
-            ("I2V", self.core.i2v_folder_names()),
-        ):
-            for name in names:
-                folder = self.core.library_dir / name
-                text = folder_text(folder)
-                self._exclude_search_cache[kind][name] = f"{name}\n{text}".lower()
+        self._exclude_search_cache = self.core.exclude_search_cache()
 
     def _apply_exclude_filter(self, kind: str):
         kind = kind.upper()
@@ -4428,6 +5048,8 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
                 cb.setVisible(True)
             return
 
+        if self._exclude_search_cache is None:
+            self._build_exclude_search_cache()
         cache = self._exclude_search_cache.get(kind, {})
         for name, cb in mapping.items():
             hay = cache.get(name, name.lower())
@@ -4509,6 +5131,7 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
         set_btn(self.btn_save, "save")
         set_btn(self.btn_create, "create")
         set_btn(self.btn_assign_tag, "assign_tag")
+        set_btn(self.btn_history, "history")
         set_btn(self.btn_manage_slots, "manage_slots", fallback_key="customise")
         set_btn(self.btn_reload, "reload")
         set_btn(self.btn_customize, "customise")
@@ -4544,13 +5167,28 @@ class PromptZoneWindow(QtWidgets.QMainWindow):
 
 
 def main():
-    app = QtWidgets.QApplication(sys.argv)
+    argv = list(sys.argv)
+    profile = StartupProfile("--startup-profile" in argv, t0=_IMPORT_T0)
+    core_stats = "--core-stats" in argv
+    argv = [a for a in argv if a not in ("--startup-profile", "--core-stats")]
+    pack = None
+    if "--pack" in argv:
+        i = argv.index("--pack")
+        if i + 1 < len(argv):
+            pack = Path(argv[i + 1])
+        del argv[i : i + 2]
+    profile.mark("imports")
+    app = QtWidgets.QApplication(argv)
     base_font = QtGui.QFont("Roboto")
     base_font.setPointSize(12)
     app.setFont(base_font)
-    window = PromptZoneWindow()
+    profile.mark("qapplication")
+    window = PromptZoneWindow(profile, core_stats=core_stats, pack=pack)
     window.show()
-    sys.exit(app.exec())
+    code = app.exec()
+    if core_stats:
+        sys.stderr.write(window.core.stats.to_json() + "\n")
+    sys.exit(code)
 
 
 if __name__ == "__main__":
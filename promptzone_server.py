@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlencode, urlsplit
+import http.client
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from promptzone_core import MAX_SETS, PromptZoneCore
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+LATENCY_WINDOW = 1024
+MAX_BODY = 1 << 20
+MAX_SEARCH = 1000
+
+
+class RequestMetrics:
+    # Per-route request counts, errors and latency; percentiles come from the last
+    # LATENCY_WINDOW requests of each route.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.routes: dict[str, dict] = {}
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def end(self, route: str, ms: float, ok: bool):
+        with self._lock:
+            self.in_flight -= 1
+            r = self.routes.get(route)
+            if r is None:
+                r = self.routes[route] = {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+                r["recent"] = deque(maxlen=LATENCY_WINDOW)
+            r["count"] += 1
+            r["errors"] += 0 if ok else 1
+            r["total_ms"] += ms
+            r["max_ms"] = max(r["max_ms"], ms)
+            r["recent"].append(ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            routes = {}
+            for name, r in self.routes.items():
+                recent = sorted(r["recent"])
+
+                def pct(q):
+                    return round(recent[min(len(recent) - 1, int(q * len(recent)))], 3) if recent else 0.0
+
+                routes[name] = {
+                    "count": r["count"],
+                    "errors": r["errors"],
+                    "mean_ms": round(r["total_ms"] / r["count"], 3) if r["count"] else 0.0,
+                    "p50_ms": pct(0.5),
+                    "p95_ms": pct(0.95),
+                    "p99_ms": pct(0.99),
+                    "max_ms": round(r["max_ms"], 3),
+                }
+            return {
+                "uptime_s": round(time.time() - self.started, 1),
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "routes": routes,
+            }
+
+
+class PromptZoneService:
+    # Request handlers over one warm core; requests run concurrently on the server's
+    # threads and share its index, compiled plans and repeat state.
+    def __init__(self, core: PromptZoneCore):
+        self.core = core
+        self.metrics = RequestMetrics()
+        self.routes = {
+            ("GET", "/health"): self.health,
+            ("GET", "/metrics"): self.get_metrics,
+            ("GET", "/slots"): self.slots,
+            ("GET", "/browse"): self.browse,
+            ("GET", "/search"): self.search,
+            ("POST", "/generate"): self.generate,
+            ("POST", "/generate_slot"): self.generate_slot,
+            ("POST", "/reload"): self.reload,
+        }
+
+    def health(self, params: dict) -> dict:
+        return {"ok": True, "ready": self.core.is_ready, "library": str(self.core.library_dir)}
+
+    def get_metrics(self, params: dict) -> dict:
+        return {"requests": self.metrics.snapshot(), "core": self.core.stats.snapshot()}
+
+    def slots(self, params: dict) -> dict:
+        return {"slots": self.core.get_slots()}
+
+    def _slot_prefixes(self, params: dict) -> list[str]:
+        prefixes = params.get("prefix") or [s["prefix"] for s in self.core.get_slots() if s.get("prefix")]
+        return [prefixes] if isinstance(prefixes, str) else list(prefixes)
+
+    def browse(self, params: dict) -> dict:
+        out = []
+        for prefix in self._slot_prefixes(params):
+            for folder in self.core.folders_by_prefix(prefix):
+                out.append({"name": folder.name, "files": len(self.core.index.nonempty_files(folder))})
+        return {"folders": out}
+
+    def search(self, params: dict) -> dict:
+        query = str(params.get("q") or params.get("query") or "")
+        limit = self._int_param(params, "limit", MAX_SEARCH) or 50
+        results = []
+        for prefix in self._slot_prefixes(params):
+            for label, _path, text in self.core.browse_entries("", query, prefix):
+                results.append({"label": label, "text": text})
+                if len(results) >= limit:
+                    return {"results": results, "truncated": True}
+        return {"results": results, "truncated": False}
+
+    @staticmethod
+    def _int_param(params: dict, key: str, most: int) -> int | None:
+        # Clamped to 1..most so one request cannot run unbounded; None when absent.
+        value = params.get(key)
+        if value is None:
+            return None
+        if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+            value = int(value)
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError(f"{key} must be an integer.")
+        return max(1, min(most, value))
+
+    def _n(self, params: dict) -> int | None:
+        # Set count, capped like the GUI's field.
+        return self._int_param(params, "n", MAX_SETS)
+
+    def generate(self, params: dict) -> dict:
+        slots = self.core.get_slots()
+        wanted = params.get("slots")
+        if wanted is not None and (not isinstance(wanted, list) or not all(isinstance(v, str) for v in wanted)):
+            raise ValueError("slots must be a list of slot ids.")
+        if wanted:
+            known = {s["id"] for s in slots}
+            missing = [sid for sid in wanted if sid not in known]
+            if missing:
+                raise ValueError(f"Unknown slot: {missing[0]}")
+            slots = [s for s in slots if s["id"] in wanted]
+        config = self.core.generation_config(slots, bool(params.get("skip_minimized", False)), self._n(params))
+        batch = self.core.generate_batch(config, params.get("slot_texts") or {}, bool(params.get("write_output", False)))
+        # Lists per slot and per set; clients join them if they need one text.
+        return batch.to_dict()
+
+    def generate_slot(self, params: dict) -> dict:
+        slot_id = str(params.get("slot") or "")
+        if not slot_id:
+            raise ValueError("slot is required.")
+        texts, sources = self.core.generate_slot(slot_id, self._n(params), str(params.get("current_text") or ""))
+        return {"texts": texts, "sources": sources}
+
+    def reload(self, params: dict) -> dict:
+        self.core.reload_library()
+        return {"ok": True}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "PromptZone"
+
+    def _params(self, query: str) -> dict:
+        params = {}
+        for key, values in parse_qs(query).items():
+            params[key] = values if key == "prefix" and len(values) > 1 else values[-1]
+        if self.command == "POST":
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY:
+                raise ValueError("Request body too large.")
+            if length:
+                body = json.loads(self.rfile.read(length).decode("utf-8"))
+                if not isinstance(body, dict):
+                    raise ValueError("Request body must be a JSON object.")
+                params.update(body)
+        return params
+
+    def _dispatch(self):
+        service: PromptZoneService = self.server.service
+        url = urlsplit(self.path)
+        handler = service.routes.get((self.command, url.path))
+        t0 = time.perf_counter()
+        service.metrics.begin()
+        ok = False
+        try:
+            if handler is None:
+                status, payload = 404, {"error": f"No route: {self.command} {url.path}"}
+            else:
+                try:
+                    status, payload = 200, handler(self._params(url.query))
+                    ok = True
+                except (ValueError, TypeError) as e:
+                    status, payload = 400, {"error": str(e)}
+                except Exception as e:
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+            if not ok:
+                # The request body may be unread; do not reuse the connection.
+                self.close_connection = True
+            ms = (time.perf_counter() - t0) * 1000.0
+            payload["ms"] = round(ms, 3)
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            service.metrics.end(url.path if handler is not None else "<unknown>", (time.perf_counter() - t0) * 1000.0, ok)
+
+    do_GET = _dispatch
+    do_POST = _dispatch
+
+    def address_string(self) -> str:
+        # Unix socket peers have no address tuple.
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format: str, *args):
+        if getattr(self.server, "verbose", False):
+            super().log_message(format, *args)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_server(
+    core: PromptZoneCore,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    socket_path: Path | None = None,
+    verbose: bool = False,
+):
+    # port=0 picks a free port (see server.server_address).
+    if socket_path is not None:
+        socket_path = Path(socket_path)
+        if socket_path.exists():
+            socket_path.unlink()
+        server = _UnixHTTPServer(str(socket_path), _Handler)
+    else:
+        server = _HTTPServer((host, port), _Handler)
+    server.service = PromptZoneService(core)
+    server.verbose = verbose
+    return server
+
+
+def serve(
+    core: PromptZoneCore,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    socket_path: Path | None = None,
+    verbose: bool = False,
+    on_listen=None,
+):
+    core.wait_ready()
+    server = make_server(core, host, port, socket_path, verbose)
+    if on_listen is not None:
+        on_listen(server)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None:
+            try:
+                os.unlink(socket_path)
+            except OSError:
+                pass
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float | None = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class PromptZoneClient:
+    # Minimal client for `promptzone serve`; one connection per call, safe across threads.
+    def __init__(
+        self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: Path | None = None, timeout: float = 30.0
+    ):
+        self.host = host
+        self.port = port
+        self.socket_path = str(socket_path) if socket_path else None
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, body: dict | None = None) -> dict:
+        if self.socket_path:
+            conn = _UnixConnection(self.socket_path, self.timeout)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            data = json.dumps(body or {}).encode("utf-8") if method == "POST" else None
+            headers = {"Content-Type": "application/json"} if data is not None else {}
+            conn.request(method, path, body=data, headers=headers)
+            resp = conn.getresponse()
+            payload = json.loads(resp.read().decode("utf-8") or "{}")
+        finally:
+            conn.close()
+        if resp.status != 200:
+            raise ValueError(payload.get("error") or f"HTTP {resp.status}")
+        return payload
+
+    def _get(self, path: str, **params) -> dict:
+        query = urlencode({k: v for k, v in params.items() if v is not None}, doseq=True)
+        return self._request("GET", f"{path}?{query}" if query else path)
+
+    def health(self) -> dict:
+        return self._get("/health")
+
+    def metrics(self) -> dict:
+        return self._get("/metrics")
+
+    def slots(self) -> list[dict]:
+        return self._get("/slots")["slots"]
+
+    def browse(self, prefix: str | list[str] | None = None) -> list[dict]:
+        return self._get("/browse", prefix=prefix)["folders"]
+
+    def search(self, query: str, prefix: str | list[str] | None = None, limit: int = 50) -> list[dict]:
+        return self._get("/search", q=query, prefix=prefix, limit=limit)["results"]
+
+    def generate(
+        self,
+        slots: list[str] | None = None,
+        n: int | None = None,
+        slot_texts: dict[str, str] | None = None,
+        write_output: bool = False,
+    ) -> dict:
+        body = {"slots": slots, "n": n, "slot_texts": slot_texts or {}, "write_output": write_output}
+        return self._request("POST", "/generate", body)
+
+    def generate_slot(self, slot: str, n: int | None = None, current_text: str = "") -> dict:
+        return self._request("POST", "/generate_slot", {"slot": slot, "n": n, "current_text": current_text})
+
+    def reload(self) -> dict:
+        return self._request("POST", "/reload")
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from pathlib import Path
+import json
+import os
+import threading
+
+# Volatile UI/session state, kept out of settings.json:
+#   session/<key>.json   one small file per key (last slot texts, window and popup geometry, ...)
+# set() only updates memory; flush() (on a timer and on exit) rewrites the keys that changed,
+# each with a write-then-rename so a crash leaves the previous value in place.
+
+SESSION_DIR = "session"
+SESSION_KEYS = (
+    "last_slot_texts",
+    "last_slot_sources",
+    "window_geometry_qt",
+    "popup_geometry",
+    "popup_splitters",
+)
+# Older settings.json keys that are dropped instead of moved.
+DROPPED_KEYS = ("last_output_text",)
+
+
+class SessionStore:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._values: dict[str, object] = {}
+        # Serialised form of each key as last read or written; flush() skips unchanged keys.
+        self._written: dict[str, str] = {}
+        self._dirty: set[str] = set()
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{key}.json"
+
+    def _read(self, key: str):
+        if key in self._values:
+            return self._values[key]
+        value = None
+        try:
+            raw = self._file(key).read_text(encoding="utf-8")
+            value = json.loads(raw)
+            self._written[key] = raw
+        except Exception:
+            pass
+        self._values[key] = value
+        return value
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            value = self._read(key)
+        return default if value is None else value
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._values[key] = value
+            self._dirty.add(key)
+
+    def has(self, key: str) -> bool:
+        with self._lock:
+            return self._read(key) is not None
+
+    def migrate(self, settings: dict) -> bool:
+        # Moves session keys out of a settings dict; True when settings changed. Keys are
+        # only removed from `settings` once their files are written, so an unwritable
+        # session directory leaves them where they were.
+        keys = [key for key in SESSION_KEYS if key in settings]
+        for key in keys:
+            if not self.has(key):
+                self.set(key, settings[key])
+        changed = False
+        if keys:
+            self.flush()
+            with self._lock:
+                written = not (self._dirty & set(keys))
+            if written:
+                for key in keys:
+                    del settings[key]
+                changed = True
+        for key in DROPPED_KEYS:
+            if settings.pop(key, None) is not None:
+                changed = True
+        return changed
+
+    def flush(self) -> int:
+        # Writes changed keys; returns how many files were written.
+        with self._lock:
+            if not self._dirty:
+                return 0
+            pending = [(key, json.dumps(self._values.get(key), ensure_ascii=False)) for key in sorted(self._dirty)]
+            self._dirty.clear()
+            written = 0
+            for key, raw in pending:
+                if self._written.get(key) == raw:
+                    continue
+                try:
+                    self.path.mkdir(parents=True, exist_ok=True)
+                    target = self._file(key)
+                    tmp = target.with_suffix(".tmp")
+                    tmp.write_text(raw, encoding="utf-8")
+                    os.replace(tmp, target)
+                    self._written[key] = raw
+                    written += 1
+                except Exception:
+                    self._dirty.add(key)
+            return written
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import re
+
+# Prompt templates:
+#   {red|blue|green}   one alternative per expansion (alternatives may nest)
+#   __CLOTHES_JACKETS__ a random prompt from that category, itself expanded
+#   \{ \| \}           literal characters (in a prompt that has a choice or reference)
+# Braces without a top-level "|" and references to unknown categories stay literal, as do
+# references that would recurse into a category being expanded or nest deeper than
+# MAX_TEMPLATE_DEPTH, so one bad prompt never fails a whole batch.
+
+MAX_TEMPLATE_DEPTH = 8
+
+_REF_RE = re.compile(r"__([A-Za-z0-9](?:[A-Za-z0-9_]*[A-Za-z0-9])?)__")
+_ESCAPABLE = "{|}"
+
+
+class Choice:
+    __slots__ = ("options",)
+
+    def __init__(self, options: tuple[tuple, ...]):
+        self.options = options
+
+
+class Ref:
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+def _literal(text: str, out: list):
+    if not text:
+        return
+    pos = 0
+    for m in _REF_RE.finditer(text):
+        if m.start() > pos:
+            out.append(text[pos : m.start()])
+        out.append(Ref(m.group(1)))
+        pos = m.end()
+    if pos < len(text):
+        out.append(text[pos:])
+
+
+def _parse_seq(text: str, i: int, nested: bool) -> tuple[tuple, int, str | None]:
+    # Parses up to a top-level "|" or "}" (when nested) or the end of the text.
+    nodes: list = []
+    buf: list[str] = []
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch == "\\" and i + 1 < n and text[i + 1] in _ESCAPABLE:
+            buf.append(text[i + 1])
+            i += 2
+            continue
+        if ch == "{":
+            choice, j, closed = _parse_choice(text, i + 1)
+            if choice is None:
+                # "{x}" stays literal as a whole; an unclosed "{" is just a character.
+                end = j if closed else i + 1
+                buf.append(text[i:end])
+                i = end
+                continue
+            _literal("".join(buf), nodes)
+            buf = []
+            nodes.append(choice)
+            i = j
+            continue
+        if nested and ch in "|}":
+            _literal("".join(buf), nodes)
+            return tuple(nodes), i, ch
+        buf.append(ch)
+        i += 1
+    _literal("".join(buf), nodes)
+    return tuple(nodes), i, None
+
+
+def _parse_choice(text: str, i: int) -> tuple[Choice | None, int, bool]:
+    options = []
+    while True:
+        seq, i, stop = _parse_seq(text, i, True)
+        if stop is None:
+            return None, i, False
+        options.append(seq)
+        i += 1
+        if stop == "}":
+            break
+    if len(options) < 2:
+        return None, i, True
+    return Choice(tuple(options)), i, True
+
+
+def compile_template(text: str) -> tuple | None:
+    # Node tuple (str | Choice | Ref), or None when the text has nothing to expand.
+    if "{" not in text and "__" not in text and "\\" not in text:
+        return None
+    nodes, _i, _stop = _parse_seq(text, 0, False)
+    # Escapes alone do not make a template: such text is a plain prompt, kept as written.
+    if all(type(node) is str for node in nodes):
+        return None
+    return nodes
+
+
+def expand(nodes: tuple, rng, resolve, stack: tuple[str, ...] = (), max_depth: int = MAX_TEMPLATE_DEPTH) -> str:
+    # resolve(name, rng) -> (text, compiled) for a random prompt of category `name`, or
+    # None when it does not exist. `stack` holds the categories being expanded.
+    # Unresolvable, cyclic and too-deep references are emitted as written.
+    out = []
+    for node in nodes:
+        kind = type(node)
+        if kind is str:
+            out.append(node)
+        elif kind is Choice:
+            out.append(expand(rng.choice(node.options), rng, resolve, stack, max_depth))
+        else:
+            name = node.name
+            if name in stack or len(stack) > max_depth:
+                out.append(f"__{name}__")
+                continue
+            picked = resolve(name, rng)
+            if picked is None:
+                out.append(f"__{name}__")
+                continue
+            text, compiled = picked
+            out.append(text if compiled is None else expand(compiled, rng, resolve, stack + (name,), max_depth))
+    return "".join(out)
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from pathlib import Path
+import re
+
+# Length measures for prompt budgets. Specs (settings "tokenizer"):
+#   "words"                 whitespace-separated words (default, always available)
+#   "chars"                 characters
+#   "tiktoken:<encoding>"   tiktoken encoding (optional package, must be cached offline)
+#   "hf:<tokenizer.json>"   Hugging Face `tokenizers` file, e.g. a CLIP tokenizer.json
+# A spec whose package or file is unavailable falls back to "words".
+
+DEFAULT_TOKENIZER = "words"
+
+_WORD_RE = re.compile(r"\S+")
+
+
+class Tokenizer:
+    def __init__(self, name: str, count):
+        self.name = name
+        self.count = count
+
+    def __repr__(self) -> str:
+        return f"Tokenizer({self.name!r})"
+
+
+def count_words(text: str) -> int:
+    return sum(1 for _ in _WORD_RE.finditer(text))
+
+
+def count_chars(text: str) -> int:
+    return len(text)
+
+
+def _tiktoken(encoding: str) -> Tokenizer:
+    import tiktoken
+
+    enc = tiktoken.get_encoding(encoding)
+    return Tokenizer(f"tiktoken:{encoding}", lambda text: len(enc.encode_ordinary(text)))
+
+
+def _hf(path: str) -> Tokenizer:
+    from tokenizers import Tokenizer as HFTokenizer
+
+    tok = HFTokenizer.from_file(str(Path(path).expanduser()))
+    return Tokenizer(f"hf:{path}", lambda text: len(tok.encode(text, add_special_tokens=False).ids))
+
+
+def load_tokenizer(spec: str | None = None) -> Tokenizer:
+    spec = str(spec or DEFAULT_TOKENIZER).strip()
+    if spec == "chars":
+        return Tokenizer("chars", count_chars)
+    kind, _, arg = spec.partition(":")
+    try:
+        if kind == "tiktoken" and arg:
+            return _tiktoken(arg)
+        if kind == "hf" and arg:
+            return _hf(arg)
+    except Exception:
+        pass
+    return Tokenizer("words", count_words)
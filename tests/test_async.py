@@ -0,0 +1,47 @@
+import asyncio
+
+from promptzone_async import AsyncPromptZone
+from promptzone_core import MemoryStorage, PromptZoneCore
+
+
+def _core(tmp_path):
+    folders = {f"SLOT_1_C{c:02d}": {f"p{i}.md": f"c{c} p{i}" for i in range(3)} for c in range(30)}
+    core = PromptZoneCore(tmp_path, background=False, storage=MemoryStorage(folders))
+    core.settings["slots"] = [{"id": "a", "label": "A", "prefix": "SLOT_1_"}]
+    return core
+
+
+def _stream(core, **kwargs):
+    async def run():
+        pz = AsyncPromptZone(core)
+        try:
+            return [row async for row in pz.stream(**kwargs)]
+        finally:
+            await pz.close()
+
+    return asyncio.run(run())
+
+
+def test_stream_keeps_one_per_folder_across_chunks(tmp_path):
+    core = _core(tmp_path)
+    core.settings["only_one_per_folder"] = True
+    rows = _stream(core, n=25, chunk=4)
+    assert len(rows) == 25
+    folders = [sources["a"].split("\\")[0] for _texts, sources, _composed in rows]
+    assert len(set(folders)) == 25
+
+
+def test_unbounded_stream_stops_with_the_consumer(tmp_path):
+    core = _core(tmp_path)
+
+    async def run():
+        pz = AsyncPromptZone(core)
+        rows = []
+        async for row in pz.stream(chunk=3):
+            rows.append(row)
+            if len(rows) == 7:
+                break
+        await pz.close()
+        return rows
+
+    assert len(asyncio.run(run())) == 7
@@ -0,0 +1,76 @@
+from promptzone_core import BloomFilter
+
+
+def test_add_and_contains(tmp_path):
+    bf = BloomFilter(tmp_path / "f.bloom", capacity=1000, fp_rate=0.01)
+    assert "a" not in bf
+    bf.add("a")
+    assert "a" in bf
+    assert bf.count == 1
+
+
+def test_add_if_new(tmp_path):
+    bf = BloomFilter(tmp_path / "f.bloom", capacity=1000, fp_rate=0.01)
+    assert bf.add_if_new("set-1")
+    assert not bf.add_if_new("set-1")
+    assert bf.add_if_new("set-2")
+    assert bf.count == 2
+
+
+def test_false_positive_rate(tmp_path):
+    bf = BloomFilter(tmp_path / "f.bloom", capacity=2000, fp_rate=0.01)
+    for i in range(2000):
+        bf.add(f"in-{i}")
+    assert all(f"in-{i}" in bf for i in range(2000))
+    false_hits = sum(1 for i in range(5000) if f"out-{i}" in bf)
+    assert false_hits / 5000 < 0.03
+
+
+def test_flush_and_reload(tmp_path):
+    path = tmp_path / "f.bloom"
+    bf = BloomFilter(path, capacity=1000, fp_rate=0.01)
+    bf.add("first")
+    bf.flush()
+    # A second flush only rewrites the touched bytes.
+    bf.add("second")
+    bf.flush()
+    again = BloomFilter(path, capacity=1000, fp_rate=0.01)
+    assert "first" in again and "second" in again
+    assert again.count == 2
+
+
+def test_other_parameters_start_empty(tmp_path):
+    path = tmp_path / "f.bloom"
+    bf = BloomFilter(path, capacity=1000, fp_rate=0.01)
+    bf.add("x")
+    bf.flush()
+    assert "x" not in BloomFilter(path, capacity=5000, fp_rate=0.01)
+
+
+def test_truncated_file_starts_empty(tmp_path):
+    path = tmp_path / "f.bloom"
+    bf = BloomFilter(path, capacity=1000, fp_rate=0.01)
+    bf.add("x")
+    bf.flush()
+    path.write_bytes(path.read_bytes()[:40])
+    again = BloomFilter(path, capacity=1000, fp_rate=0.01)
+    assert again.count == 0 and "x" not in again
+
+
+def test_starts_over_when_full(tmp_path):
+    bf = BloomFilter(tmp_path / "f.bloom", capacity=10, fp_rate=0.01)
+    for i in range(10):
+        bf.add(f"k{i}")
+    bf.add("k10")
+    assert bf.count == 1
+    assert "k10" in bf
+
+
+def test_clear(tmp_path):
+    path = tmp_path / "f.bloom"
+    bf = BloomFilter(path, capacity=1000, fp_rate=0.01)
+    bf.add("x")
+    bf.flush()
+    bf.clear()
+    bf.flush()
+    assert "x" not in BloomFilter(path, capacity=1000, fp_rate=0.01)
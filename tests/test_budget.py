@@ -0,0 +1,29 @@
+from promptzone_core import MemoryStorage, PromptZoneCore
+
+
+def _core(tmp_path, folders):
+    core = PromptZoneCore(tmp_path, background=False, storage=MemoryStorage(folders))
+    core.settings["slots"] = [{"id": "a", "label": "A", "prefix": "SLOT_1_"}]
+    core.settings["token_budget"] = 3
+    return core
+
+
+def _folders(core):
+    return [f.name for f in core.generation_plan().slots[0].folders]
+
+
+def test_plan_follows_expand_templates_under_budget(tmp_path):
+    core = _core(
+        tmp_path,
+        {
+            "SLOT_1_PLAIN": {"p.md": "short"},
+            # Over the budget raw; templates are only measured once expanded.
+            "SLOT_1_TPL": {"t.md": "{red|blue} w w w w"},
+        },
+    )
+    core.settings["expand_templates"] = True
+    assert _folders(core) == ["SLOT_1_PLAIN", "SLOT_1_TPL"]
+    core.settings["expand_templates"] = False
+    assert _folders(core) == ["SLOT_1_PLAIN"]
+    core.settings["expand_templates"] = True
+    assert _folders(core) == ["SLOT_1_PLAIN", "SLOT_1_TPL"]
@@ -0,0 +1,64 @@
+from promptzone_core import MemoryStorage, PromptZoneCore
+
+SLOTS = [
+    {"id": "a", "label": "A", "prefix": "SLOT_1_"},
+    {"id": "b", "label": "B", "prefix": "SLOT_2_"},
+]
+
+
+def _core(tmp_path, folders, **settings):
+    core = PromptZoneCore(tmp_path, background=False, storage=MemoryStorage(folders))
+    core.settings["slots"] = SLOTS
+    core.settings.update(settings)
+    return core
+
+
+def _library():
+    folders = {f"SLOT_1_C{c}": {f"p{i}.md": f"a{c} p{i}" for i in range(4)} for c in range(10)}
+    folders["SLOT_2_ALL"] = {f"p{i}.md": f"b p{i}" for i in range(6)}
+    return folders
+
+
+def test_same_seed_same_batch(tmp_path):
+    batches = []
+    for run in range(2):
+        core = _core(tmp_path / str(run), _library())
+        batches.append(core.generate_batch(core.generation_config(n=5, seed=1234)).to_dict())
+    assert batches[0] == batches[1]
+    core = _core(tmp_path / "other", _library())
+    assert core.generate_batch(core.generation_config(n=5, seed=4321)).to_dict() != batches[0]
+
+
+def test_one_per_folder(tmp_path):
+    core = _core(tmp_path, _library(), only_one_per_folder=True)
+    for seed in range(5):
+        batch = core.generate_batch(core.generation_config(n=10, seed=seed))
+        folders = [source.split("\\")[0] for source in batch.sources["a"]]
+        assert len(set(folders)) == 10
+
+
+def test_budget_cuts_long_prompts(tmp_path):
+    folders = {
+        "SLOT_1_FIXED": {"p.md": "x y"},
+        "SLOT_2_MIXED": {"short.md": "z", "long.md": "p q r"},
+    }
+    core = _core(tmp_path, folders, token_budget=3, avoid_repeats=False)
+    batch = core.generate_batch(core.generation_config(n=20, seed=7))
+    assert batch.slots["a"] == ["x y"] * 20
+    assert batch.slots["b"] == ["z"] * 20
+    assert all(len(text.split()) <= 3 for text in batch.sets)
+
+
+def test_generate_slot_avoids_sets_in_context(tmp_path):
+    folders = {
+        "SLOT_1_FIXED": {"p.md": "x"},
+        "SLOT_2_PAIR": {"one.md": "b1", "two.md": "b2"},
+    }
+    core = _core(tmp_path, folders, suppress_duplicate_sets=True, avoid_repeats=False)
+    for seed in range(5):
+        core.clear_emitted_sets()
+        batch = core.generate_batch(core.generation_config(n=1, seed=seed))
+        texts, sources = core.generate_slot("b", n=1, seed=seed, context=batch)
+        # The only unseen set with the context's "x" swaps b for the other file.
+        assert texts != batch.slots["b"]
+        assert sources != batch.sources["b"]
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+import promptzone_dedupe
+from promptzone_core import NEAR_DUPLICATES_FILE, MemoryStorage, PromptZoneCore
+from promptzone_dedupe import (
+    MINHASH_CACHE_FILE,
+    MinHasher,
+    estimate_jaccard,
+    find_near_duplicates,
+    save_exclusions,
+    shingles,
+)
+
+BASE = "red leather jacket with silver zippers and a tall collar"
+
+
+def _core(tmp_path, folders):
+    return PromptZoneCore(tmp_path, background=False, storage=MemoryStorage(folders))
+
+
+def test_shingles():
+    assert shingles("") == set()
+    assert len(shingles("one two")) == 1
+    assert len(shingles("a b c d")) == 2
+    assert shingles("A, B. C") == shingles("a b c")
+
+
+def test_signature_is_stable_and_roundtrips():
+    hasher = MinHasher(64)
+    sig = hasher.signature(BASE)
+    assert len(sig) == 64
+    assert MinHasher(64).signature(BASE) == sig
+    assert MinHasher.decode(MinHasher.encode(sig)) == sig
+
+
+def test_numpy_and_python_signatures_match(monkeypatch):
+    hasher = MinHasher(32)
+    with_numpy = hasher.signature(BASE)
+    monkeypatch.setattr(promptzone_dedupe, "load_numpy", lambda: None)
+    assert hasher.signature(BASE) == with_numpy
+
+
+def test_estimate_jaccard():
+    hasher = MinHasher(256)
+    a = hasher.signature(BASE)
+    assert estimate_jaccard(a, a) == 1.0
+    near = estimate_jaccard(a, hasher.signature(BASE + " please"))
+    far = estimate_jaccard(a, hasher.signature("a bowl of soup on a wooden table at dawn"))
+    assert near > 0.6 and far < 0.2
+
+
+def test_clusters_and_signature_cache(tmp_path):
+    core = _core(tmp_path, {"A_X": {"p0.md": BASE, "p1.md": BASE + " now", "p2.md": "something else entirely here"}})
+    report = find_near_duplicates(core, 0.5)
+    assert report["clusters"] == [["A_X/p0.md", "A_X/p1.md"]]
+    assert report["hashed"] == 3 and report["duplicates"] == 1
+    assert find_near_duplicates(core, 0.5)["hashed"] == 0
+
+
+def test_num_perm_must_divide_into_bands(tmp_path):
+    with pytest.raises(ValueError):
+        find_near_duplicates(_core(tmp_path, {}), num_perm=100, bands=32)
+
+
+def test_prefix_run_keeps_other_prefixes(tmp_path):
+    folders = {
+        "A_X": {f"p{i}.md": f"{BASE} a{i}" for i in range(3)},
+        "B_Y": {f"p{i}.md": f"{BASE} b{i}" for i in range(3)},
+    }
+    core = _core(tmp_path, folders)
+    save_exclusions(core, find_near_duplicates(core, 0.5))
+    before = json.loads((tmp_path / NEAR_DUPLICATES_FILE).read_text())
+    b_hidden = [label for label in before if label.startswith("B_Y/")]
+    assert b_hidden
+
+    report = find_near_duplicates(core, 0.5, prefixes=["A_"])
+    assert report["hashed"] == 0
+    cache = json.loads((tmp_path / MINHASH_CACHE_FILE).read_text())
+    assert len(cache["signatures"]) == 6
+
+    save_exclusions(core, report)
+    after = json.loads((tmp_path / NEAR_DUPLICATES_FILE).read_text())
+    assert [label for label in after if label.startswith("B_Y/")] == b_hidden
+    assert [label for label in after if label.startswith("A_X/")] == ["A_X/p1.md", "A_X/p2.md"]
+    assert find_near_duplicates(core, 0.5)["hashed"] == 0
@@ -0,0 +1,116 @@
+import json
+
+from promptzone_core import Batch
+from promptzone_history import HistoryStore
+
+
+def _record(i, text=None):
+    return {
+        "ts": i,
+        "n": 2,
+        "active": ["a", "b"],
+        "slots": {"a": [text or f"red jacket {i}", "blue hat"], "b": ["boots", ""]},
+        "sources": {"a": [f"CLOTHES_JACKETS/file{i % 3}.md", ""], "b": ["", ""]},
+    }
+
+
+def _filled(tmp_path, count=10):
+    store = HistoryStore(tmp_path / "history.jsonl")
+    for i in range(count):
+        assert store.append(_record(i)) == i
+    return store
+
+
+def test_append_get_and_page(tmp_path):
+    store = _filled(tmp_path, 120)
+    assert len(store) == 120
+    assert store.get(5)["slots"]["a"][0] == "red jacket 5"
+    assert store.latest()["id"] == 119
+    assert [row["id"] for row in store.page(0)][:2] == [119, 118]
+    assert len(store.page(2)) == 20
+    assert store.summary(3)["preview"] == "red jacket 3 boots"
+    assert store.get(120) is None
+
+
+def test_record_composes_sets_on_restore(tmp_path):
+    store = _filled(tmp_path, 1)
+    batch = Batch.from_dict(store.get(0))
+    assert batch.sets == ["red jacket 0\nboots", "blue hat"]
+
+
+def test_index_rebuilt_when_missing(tmp_path):
+    _filled(tmp_path)
+    (tmp_path / "history.idx").unlink()
+    store = HistoryStore(tmp_path / "history.jsonl")
+    assert len(store) == 10
+    assert store.get(9)["slots"]["a"][0] == "red jacket 9"
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    _filled(tmp_path)
+    with (tmp_path / "history.jsonl").open("ab") as f:
+        f.write(b'{"ts": 1, "sl')
+    store = HistoryStore(tmp_path / "history.jsonl")
+    assert len(store) == 10
+    assert store.append(_record(10, "after the tear")) == 10
+    again = HistoryStore(tmp_path / "history.jsonl")
+    assert len(again) == 11
+    assert again.get(10)["slots"]["a"][0] == "after the tear"
+    assert again.search("tear") == [10]
+
+
+def test_search_word_prefixes(tmp_path):
+    store = _filled(tmp_path, 12)
+    assert store.search("") == list(range(11, -1, -1))
+    assert store.search("jack")[0] == 11
+    assert store.search("file1 red") == [10, 7, 4, 1]
+    assert store.search("zzz") == []
+    store.append(_record(12, "green scarf"))
+    assert store.search("scarf") == [12]
+
+
+def test_word_index_is_persisted(tmp_path):
+    store = _filled(tmp_path)
+    assert store.search("hat") == list(range(9, -1, -1))
+    words = json.loads((tmp_path / "history.words").read_text())
+    assert words["count"] == 10
+    HistoryStore(tmp_path / "history.jsonl").append(_record(10, "purple cape"))
+    reopened = HistoryStore(tmp_path / "history.jsonl")
+    assert reopened.search("purple") == [10]
+    # New records go to the delta log; the saved index is not rewritten on search.
+    assert json.loads((tmp_path / "history.words").read_text())["count"] == 10
+    deltas = [json.loads(line) for line in (tmp_path / "history.wlog").read_text().splitlines()]
+    assert [d["id"] for d in deltas] == [10]
+
+
+def test_word_deltas_fill_gaps(tmp_path):
+    store = _filled(tmp_path)
+    store.search("hat")
+    store.append(_record(10, "amber coat"))
+    store.append(_record(11, "teal scarf"))
+    # A lost delta (crash after the log write) is read back from the log.
+    lines = (tmp_path / "history.wlog").read_text().splitlines()
+    (tmp_path / "history.wlog").write_text(lines[1] + "\n")
+    reopened = HistoryStore(tmp_path / "history.jsonl")
+    assert reopened.search("amber") == [10]
+    assert reopened.search("teal") == [11]
+    again = HistoryStore(tmp_path / "history.jsonl")
+    assert again.search("scarf") == [11]
+
+
+def test_retention_drops_oldest(tmp_path):
+    store = HistoryStore(tmp_path / "history.jsonl", keep=8)
+    for i in range(10):
+        store.append(_record(i))
+    assert len(store) == 10
+    # Compacts once the log holds more than a quarter over `keep`; ids shift.
+    assert store.append(_record(10)) == 7
+    assert len(store) == 8
+    assert store.get(0)["ts"] == 3
+    assert store.search("jacket")[0] == 7
+    reopened = HistoryStore(tmp_path / "history.jsonl")
+    assert len(reopened) == 8 and reopened.get(7)["ts"] == 10
+    # Compaction merges the deltas into one saved index.
+    assert not (tmp_path / "history.wlog").exists()
+    assert json.loads((tmp_path / "history.words").read_text())["count"] == 8
+    assert reopened.search("jacket 10") == [7]
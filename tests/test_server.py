@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from promptzone_core import MemoryStorage, PromptZoneCore
+from promptzone_server import PromptZoneClient, make_server
+
+
+@pytest.fixture
+def client(tmp_path):
+    folders = {
+        "SLOT_1_CLOTHES": {f"p{i}.md": f"jacket {i}" for i in range(5)},
+        "SLOT_2_PLACES": {f"p{i}.md": f"beach {i}" for i in range(5)},
+    }
+    core = PromptZoneCore(tmp_path, background=False, storage=MemoryStorage(folders))
+    core.settings["slots"] = [
+        {"id": "a", "label": "A", "prefix": "SLOT_1_"},
+        {"id": "b", "label": "B", "prefix": "SLOT_2_"},
+    ]
+    srv = make_server(core, port=0)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield PromptZoneClient(port=srv.server_address[1])
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def test_generate_returns_batch_lists(client):
+    out = client.generate(n=3)
+    assert set(out) == {"n", "slots", "sources", "sets", "ms"}
+    assert out["n"] == 3
+    assert [len(out["slots"][sid]) for sid in ("a", "b")] == [3, 3]
+    assert all(src.startswith("SLOT_1_CLOTHES\\") for src in out["sources"]["a"])
+    assert out["sets"] == [f"{a}\n{b}" for a, b in zip(out["slots"]["a"], out["slots"]["b"])]
+    one = client.generate(slots=["b"], n=2)
+    assert list(one["slots"]) == ["b"] and len(one["sets"]) == 2
+
+
+@pytest.mark.parametrize("n", ["abc", 2.5, True, [3]])
+def test_invalid_n_is_rejected(client, n):
+    with pytest.raises(ValueError, match="n must be an integer"):
+        client.generate(n=n)
+
+
+def test_unknown_slot_is_rejected(client):
+    with pytest.raises(ValueError, match="Unknown slot: zz"):
+        client.generate(slots=["zz"])
+    with pytest.raises(ValueError, match="Unknown slot: zz"):
+        client.generate_slot("zz")
+
+
+def test_search_limit_is_clamped(client):
+    assert len(client.search("jacket", limit=2)) == 2
+    assert len(client.search("jacket", limit=10**9)) == 5
+
+
+def test_metrics_count_requests_per_route(client):
+    client.generate(n=1)
+    client.generate(n=1)
+    with pytest.raises(ValueError):
+        client.generate(n="abc")
+    client.health()
+    routes = client.metrics()["requests"]["routes"]
+    assert routes["/generate"]["count"] == 3
+    assert routes["/generate"]["errors"] == 1
+    assert routes["/health"]["count"] == 1
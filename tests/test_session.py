@@ -0,0 +1,30 @@
+import json
+
+from promptzone_session import SessionStore
+
+
+def test_set_flush_and_reload(tmp_path):
+    store = SessionStore(tmp_path / "session")
+    store.set("popup_geometry", {"a": "xyz"})
+    assert store.flush() == 1
+    assert store.flush() == 0
+    store.set("popup_geometry", {"a": "xyz"})
+    assert store.flush() == 0
+    assert SessionStore(tmp_path / "session").get("popup_geometry") == {"a": "xyz"}
+
+
+def test_migrate_moves_keys(tmp_path):
+    store = SessionStore(tmp_path / "session")
+    settings = {"n_sets": 3, "last_slot_texts": {"a": "x"}, "last_output_text": "big"}
+    assert store.migrate(settings)
+    assert settings == {"n_sets": 3}
+    assert json.loads((tmp_path / "session" / "last_slot_texts.json").read_text()) == {"a": "x"}
+
+
+def test_migrate_keeps_keys_when_unwritable(tmp_path):
+    # A file where the directory should be makes every write fail.
+    (tmp_path / "session").write_text("")
+    store = SessionStore(tmp_path / "session")
+    settings = {"n_sets": 3, "window_geometry_qt": "abc"}
+    assert not store.migrate(settings)
+    assert settings == {"n_sets": 3, "window_geometry_qt": "abc"}
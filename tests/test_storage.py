@@ -0,0 +1,40 @@
+from promptzone_core import FileSystemStorage, PackStorage, PromptZoneCore
+from promptzone_pack import export_pack
+
+
+def _library(root):
+    folders = {
+        "SLOT_1_CLOTHES": {"b.md": "blue hat", "A.txt": "red jacket", "blank.md": "  \n", "notes.json": "{}"},
+        "SLOT_2_PLACES": {"p1.md": "beach", "p2.md": "{forest|desert} at dusk"},
+        "EMPTY": {},
+    }
+    for folder, files in folders.items():
+        (root / folder).mkdir(parents=True)
+        for name, text in files.items():
+            (root / folder / name).write_text(text, encoding="utf-8")
+
+
+def _listing(storage):
+    out = {}
+    for folder in storage.list_folders():
+        entries = [(name, text, has_text) for name, text, has_text in storage.folder_entries(folder)]
+        out[folder] = {
+            "prompts": storage.list_prompts(folder),
+            "texts": storage.load_folder(folder),
+            "reads": [storage.read_text(folder, name) for name in storage.list_prompts(folder)],
+            "has_text": [has_text for _name, _text, has_text in entries],
+        }
+    return out
+
+
+def test_pack_matches_filesystem(tmp_path):
+    _library(tmp_path / "Prompt_Library")
+    core = PromptZoneCore(tmp_path, background=False)
+    pack = tmp_path / "library.pzpack"
+    export_pack(core, pack)
+    fs = FileSystemStorage(tmp_path / "Prompt_Library")
+    packed = PackStorage(pack)
+    assert packed.list_folders() == fs.list_folders()
+    assert _listing(packed) == _listing(fs)
+    assert _listing(fs)["SLOT_1_CLOTHES"]["prompts"] == ["A.txt", "b.md", "blank.md"]
+    assert _listing(fs)["SLOT_1_CLOTHES"]["has_text"] == [True, True, False]
@@ -0,0 +1,84 @@
+import random
+
+from promptzone_template import MAX_TEMPLATE_DEPTH, Choice, Ref, compile_template, expand
+
+
+def _expand(text, categories=None, seed=0):
+    categories = categories or {}
+
+    def resolve(name, rng):
+        if name not in categories:
+            return None
+        picked = rng.choice(categories[name])
+        return picked, compile_template(picked)
+
+    nodes = compile_template(text)
+    return text if nodes is None else expand(nodes, random.Random(seed), resolve)
+
+
+def test_plain_text_is_not_compiled():
+    assert compile_template("a red jacket") is None
+    assert compile_template("{no alternatives}") is None
+    assert compile_template("snake__case") is None
+
+
+def test_escapes_alone_are_not_a_template():
+    assert compile_template(r"\{a\|b\}") is None
+    assert compile_template(r"50\% off \{sale\}") is None
+
+
+def test_choice_picks_one_alternative():
+    seen = {_expand("a {red|blue} jacket", seed=s) for s in range(50)}
+    assert seen == {"a red jacket", "a blue jacket"}
+
+
+def test_nested_choices():
+    nodes = compile_template("{a|{b|c}}")
+    assert len(nodes) == 1 and isinstance(nodes[0], Choice)
+    assert {_expand("{a|{b|c}}", seed=s) for s in range(100)} == {"a", "b", "c"}
+
+
+def test_empty_alternative():
+    assert {_expand("x{|y}", seed=s) for s in range(50)} == {"x", "xy"}
+
+
+def test_escapes_are_literal():
+    assert _expand(r"\{a\|b\} {c|c}") == "{a|b} c"
+    assert _expand(r"{x\|y|z}", seed=0) in ("x|y", "z")
+
+
+def test_unbalanced_braces_stay_literal():
+    assert _expand("open { brace") == "open { brace"
+    assert _expand("close } brace") == "close } brace"
+    assert _expand("{a|b") == "{a|b"
+    assert _expand("{just text} {a|a}") == "{just text} a"
+
+
+def test_reference_resolves_and_expands():
+    nodes = compile_template("wear __CLOTHES_TOPS__")
+    assert isinstance(nodes[-1], Ref) and nodes[-1].name == "CLOTHES_TOPS"
+    out = _expand("wear __CLOTHES_TOPS__", {"CLOTHES_TOPS": ["a {red|red} shirt"]})
+    assert out == "wear a red shirt"
+
+
+def test_unknown_reference_stays_literal():
+    assert _expand("wear __NOPE__") == "wear __NOPE__"
+
+
+def test_cycle_is_left_literal():
+    categories = {"LOOP": ["again __LOOP__"]}
+    nodes = compile_template("__LOOP__")
+
+    def resolve(name, rng):
+        return categories[name][0], compile_template(categories[name][0])
+
+    assert expand(nodes, random.Random(0), resolve, ("LOOP",)) == "__LOOP__"
+    assert _expand("__LOOP__", categories) == "again __LOOP__"
+
+
+def test_depth_limit_is_left_literal():
+    depth = MAX_TEMPLATE_DEPTH + 3
+    categories = {f"C{i}": [f"{i} __C{i + 1}__"] for i in range(depth)}
+    out = _expand("__C0__", categories)
+    expanded = " ".join(str(i) for i in range(MAX_TEMPLATE_DEPTH + 1))
+    assert out == f"{expanded} __C{MAX_TEMPLATE_DEPTH + 1}__"